@@ -1,5 +1,18 @@
 import pandas as pd
+import numpy as np
 import os
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import run_cache
+import group_store
+import string_ids
+import instrumentation as perf
+import database as db
+from sparse_matrix import SparseMatrix
+from correlation import CorrelationStats
+import protein_rollup as pr
+from cancellation import AnalysisCancelled
 
 # --- AGGREGATION STRATEGIES ---
 # Here we define how each metric should be processed.
@@ -29,134 +42,710 @@ AGGREGATION_STRATEGIES = {
     # 'Associated Proteins' removed as it is now a permanent column
 }
 
+# --- COLUMN CANDIDATES ---
+# Possible names for the peptide and protein columns in the TSV files.
+# The order matters: the first one found will be used.
+PEPTIDE_COLUMN_CANDIDATES = [
+    'peptide',      # El nombre que el usuario ha indicado que aparece
+    'Sequence',
+    'sequence',
+    'Peptide_Sequence',
+    'peptide_sequence',
+    'Peptide Sequence',
+    'Peptide ID',   # Un nombre común adicional
+    'PeptideID',
+    'Accession'     # Otro nombre común en algunos formatos
+]
+
+PROTEIN_COLUMN_CANDIDATES = [
+    'Proteins', 'proteins',
+    'Protein', 'protein',
+    'Leading Proteins', 'Leading proteins',
+    'Leading razor protein',
+    'Protein Group', 'Protein group'
+]
+
+# --- LFQ.TSV SCHEMA ---
+# Explicit dtypes for the columns of the lfq.tsv layout
+# (peptide, charge, proteins, q_value, score, spectral_angle, per-run intensity).
+# Peptide and protein strings repeat a lot, so they are loaded as categoricals.
+LFQ_COLUMN_DTYPES = {
+    'charge': 'int8',
+    'q_value': 'float32',
+    'peptide_q-value': 'float32',
+    'score': 'float32',
+    'spectral_angle': 'float32',
+}
+
+def find_column(df, candidates):
+    """Returns the first candidate column present in the DataFrame (or list of column names), or None."""
+    for col in candidates:
+        if col in df:
+            return col
+    return None
+
+def find_peptide_column(df, peptide_column):
+    """
+    Finds the peptide column of a TSV DataFrame (or list of column names).
+    Tries the default name first, then the known candidates and finally the first column.
+    """
+    actual_peptide_column = find_column(df, [peptide_column] + PEPTIDE_COLUMN_CANDIDATES)
+
+    # If no known name was found, we try to use the first column
+    if not actual_peptide_column and len(df) > 0:
+        actual_peptide_column = list(df)[0]
+
+    return actual_peptide_column
+
+def lfq_dtypes(header, peptide_column='Peptide'):
+    """Returns the explicit dtype of every known column of a TSV file, given its header."""
+    dtypes = {col: dtype for col, dtype in LFQ_COLUMN_DTYPES.items() if col in header}
+    for col in [find_peptide_column(header, peptide_column), find_column(header, PROTEIN_COLUMN_CANDIDATES)]:
+        if col:
+            dtypes[col] = 'category'
+    if header:
+        dtypes[header[-1]] = 'float32' # La intensidad es siempre la última columna
+    return dtypes
+
+def load_tsv(file_path, peptide_column):
+    """
+    Reads a TSV file once and resolves the columns needed by the analysis.
+    Only the peptide, protein, intensity and metric columns are loaded.
+
+    Returns a tuple (df, columns), where 'columns' is a dictionary with the
+    resolved 'peptide', 'protein' and 'intensity' column names ('protein' may be None).
+    """
+    header = run_cache.read_header(file_path)
+
+    actual_peptide_column = find_peptide_column(header, peptide_column)
+    if not actual_peptide_column: # If still not found, or the file was empty
+        tried = [peptide_column] + PEPTIDE_COLUMN_CANDIDATES
+        raise ValueError(f"Could not find a valid peptide column (tried: {', '.join(tried)} and the first column) in {os.path.basename(file_path)}. Available columns: {', '.join(header)}")
+
+    columns = {
+        'peptide': actual_peptide_column,
+        'protein': find_column(header, PROTEIN_COLUMN_CANDIDATES),
+        'intensity': header[-1], # La intensidad es siempre la última columna
+    }
+    usecols = set(columns.values())
+    for strategy in AGGREGATION_STRATEGIES.values():
+        usecols.add(find_column(header, [col for col in strategy['columns'] if col]))
+    usecols.discard(None)
+
+    df = run_cache.read_tsv(file_path, usecols=usecols, dtype=lfq_dtypes(header, peptide_column))
+    return df, columns
+
+def get_peptide_protein_pairs(df, peptide_column):
+    """
+    Extracts the unique (peptide, protein) pairs of a TSV DataFrame.
+    Returns a DataFrame with 'peptide' and 'protein' columns (empty if there is no protein column).
+    """
+    protein_col = find_column(df, PROTEIN_COLUMN_CANDIDATES)
+    if not protein_col:
+        return pd.DataFrame(columns=['peptide', 'protein'])
+
+    # We drop NA values to avoid issues
+    pairs = df[[peptide_column, protein_col]].dropna().drop_duplicates()
+    pairs.columns = ['peptide', 'protein']
+    return pairs
+
+def build_peptide_protein_map(pairs):
+    """
+    Builds a Series mapping each peptide to its associated proteins from a DataFrame
+    of (peptide, protein) pairs, possibly coming from many files.
+
+    A peptide might map to multiple proteins (or the same protein string repeated),
+    so protein strings are split by semicolon, deduplicated and joined back sorted.
+    Everything is vectorized: there is no Python loop or apply per peptide.
+    """
+    pairs = pairs.dropna().drop_duplicates()
+    if pairs.empty:
+        return pd.Series(dtype=object)
+
+    exploded = pairs.assign(protein=pairs['protein'].astype(str).str.split(';')).explode('protein')
+    exploded = exploded.drop_duplicates().sort_values(['peptide', 'protein'])
+
+    # Concatenating 'protein;' strings per peptide is much faster than a groupby join
+    joined = (exploded['protein'] + ';').groupby(exploded['peptide'], sort=False).sum()
+    return joined.str[:-1]
+
 def get_peptide_protein_map(df, peptide_column):
     """
     Extracts a dictionary mapping peptides to their associated proteins.
     Handles multiple protein columns candidates.
     """
-    protein_candidates = [
-        'Proteins', 'proteins', 
-        'Protein', 'protein',
-        'Leading Proteins', 'Leading proteins', 
-        'Leading razor protein', 
-        'Protein Group', 'Protein group'
-    ]
-    
-    protein_col = None
-    for col in protein_candidates:
-        if col in df.columns:
-            protein_col = col
-            break
-            
-    if not protein_col:
-        return {}
-        
-    # Extract unique pairs of (peptide, protein)
-    # We drop NA values to avoid issues
-    subset = df[[peptide_column, protein_col]].dropna()
-    
-    # We want to aggregate proteins for each peptide. 
-    # A peptide might map to multiple proteins (or the same protein string repeated).
-    # We use our existing logic to join them with ';'.
-    
-    # Group by peptide and apply the aggregation
-    # We assume 'aggregate_protein_strings' logic is suitable here
-    # (splitting by semicolon, finding uniques, joining back)
-    
-    # However, for efficiency in a single file, we can just take the value if it's consistent,
-    # or aggregate if it differs.
-    
-    # Let's use the robust aggregation to be safe:
-    return subset.groupby(peptide_column)[protein_col].apply(aggregate_protein_strings).to_dict()
+    return build_peptide_protein_map(get_peptide_protein_pairs(df, peptide_column)).to_dict()
+
+def aggregate_metric(df, columns, metric_column, file_path):
+    """
+    Aggregates an already loaded TSV DataFrame by peptide according to the metric.
+    Returns a DataFrame indexed by peptide with a single column named after the file.
+    """
+    actual_peptide_column = columns['peptide']
+
+    if metric_column not in AGGREGATION_STRATEGIES:
+        raise ValueError(f"Unknown metric: '{metric_column}'. Valid metrics are: {', '.join(AGGREGATION_STRATEGIES.keys())}")
+
+    strategy = AGGREGATION_STRATEGIES[metric_column]
+    agg_func = strategy['agg_func']
+
+    # --- Aggregation Logic based on Strategies ---
+    if metric_column == 'Count':
+        agg_df = df.groupby(actual_peptide_column, observed=True).size().reset_index(name=metric_column)
+    elif metric_column == 'Total Intensity':
+        metric_col_name = columns['intensity']
+        values = pd.to_numeric(df[metric_col_name], errors='coerce').fillna(0)
+        agg_df = values.groupby(df[actual_peptide_column], observed=True).agg(agg_func).reset_index()
+        agg_df = agg_df.rename(columns={metric_col_name: metric_column})
+    else:
+        # Find the correct metric column in the file
+        metric_col_name = find_column(df, strategy['columns'])
+        if not metric_col_name:
+            raise ValueError(f"For metric '{metric_column}', none of the expected columns ({', '.join(strategy['columns'])}) were found in {os.path.basename(file_path)}.")
+
+        values = df[metric_col_name]
+        # For non-text aggregation functions, convert to numeric
+        if isinstance(agg_func, str) and agg_func in ['sum', 'mean', 'max', 'min']:
+            values = pd.to_numeric(values, errors='coerce').fillna(0)
+
+        # Apply the aggregation function
+        agg_df = values.groupby(df[actual_peptide_column], observed=True).agg(agg_func).reset_index()
+
+    # Rename the results column with the file name (without extension)
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    agg_df = agg_df.rename(columns={agg_df.columns[1]: file_name})
+
+    return agg_df.set_index(actual_peptide_column)
 
 def process_single_tsv(file_path, peptide_column, metric_column):
     """
     Processes a single TSV file to aggregate data according to the metric.
     """
     try:
-        df = pd.read_csv(file_path, sep='\t')
-
-        # --- MODIFICATION: Flexible and robust search for the peptide column ---
-        # List of possible names for the peptide column.
-        # The order matters: the first one found will be used.
-        # We add 'peptide' (lowercase) which the user indicated appears.
-        candidate_peptide_columns = [
-            peptide_column, # The default name ('Peptide' from main.py)
-            'peptide',      # El nombre que el usuario ha indicado que aparece
-            'Sequence',
-            'sequence',
-            'Peptide_Sequence',
-            'peptide_sequence',
-            'Peptide Sequence',
-            'Peptide ID',   # Un nombre común adicional
-            'PeptideID',
-            'Accession'     # Otro nombre común en algunos formatos
-        ]
-        
-        actual_peptide_column = None
-        for col_name in candidate_peptide_columns:
-            if col_name in df.columns:
-                actual_peptide_column = col_name
-                break
-        
-        # If no known name was found, we try to use the first column
-        if not actual_peptide_column and len(df.columns) > 0:
-            actual_peptide_column = df.columns[0]
-            # Optional: you could add a warning message here if you want to notify the user
-            # that the first column was used by default.
-        
-        if not actual_peptide_column: # If still not found, or the file was empty
-            raise ValueError(f"Could not find a valid peptide column (tried: {', '.join(candidate_peptide_columns)} and the first column) in {os.path.basename(file_path)}. Available columns: {', '.join(df.columns)}")
-        # --- FIN MODIFICACIÓN ---
-
-        if metric_column not in AGGREGATION_STRATEGIES:
-            raise ValueError(f"Unknown metric: '{metric_column}'. Valid metrics are: {', '.join(AGGREGATION_STRATEGIES.keys())}")
-
-        strategy = AGGREGATION_STRATEGIES[metric_column]
-        agg_func = strategy['agg_func']
-
-        # --- Aggregation Logic based on Strategies ---
-        if metric_column == 'Count':
-            agg_df = df.groupby(actual_peptide_column).size().reset_index(name=metric_column)
-        elif metric_column == 'Total Intensity':
-            metric_col_name = df.columns[-1] # La intensidad es siempre la última columna
-            df[metric_col_name] = pd.to_numeric(df[metric_col_name], errors='coerce').fillna(0)
-            agg_df = df.groupby(actual_peptide_column)[metric_col_name].agg(agg_func).reset_index()
-            agg_df = agg_df.rename(columns={metric_col_name: metric_column})
+        df, columns = load_tsv(file_path, peptide_column)
+        return aggregate_metric(df, columns, metric_column, file_path)
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        raise # Re-throw the exception so app.py can catch it and show a messagebox
+
+# Source of every metric, named like the columns of the group store (see group_store.COLUMNS);
+# 'Count' needs none
+METRIC_SOURCES = {
+    'Total Intensity': 'intensity',
+    'Average Score': 'score',
+    'Best Score': 'score',
+    'Best q-value': 'q_value',
+    'Average Angle': 'spectral_angle',
+    'Best Angle': 'spectral_angle',
+    'Charge States': 'charge',
+}
+
+def _charge_states(masks):
+    """Text of every bitmask of charges (bit c set: charge c was found), e.g. 0b1100 -> '2, 3'."""
+    uniques, inverse = np.unique(masks, return_inverse=True)
+    texts = np.array([', '.join(str(c) for c in range(64) if int(mask) >> c & 1) for mask in uniques], dtype=object)
+    return texts[inverse]
+
+def _reduce_metrics(codes, sources):
+    """
+    Aggregates every metric of METRIC_SOURCES by peptide code (rows with code -1 are skipped).
+    'sources' maps each source column to its values (float32 with NaN, or -1 for a missing
+    charge), or to None when the file does not have it.
+    Returns the sorted codes found and a dictionary with the values of the metrics found.
+    Sums and means are accumulated in float64 and returned as float32; the parsed files
+    and the group store both go through here, so they give the same bits.
+    """
+    rows = np.flatnonzero(codes >= 0)
+    order = rows[np.argsort(codes[rows], kind='stable')]
+    codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.zeros(0, dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(codes)])
+
+    metrics = {'Count': counts.astype(np.float32)}
+    for metric, column in METRIC_SOURCES.items():
+        if sources.get(column) is None:
+            continue
+        agg_func = AGGREGATION_STRATEGIES[metric]['agg_func']
+        if not len(codes):
+            metrics[metric] = np.zeros(0, dtype=object if agg_func is aggregate_unique_strings else np.float32)
+            continue
+        values = np.asarray(sources[column])[order]
+        if agg_func is aggregate_unique_strings: # Charge states
+            bits = np.where(values >= 0, np.left_shift(1, np.where(values >= 0, values, 0).astype(np.int64)), 0)
+            metrics[metric] = _charge_states(np.bitwise_or.reduceat(bits, starts))
+            continue
+        values = np.nan_to_num(values.astype(np.float32), nan=0.0) # Los valores que faltan cuentan como 0
+        if agg_func == 'sum':
+            result = np.add.reduceat(values.astype(np.float64), starts)
+        elif agg_func == 'mean':
+            result = np.add.reduceat(values.astype(np.float64), starts) / counts
+        elif agg_func == 'max':
+            result = np.maximum.reduceat(values, starts)
+        else:
+            result = np.minimum.reduceat(values, starts)
+        metrics[metric] = result.astype(np.float32)
+    return codes[starts], metrics
+
+def aggregate_all_metrics(df, columns):
+    """
+    Aggregates every metric in AGGREGATION_STRATEGIES for an already loaded TSV
+    DataFrame in a single sorted pass (see _reduce_metrics).
+    Returns a DataFrame indexed by peptide with one column per metric (float32 for the
+    numeric metrics). Metrics whose source column does not exist in the file are left out.
+    """
+    keys = df[columns['peptide']].astype('category')
+    sources = {}
+    for metric, column in METRIC_SOURCES.items():
+        if column in sources:
+            continue
+        if column == 'intensity':
+            source = columns['intensity']
         else:
-            # Find the correct metric column in the file
-            metric_col_name = None
-            for col in strategy['columns']:
-                if col in df.columns:
-                    metric_col_name = col
-                    break
-            
-            if not metric_col_name:
-                raise ValueError(f"For metric '{metric_column}', none of the expected columns ({', '.join(strategy['columns'])}) were found in {os.path.basename(file_path)}.")
-
-            # For non-text aggregation functions, convert to numeric
-            if isinstance(agg_func, str) and agg_func in ['sum', 'mean', 'max', 'min']:
-                df[metric_col_name] = pd.to_numeric(df[metric_col_name], errors='coerce').fillna(0)
-
-            # Apply the aggregation function
-            agg_df = df.groupby(actual_peptide_column)[metric_col_name].agg(agg_func).reset_index()
-            
-            # Rename the result column to match the selected metric
-            if metric_col_name != metric_column:
-                agg_df = agg_df.rename(columns={metric_col_name: metric_column})
-
-        # Rename the results column with the file name (without extension)
-        file_name = os.path.splitext(os.path.basename(file_path))[0]
-        agg_df = agg_df.rename(columns={agg_df.columns[1]: file_name})
-        
-        return agg_df.set_index(actual_peptide_column)
+            source = find_column(df, [col for col in AGGREGATION_STRATEGIES[metric]['columns'] if col])
+        sources[column] = pd.to_numeric(df[source], errors='coerce').to_numpy(dtype=np.float32) if source else None
+
+    found, metrics = _reduce_metrics(keys.cat.codes.to_numpy(), sources)
+    # The peptides of a single file don't need to stay categorical
+    index = pd.Index(keys.cat.categories[found].astype(str), name=columns['peptide'])
+    # Keep the order of AGGREGATION_STRATEGIES
+    return pd.DataFrame({metric: metrics[metric] for metric in AGGREGATION_STRATEGIES if metric in metrics}, index=index)
+
+# --- PARALLEL EXECUTION ---
+# Each file is independent until the final concat, so the per-file work can be
+# spread over a process pool. It is opt-in: with max_workers=None (or 1) files
+# are processed serially in this process.
+# Long operations accept a progress_callback(done, total), called after every file,
+# and a cancel_event (threading.Event) that stops reading the remaining files.
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise AnalysisCancelled("The analysis was cancelled.")
+
+def _init_worker(cache_dir):
+    """Runs in every worker process, which does not inherit the settings made by main.py."""
+    run_cache.CACHE_DIR = cache_dir
+
+def _timed_call(func, file, *args):
+    """Returns func(file, *args) and the seconds it took (measured in the worker process)."""
+    start = time.perf_counter()
+    result = func(file, *args)
+    return result, time.perf_counter() - start
+
+def map_files(func, tsv_files, *args, max_workers=None, progress_callback=None, cancel_event=None):
+    """
+    Applies func(file, *args) to every file and returns the results in input order.
+    Uses a process pool when max_workers is greater than 1.
+    The time of every file is recorded in the current performance operation.
+    """
+    total = len(tsv_files)
+
+    if not max_workers or max_workers <= 1 or total < 2:
+        results = []
+        for done, file in enumerate(tsv_files, start=1):
+            _check_cancelled(cancel_event)
+            result, seconds = _timed_call(func, file, *args)
+            perf.record_file(file, seconds)
+            results.append(result)
+            if progress_callback:
+                progress_callback(done, total)
+        return results
+
+    results = [None] * total
+    executor = ProcessPoolExecutor(max_workers=min(max_workers, total), initializer=_init_worker, initargs=(run_cache.CACHE_DIR,))
+    try:
+        futures = {executor.submit(_timed_call, func, file, *args): i for i, file in enumerate(tsv_files)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            # Results are stored by input position, so the merge is deterministic
+            i = futures[future]
+            results[i], seconds = future.result()
+            perf.record_file(tsv_files[i], seconds)
+            if progress_callback:
+                progress_callback(done, total)
+            _check_cancelled(cancel_event)
+    finally:
+        # On errors or cancellation, the files still pending are never read
+        executor.shutdown(wait=True, cancel_futures=True)
+    return results
+
+# --- IN-MEMORY GROUP CACHE ---
+# Every metric of every run in a group is aggregated once and kept here, so changing
+# the metric in the interface only rebuilds the table from the cached values.
+# The metrics are kept in long format (one row per peptide and run, int32 peptide IDs
+# (see string_ids), categorical run keys and float32 values): unlike a dense peptide x run
+# table for every metric, its size only grows with the peptides actually found in each run.
+# The peptide strings are only looked up to build the tables.
+# Groups are kept up to date incrementally: when a file is added, deleted or modified
+# (path, mtime or size) only that file is parsed, and its rows are appended to or
+# dropped from the cached table. With a cache folder the parsed runs are also kept in
+# the group store (see group_store), and the new runs are aggregated from its mapped
+# columns, so opening a group after a restart does not parse any file.
+MAX_CACHED_GROUPS = 4
+_group_cache = {}
+
+def clear_group_cache():
+    """Forgets every cached group."""
+    _group_cache.clear()
+    _protein_cache.clear()
+
+def load_run_metrics(file_path, default_peptide_column='Peptide'):
+    """
+    Loads a TSV file once and returns a tuple (metrics_df, protein_pairs) with every
+    metric aggregated by peptide and the unique (peptide, protein) pairs of the file.
+    """
+    try:
+        df, columns = load_tsv(file_path, default_peptide_column)
+        metrics_df = aggregate_all_metrics(df, columns)
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        raise # Re-throw the exception so app.py can catch it and show a messagebox
+
+    try:
+        protein_pairs = get_peptide_protein_pairs(df, columns['peptide'])
+    except Exception as e:
+        print(f"Warning: Could not extract protein mapping from {file_path}: {e}")
+        protein_pairs = pd.DataFrame(columns=['peptide', 'protein'])
+    return metrics_df, protein_pairs
+
+def load_run_columns(file_path, default_peptide_column='Peptide'):
+    """
+    Reads the columns of a TSV file kept in the group store: 'peptide' and 'proteins'
+    (categoricals) and the 'charge', 'intensity', 'score', 'q_value' and 'spectral_angle'
+    values, or None for the columns the file does not have. 'index_name' is the name of
+    its peptide column.
+    """
+    try:
+        header = run_cache.read_header(file_path)
+        peptide_column = find_peptide_column(header, default_peptide_column)
+        if not peptide_column:
+            raise ValueError(f"Could not find a valid peptide column in {os.path.basename(file_path)}.")
+
+        sources = {
+            'peptide': peptide_column,
+            'proteins': find_column(header, PROTEIN_COLUMN_CANDIDATES),
+            'intensity': header[-1], # La intensidad es siempre la última columna
+        }
+        for metric, column in METRIC_SOURCES.items():
+            if column not in sources:
+                sources[column] = find_column(header, [col for col in AGGREGATION_STRATEGIES[metric]['columns'] if col])
+
+        df = run_cache.read_tsv(file_path, usecols={col for col in sources.values() if col},
+                                dtype=lfq_dtypes(header, default_peptide_column))
+        result = {'index_name': peptide_column}
+        for column, source in sources.items():
+            if source is None:
+                result[column] = None
+            elif column in group_store.ID_COLUMNS:
+                result[column] = df[source].astype('category').array
+            else:
+                result[column] = pd.to_numeric(df[source], errors='coerce').to_numpy(dtype=np.float32)
+        return result
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
-        raise # Re-throw the exception so main.py can catch it and show a messagebox
+        raise
 
-def process_tsv_files(tsv_files, column_names, default_peptide_column='Peptide', metric_column='Conteo'):
+@contextmanager
+def open_group_store(tsv_files, signatures, peptide_column='Peptide', max_workers=None, progress_callback=None,
+                     cancel_event=None):
+    """
+    Yields the group store of the folder of the files (see group_store), locked and with
+    every run of 'signatures' in it: only the files missing from the store are parsed.
+    """
+    store = group_store.open_store(run_cache.CACHE_DIR, os.path.dirname(os.path.abspath(tsv_files[0])), peptide_column)
+    with store.lock:
+        store.refresh() # Runs added by other processes are not parsed again
+        missing = store.missing(signatures)
+        with perf.span("read files", files=len(missing)):
+            results = map_files(load_run_columns, [tsv_files[i] for i in missing], peptide_column, max_workers=max_workers,
+                                progress_callback=progress_callback, cancel_event=cancel_event)
+        with perf.span("update store", runs=len(missing)):
+            store.update(signatures, zip([signatures[i] for i in missing], results))
+        yield store
+
+def _empty_pairs():
+    return pd.DataFrame({'peptide': np.zeros(0, dtype=np.int32), 'protein': np.zeros(0, dtype=np.int32),
+                         'run': pd.Categorical([])})
+
+def _is_text_metric(metric_column):
+    """Text metrics (like 'Charge States') are joined strings instead of numbers."""
+    strategy = AGGREGATION_STRATEGIES.get(metric_column)
+    return bool(strategy) and strategy['agg_func'] in [aggregate_unique_strings, aggregate_protein_strings]
+
+def _protein_map(pairs):
+    """build_peptide_protein_map() of (peptide ID, protein ID) pairs: the proteins of every peptide ID."""
+    pairs = pairs.drop_duplicates()
+    return build_peptide_protein_map(pd.DataFrame({
+        'peptide': pairs['peptide'].to_numpy(),
+        'protein': string_ids.labels('proteins', pairs['protein'].to_numpy()),
+    }))
+
+def _table_rows(long):
+    """
+    The peptide IDs of a long table in the order of the rows of its tables (sorted by
+    sequence) and their strings. The strings are only needed for the tables.
+    """
+    ids = np.unique(long['peptide'].to_numpy()) if long is not None else np.zeros(0, dtype=np.int32)
+    labels = string_ids.labels('peptides', ids)
+    order = np.argsort(labels, kind='stable')
+    return ids[order], pd.Index(labels[order], dtype=str)
+
+def _long_run_frame(metrics, peptide_ids, run_name, column_names):
+    """Converts the metrics of one run (and the IDs of its peptides) to the long format of the group cache."""
+    size = len(peptide_ids)
+    frame = {
+        'peptide': peptide_ids,
+        'run': pd.Categorical.from_codes(np.full(size, column_names.index(run_name), dtype=np.int32), categories=column_names),
+    }
+    for metric in AGGREGATION_STRATEGIES:
+        if _is_text_metric(metric):
+            if metric in metrics:
+                frame[metric] = pd.Categorical(np.asarray(metrics[metric]).astype(str))
+            else:
+                frame[metric] = pd.Categorical.from_codes(np.full(size, -1, dtype=np.int8), categories=pd.Index([], dtype=str))
+        else:
+            values = metrics[metric] if metric in metrics else np.nan
+            frame[metric] = np.full(size, values, dtype=np.float32) if np.isscalar(values) else np.asarray(values, dtype=np.float32)
+    return pd.DataFrame(frame)
+
+def _concat_long(frames, column_names):
+    """
+    Concatenates long frames column by column. Categorical columns are merged with
+    union_categoricals (sorted categories), so their codes stay compact.
+    """
+    result = {}
+    for col in frames[0].columns:
+        parts = [frame[col] for frame in frames]
+        if col == 'run':
+            codes = [part.cat.set_categories(column_names).cat.codes.to_numpy() for part in parts]
+            result[col] = pd.Categorical.from_codes(np.concatenate(codes), categories=column_names)
+        elif isinstance(parts[0].dtype, pd.CategoricalDtype):
+            merged = pd.api.types.union_categoricals(parts, sort_categories=True, ignore_order=True)
+            result[col] = merged.remove_unused_categories()
+        else:
+            result[col] = np.concatenate([part.to_numpy() for part in parts])
+    return pd.DataFrame(result)
+
+def get_group_data(tsv_files, column_names, default_peptide_column='Peptide', max_workers=None,
+                   progress_callback=None, cancel_event=None, signatures=None):
+    """
+    Returns the cached aggregation of a group of TSV files, building or updating it if needed.
+    With max_workers > 1 the new files are parsed and aggregated in a process pool.
+    'signatures' (e.g. from the metadata index) avoids calling os.stat on every file.
+
+    The group is identified by the folder of its files. Compared with the cached state,
+    only the added (or modified) files are aggregated: their rows are appended and the
+    index is extended. Deleted files have their rows dropped, and the peptides no
+    longer present in any run are pruned. Only the proteins of the affected peptides are merged again.
+    With a cache folder (run_cache.CACHE_DIR) the added runs are aggregated from the group
+    store, where only the files it does not have yet are parsed.
+
+    The result is a dictionary with the 'files' and 'column_names' of the group and:
+      - 'long': DataFrame with one row per (peptide ID, run) and one column per metric.
+      - 'peptides': the peptide IDs in the order of the table rows and their strings.
+      - 'available': the metrics found in each run.
+      - 'index_name': the name of the peptide column.
+      - 'proteins': Series mapping each peptide ID to its proteins.
+      - 'pairs': the unique (peptide ID, protein ID, run) of every run.
+    """
+    key = (os.path.dirname(os.path.abspath(tsv_files[0])), default_peptide_column, run_cache.CACHE_DIR)
+    if signatures is None:
+        signatures = [run_cache.file_signature(f) for f in tsv_files]
+    runs = [(os.path.abspath(f), name, signature) for f, name, signature in zip(tsv_files, column_names, signatures)]
+
+    group = _group_cache.pop(key, None)
+    if group is None:
+        group = {'runs': [], 'long': None, 'available': {}, 'index_name': None,
+                 'proteins': pd.Series(dtype=object), 'pairs': _empty_pairs()}
+
+    if group['runs'] != runs:
+        current_runs = set(group['runs'])
+        added = [i for i, run in enumerate(runs) if run not in current_runs]
+        # Aggregate only the new runs (nothing is modified until all of them are loaded)
+        if run_cache.CACHE_DIR is not None:
+            with open_group_store(tsv_files, signatures, default_peptide_column, max_workers,
+                                  progress_callback, cancel_event) as store:
+                with perf.span("aggregate runs", runs=len(added)):
+                    run_results = [_store_run_metrics(store, signatures[i]) for i in added]
+        else:
+            with perf.span("read files", files=len(added)):
+                run_results = _parse_run_metrics([tsv_files[i] for i in added], default_peptide_column,
+                                                 max_workers, progress_callback, cancel_event)
+        group = _update_group(group, tsv_files, column_names, runs, added, run_results)
+
+    # The most recently used group goes last; the oldest ones are dropped first
+    _group_cache[key] = group
+    while len(_group_cache) > MAX_CACHED_GROUPS:
+        _group_cache.pop(next(iter(_group_cache)))
+    return group
+
+def _parse_run_metrics(tsv_files, default_peptide_column, max_workers, progress_callback, cancel_event):
+    """
+    Parses and aggregates TSV files with load_run_metrics(). Returns, for every file, its
+    peptide IDs, a dictionary with its metrics, its (peptide ID, protein ID) pairs and the
+    name of its peptide column, like _store_run_metrics().
+    """
+    results = map_files(load_run_metrics, tsv_files, default_peptide_column, max_workers=max_workers,
+                        progress_callback=progress_callback, cancel_event=cancel_event)
+    if not results:
+        return []
+    # The strings of all the files are turned into IDs at once
+    peptide_ids = string_ids.ids('peptides', np.concatenate(
+        [metrics_df.index.to_numpy(dtype=object) for metrics_df, _ in results]))
+    bounds = np.cumsum([0] + [len(metrics_df) for metrics_df, _ in results])
+    pairs = pd.concat([run_pairs for _, run_pairs in results], ignore_index=True)
+    pair_ids = pd.DataFrame({
+        'peptide': string_ids.ids('peptides', pairs['peptide']),
+        'protein': string_ids.ids('proteins', pairs['protein']),
+    })
+    pair_bounds = np.cumsum([0] + [len(run_pairs) for _, run_pairs in results])
+    return [(peptide_ids[bounds[i]:bounds[i + 1]],
+             {metric: metrics_df[metric].to_numpy() for metric in metrics_df.columns},
+             pair_ids.iloc[pair_bounds[i]:pair_bounds[i + 1]],
+             metrics_df.index.name)
+            for i, (metrics_df, _) in enumerate(results)]
+
+def _store_run_metrics(store, signature):
+    """
+    Aggregates every metric of one run of the group store by peptide, like aggregate_all_metrics().
+    Returns the same tuple as _parse_run_metrics() for the run.
+    """
+    peptides = store.column('peptide', signature)
+    sources = {column: store.column(column, signature) if store.has_column(column, signature) else None
+               for column in set(METRIC_SOURCES.values())}
+    peptide_ids, metrics = _reduce_metrics(peptides, sources)
+
+    lists = store.column('proteins', signature)
+    keep = (peptides >= 0) & (lists >= 0)
+    size = max(len(string_ids.dictionary('proteins')), 1)
+    pair_peptides, pair_proteins = np.divmod(np.unique(peptides[keep].astype(np.int64) * size + lists[keep]), size)
+    pairs = pd.DataFrame({'peptide': pair_peptides.astype(np.int32), 'protein': pair_proteins.astype(np.int32)})
+    return peptide_ids, metrics, pairs, store.runs[tuple(signature)]['index_name']
+
+def _update_group(group, tsv_files, column_names, runs, added, run_results):
+    """
+    Applies the deleted runs and the added runs (positions 'added' of 'runs', aggregated
+    in 'run_results') to a cached group and returns the new group.
+    """
+    wanted_runs = set(runs)
+    removed_names = [name for path, name, signature in group['runs'] if (path, name, signature) not in wanted_runs]
+
+    column_names = list(column_names)
+    long = group['long']
+    available = dict(group['available'])
+    pairs = group['pairs']
+    affected_peptides = []
+
+    # --- Deleted runs: drop their rows (their peptides absent everywhere go with them) ---
+    if removed_names:
+        long = long[~long['run'].isin(removed_names)]
+        for name in removed_names:
+            available.pop(name, None)
+        removed_mask = pairs['run'].isin(removed_names)
+        affected_peptides.append(pairs.loc[removed_mask, 'peptide'])
+        pairs = pairs[~removed_mask]
+
+    # --- Added runs: append their rows ---
+    frames = [] if long is None or long.empty else [long]
+    index_names = set() if group['index_name'] is None or not frames else {group['index_name']}
+    if added:
+        new_names = [column_names[i] for i in added]
+        for name, (peptide_ids, metrics, _, index_name) in zip(new_names, run_results):
+            frames.append(_long_run_frame(metrics, peptide_ids, name, column_names))
+            available[name] = frozenset(metrics)
+            index_names.add(index_name)
+
+        new_pairs = [run_pairs.assign(run=name) for name, (_, _, run_pairs, _) in zip(new_names, run_results)
+                     if not run_pairs.empty]
+        if new_pairs:
+            new_pairs = pd.concat(new_pairs, ignore_index=True)
+            affected_peptides.append(new_pairs['peptide'])
+            pairs = pd.concat([pairs, new_pairs], ignore_index=True)
+            pairs['run'] = pairs['run'].astype('category')
+
+    # The runs follow the order of the files, so the result does not depend on the order
+    # in which runs were added
+    if frames:
+        with perf.span("concat runs", runs=len(frames)):
+            long = _concat_long(frames, column_names)
+
+    # --- Master map for Peptide -> Protein ---
+    # Only the peptides of the changed runs are merged again, in a single vectorized pass.
+    # If a peptide appears in multiple files with different proteins (unlikely but possible),
+    # the proteins are combined.
+    proteins = group['proteins']
+    if affected_peptides:
+        with perf.span("protein map merge"):
+            affected = pd.Index(pd.concat(affected_peptides).unique())
+            updated = _protein_map(pairs.loc[pairs['peptide'].isin(affected), ['peptide', 'protein']])
+            proteins = pd.concat([proteins.drop(affected, errors='ignore'), updated])
+
+    return {
+        'runs': runs,
+        'files': list(tsv_files),
+        'column_names': column_names,
+        'long': long,
+        'peptides': _table_rows(long),
+        'available': available,
+        'index_name': index_names.pop() if len(index_names) == 1 else None,
+        'proteins': proteins,
+        'pairs': pairs,
+    }
+
+def metric_matrix(group, metric_column, default_peptide_column='Peptide'):
+    """
+    Returns the peptide x run SparseMatrix of one metric from a cached group.
+    Its rows are the peptide dictionary of the group and only the peptides found in
+    each run are stored; the rest are 0 for numeric metrics and "" for text metrics.
+    """
+    for run_name, file in zip(group['column_names'], group['files']):
+        if metric_column not in group['available'][run_name]:
+            strategy = AGGREGATION_STRATEGIES[metric_column]
+            raise ValueError(f"For metric '{metric_column}', none of the expected columns ({', '.join(map(str, strategy['columns']))}) were found in {os.path.basename(file)}.")
+
+    long = group['long']
+    ids, labels = group['peptides']
+    # Ensure the index column (peptides) has a name.
+    index = pd.Index(labels, name=group['index_name'] or default_peptide_column)
+    position = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=np.int64)
+    position[ids] = np.arange(len(ids))
+    if _is_text_metric(metric_column):
+        values, fill_value = long[metric_column].to_numpy(dtype=object), ""
+    else:
+        values, fill_value = long[metric_column].to_numpy(dtype=np.float32), 0
+    return SparseMatrix.from_coo(position[long['peptide'].to_numpy()], long['run'].cat.codes.to_numpy(),
+                                 values, index, group['column_names'], fill_value)
+
+def select_metric(group, metric_column, default_peptide_column='Peptide', sparse=False):
+    """
+    Builds the peptide x run table of one metric from a cached group.
+    With sparse=True the run columns are pandas sparse columns (see SparseMatrix.to_frame).
+    """
+    with perf.span("build table", metric=metric_column, sparse=sparse):
+        final_df = metric_matrix(group, metric_column, default_peptide_column).to_frame(sparse=sparse)
+
+    # --- INSERT PROTEIN COLUMN ---
+    with perf.span("protein column"):
+        # Create the protein series from the peptide IDs of the rows
+        protein_series = group['proteins'].reindex(group['peptides'][0]).to_numpy(dtype=object)
+
+        # Fill missing proteins with specific placeholder or empty
+        protein_series = pd.Series(protein_series, index=final_df.index).fillna("Unknown")
+
+        # Insert at position 0 (a single concat also defragments the columns selected above)
+        final_df = pd.concat([pd.Series(protein_series, index=final_df.index, name='Protein'), final_df], axis=1)
+
+    return final_df
+
+def process_tsv_files(tsv_files, column_names, default_peptide_column='Peptide', metric_column='Conteo', max_workers=None,
+                      progress_callback=None, cancel_event=None, sparse=False, signatures=None):
     """
     Procesa una lista de archivos TSV y los combina en un único DataFrame.
+    Todas las métricas se calculan una sola vez por grupo y se guardan en memoria,
+    así que cambiar de métrica solo reconstruye la tabla a partir de los valores guardados.
+    Con max_workers > 1 los archivos se procesan en paralelo en varios procesos.
+    progress_callback(done, total) informa del avance y cancel_event permite cancelar.
+    Con sparse=True las columnas de los archivos son dispersas (solo se guardan los
+    péptidos encontrados en cada archivo). 'signatures' (por ejemplo, del índice de
+    metadatos) evita hacer os.stat de cada archivo para validar la caché.
     """
     if not tsv_files:
         return pd.DataFrame()
@@ -164,159 +753,207 @@ def process_tsv_files(tsv_files, column_names, default_peptide_column='Peptide',
     if len(tsv_files) != len(column_names):
         raise ValueError("The number of tsv_files must match the number of column_names.")
 
-    all_dataframes = []
-    
-    # --- New: Master map for Peptide -> Protein ---
-    # We will accumulate mappings from all files.
-    # If a peptide appears in multiple files with different proteins (unlikely but possible),
-    # we will merge them.
-    master_peptide_protein_map = {} 
-
-    for i, file in enumerate(tsv_files):
-        # We need to process the file to get the data AND the protein mapping
-        # Unfortunately, process_single_tsv creates the aggregated DF but doesn't return the raw DF or mapping.
-        # We could modify process_single_tsv, but to avoid breaking too much, 
-        # let's peek at the file again or do it inside process_single_tsv?
-        # A cleaner approach is to read the file once here if possible, but process_single_tsv has logic for column finding.
-        
-        # Let's trust process_single_tsv for the numeric data.
-        processed_df = process_single_tsv(file, default_peptide_column, metric_column)
-        
-        if processed_df is not None:
-             # Rename the data column with the custom column name
-            new_col_name = column_names[i]
-            processed_df = processed_df.rename(columns={processed_df.columns[0]: new_col_name})
-            all_dataframes.append(processed_df)
-            
-            # --- Extract Protein Data for this file ---
-            # We re-read the file to extract protein info. 
-            # This adds some IO overhead but keeps logic separated and safe.
-            # Efficiency is usually fine for these file sizes.
-            try:
-                temp_df = pd.read_csv(file, sep='\t')
-                
-                # Find the actual peptide column used (same logic as single_tsv basically)
-                # We can reuse the logic or just try the candidates again.
-                # To be consistent, let's copy the candidate list logic briefly or make a helper.
-                # For now, let's assume one of the candidates works.
-                candidate_peptide_columns = [
-                    default_peptide_column, 'peptide', 'Sequence', 'sequence', 
-                    'Peptide_Sequence', 'peptide_sequence', 'Peptide Sequence', 
-                    'Peptide ID', 'PeptideID', 'Accession'
-                ]
-                actual_pep_col = None
-                for col in candidate_peptide_columns:
-                    if col in temp_df.columns:
-                        actual_pep_col = col
-                        break
-                
-                if not actual_pep_col and len(temp_df.columns) > 0:
-                    actual_pep_col = temp_df.columns[0]
-                    
-                if actual_pep_col:
-                    file_map = get_peptide_protein_map(temp_df, actual_pep_col)
-                    
-                    # Merge into master map
-                    for pep, prot in file_map.items():
-                        if pep in master_peptide_protein_map:
-                            # If already exists, we might want to merge if they are different
-                            # But usually they are the same protein accession.
-                            # If we want to be super detailed:
-                            existing_prots = set(master_peptide_protein_map[pep].split(';'))
-                            new_prots = set(prot.split(';'))
-                            combined = existing_prots.union(new_prots)
-                            master_peptide_protein_map[pep] = ';'.join(sorted(combined))
-                        else:
-                            master_peptide_protein_map[pep] = prot
-            except Exception as e:
-                print(f"Warning: Could not extract protein mapping from {file}: {e}")
-
-    if not all_dataframes:
-        return pd.DataFrame()
+    if metric_column not in AGGREGATION_STRATEGIES:
+        raise ValueError(f"Unknown metric: '{metric_column}'. Valid metrics are: {', '.join(AGGREGATION_STRATEGIES.keys())}")
 
-    # Join all DataFrames into one, using the peptide index
-    # The 'outer' join ensures that all peptides from all files are included
-    final_df = pd.concat(all_dataframes, axis=1, join='outer')
-
-    # Fill NaN values (peptides not found in a file) with 0, but only for numeric columns.
-    # We always iterate AGGREGATION_STRATEGIES but now 'Associated Proteins' is gone, so most are numeric.
-    # Text columns (like 'Charge States' if used) would need care.
-    # 'Charge States' uses aggregate_unique_strings, so we shouldn't fill 0 there.
-    
-    # Check if the current metric is numeric-like (not string aggregation)
-    is_numeric_metric = True
-    current_strategy = AGGREGATION_STRATEGIES.get(metric_column)
-    if current_strategy and current_strategy['agg_func'] in [aggregate_unique_strings, aggregate_protein_strings]:
-        is_numeric_metric = False
-        
-    if is_numeric_metric:
-        final_df = final_df.fillna(0)
-    else:
-        final_df = final_df.fillna("")
+    with perf.span("group data", files=len(tsv_files)):
+        group = get_group_data(tsv_files, column_names, default_peptide_column, max_workers=max_workers,
+                               progress_callback=progress_callback, cancel_event=cancel_event, signatures=signatures)
 
-    # Ensure the index column (peptides) has a name.
-    final_df.index.name = final_df.index.name or default_peptide_column
-    
-    # --- INSERT PROTEIN COLUMN ---
-    # Create the protein series from the index
-    protein_series = final_df.index.map(master_peptide_protein_map)
-    
-    # Fill missing proteins with specific placeholder or empty
-    protein_series = protein_series.fillna("Unknown")
-    
-    # Insert at position 0
-    final_df.insert(0, 'Protein', protein_series)
-    
-    return final_df
+    # The table is built on every call, so callers can modify it without touching the cache
+    with perf.span("select metric", metric=metric_column):
+        return select_metric(group, metric_column, default_peptide_column, sparse=sparse)
+
+def get_peptide_intensities(file_path):
+    """
+    Sums the intensities of a single TSV file by peptide (its rows, e.g. one per charge
+    state, are added up) and keeps the protein list of the first row of every peptide.
+    Returns a DataFrame with one row per peptide and 'peptide', 'proteins' (categorical)
+    and 'intensity' columns, or None if the file has no protein column.
+    """
+    try:
+        header = run_cache.read_header(file_path)
+
+        # 1. Find the intensity column (the last one), the peptide and the protein columns
+        intensity_col_name = header[-1]
+        peptide_col_name = find_peptide_column(header, 'Peptide')
+        protein_col_name = find_column(header, PROTEIN_COLUMN_CANDIDATES)
+
+        if not protein_col_name:
+            # If not found, skip the file, but an error could be thrown.
+            print(f"Warning: Protein column not found in {os.path.basename(file_path)}. Skipping for correlation analysis.")
+            return None
+
+        # Only the three needed columns are read, with their lfq.tsv dtypes
+        df = run_cache.read_tsv(file_path, usecols={peptide_col_name, protein_col_name, intensity_col_name},
+                                dtype=lfq_dtypes(header))
+        intensities = pd.to_numeric(df[intensity_col_name], errors='coerce').to_numpy(dtype=np.float64)
+        peptides = df[peptide_col_name].astype('category').array
+        proteins = df[protein_col_name].astype('category').array
+
+        # 2. Sum the positive intensities by peptide over its category codes (no groupby);
+        #    NaN is not > 0, and every peptide keeps the protein list of its first row
+        found, sums, lists = pr.sum_by_peptide(peptides.codes, intensities, proteins.codes, len(peptides.categories))
 
-def get_protein_intensity_matrix(tsv_files):
+        return pd.DataFrame({
+            'peptide': peptides.categories.to_numpy(dtype=object)[found],
+            'proteins': pd.Categorical.from_codes(lists, proteins.categories),
+            'intensity': sums,
+        })
+    except Exception as e:
+        raise ValueError(f"Failed to process file {os.path.basename(file_path)} for protein analysis: {e}")
+
+def _peptide_matrix(tsv_files, signatures, peptide_runs, max_workers, progress_callback, cancel_event):
+    """
+    Peptide x run intensity matrix of the files with a protein column, over the peptide
+    and protein IDs of string_ids (missing intensities are 0). The runs are read from the
+    group store or, without a cache folder, parsed into 'peptide_runs' (see protein_rollup.PeptideRuns),
+    which keeps them for the next call. Returns the positions of the files in the matrix,
+    the SparseMatrix and the protein list ID of every peptide.
+    """
+    def names(present):
+        return [os.path.splitext(os.path.basename(tsv_files[i]))[0] for i in present]
+
+    if run_cache.CACHE_DIR is not None:
+        with open_group_store(tsv_files, signatures, 'Peptide', max_workers, progress_callback, cancel_event) as store:
+            present = [i for i, signature in enumerate(signatures) if store.has_column('proteins', signature)]
+            with perf.span("build matrix", runs=len(present)):
+                peptide_matrix, peptide_lists = store.peptide_matrix([signatures[i] for i in present], names(present))
+            return present, peptide_matrix, peptide_lists
+
+    # Parse only the new files (nothing is modified until all of them are loaded)
+    added = [i for i, signature in enumerate(signatures) if signature not in peptide_runs.runs]
+    with perf.span("read files", files=len(added)):
+        results = map_files(get_peptide_intensities, [tsv_files[i] for i in added], max_workers=max_workers,
+                            progress_callback=progress_callback, cancel_event=cancel_event)
+    peptide_runs.add(zip([signatures[i] for i in added], results))
+    peptide_runs.keep(signatures)
+
+    present = [i for i, signature in enumerate(signatures) if peptide_runs.runs[signature] is not None]
+    with perf.span("build matrix", runs=len(present)):
+        peptide_matrix, peptide_lists = peptide_runs.matrix([signatures[i] for i in present], names(present))
+    return present, peptide_matrix, peptide_lists
+
+def get_protein_intensity_matrix(tsv_files, max_workers=None, progress_callback=None, cancel_event=None, sparse=False,
+                                 policy=pr.DEFAULT_POLICY):
     """
     Crea una matriz de intensidad de proteínas a partir de una lista de archivos TSV.
     Las filas son proteínas y las columnas son los archivos de muestra.
+    Las intensidades de todos los archivos salen de un único producto disperso de la matriz
+    de incidencia péptido x proteína por la matriz de péptidos; 'policy' decide cómo se
+    reparten los péptidos compartidos ('first', 'razor', 'split' o 'unique', ver protein_rollup).
+    Con max_workers > 1 los archivos se procesan en paralelo en varios procesos.
+    progress_callback(done, total) informa del avance y cancel_event permite cancelar.
+    Con sparse=True devuelve una SparseMatrix (solo las proteínas encontradas en cada archivo)
+    en lugar de un DataFrame denso.
     """
-    all_protein_dataframes = []
-
-    for file_path in tsv_files:
-        try:
-            df = pd.read_csv(file_path, sep='\t')
-
-            # 1. Find the intensity column (the last one) and ensure it's numeric
-            intensity_col_name = df.columns[-1]
-            df[intensity_col_name] = pd.to_numeric(df[intensity_col_name], errors='coerce').fillna(0)
-
-            # 2. Find the protein column
-            protein_col_name = None
-            if 'proteins' in df.columns:
-                protein_col_name = 'proteins'
-            elif 'Proteins' in df.columns:
-                protein_col_name = 'Proteins'
-            
-            if not protein_col_name:
-                # If not found, skip the file, but an error could be thrown.
-                print(f"Warning: Protein column ('proteins' or 'Proteins') not found in {os.path.basename(file_path)}. Skipping for correlation analysis.")
-                continue
-
-            # 3. Use only the first protein identifier for simplicity
-            df['protein_group'] = df[protein_col_name].astype(str).str.split(';').str[0]
-
-            # --- MODIFICATION: Clean data before grouping ---
-            # Remove rows where the protein is not defined or the intensity is 0
-            df = df[df['protein_group'].notna() & (df[intensity_col_name] > 0)]
-
-            # 4. Group by protein and sum intensities
-            protein_intensities = df.groupby('protein_group')[intensity_col_name].sum()
-
-            # 5. Rename the series with the file name
-            file_name = os.path.splitext(os.path.basename(file_path))[0]
-            protein_intensities.name = file_name
-            
-            all_protein_dataframes.append(protein_intensities)
-        except Exception as e:
-            raise ValueError(f"Failed to process file {os.path.basename(file_path)} for protein analysis: {e}")
-
-    if not all_protein_dataframes:
+    signatures = [run_cache.file_signature(f) for f in tsv_files]
+    present, peptide_matrix, peptide_lists = _peptide_matrix(
+        tsv_files, signatures, pr.PeptideRuns(), max_workers, progress_callback, cancel_event)
+    with perf.span("protein rollup", policy=policy):
+        matrix = pr.rollup(peptide_matrix, peptide_lists, policy)
+    if sparse:
+        return matrix
+    if not present:
         return pd.DataFrame()
+    with perf.span("to frame"):
+        return matrix.to_frame()
+
+# --- PROTEIN INTENSITY CACHE ---
+# The protein x run intensity matrix of a group is built once and kept here, together
+# with the date of every run, so the correlation report can filter runs by date by
+# slicing columns of the cached matrix instead of reading the files again.
+# Like the metrics cache, only added or modified files (path, mtime or size) are parsed.
+# The rows of every run are kept in the group store (or, without a cache folder, its peptide
+# intensities in a protein_rollup.PeptideRuns), so a new file or another shared-peptide
+# policy only costs the sparse product; the correlation
+# statistics are only computed for the new runs, unless the protein intensities of the
+# old runs changed (e.g. a razor assignment moved with the new peptides).
+_protein_cache = {}
+
+def select_runs_by_date(dates, start_date=None, end_date=None):
+    """
+    Returns the positions of the runs whose date is inside [start_date, end_date].
+    Runs without a date are only selected when no filter is set.
+    """
+    positions = []
+    for i, run_date in enumerate(dates):
+        if run_date is None:
+            if start_date is None and end_date is None:
+                positions.append(i)
+        elif (start_date is None or run_date >= start_date) and (end_date is None or run_date <= end_date):
+            positions.append(i)
+    return positions
+
+def get_protein_group(tsv_files, dates=None, signatures=None, max_workers=None, progress_callback=None, cancel_event=None,
+                      policy=pr.DEFAULT_POLICY):
+    """
+    Returns the cached protein intensities of a group of TSV files, building or updating it if needed.
+    With max_workers > 1 the new files are parsed in a process pool.
+    'dates' and 'signatures' (e.g. from the metadata index) avoid parsing the file names
+    and calling os.stat on every file; by default they are taken from the files.
+    'policy' is the shared-peptide policy of the protein rollup (see protein_rollup).
+
+    The result is a dictionary with:
+      - 'matrix': SparseMatrix of proteins x runs (only the runs with a protein column).
+      - 'files' and 'dates': the file and the date (or None) of every column of the matrix.
+      - 'stats': CorrelationStats of the columns of the matrix.
+    """
+    key = os.path.dirname(os.path.abspath(tsv_files[0]))
+    runs = list(signatures) if signatures is not None else [run_cache.file_signature(f) for f in tsv_files]
+    if dates is None:
+        dates = [db.get_run_date(f) for f in tsv_files]
+
+    group = _protein_cache.pop(key, None)
+    if group is None:
+        group = {'runs': [], 'policy': None, 'peptides': pr.PeptideRuns(), 'matrix': None, 'stats': CorrelationStats()}
 
-    # 6. Combine all dataframes and fill NaNs
-    final_df = pd.concat(all_protein_dataframes, axis=1, join='outer').fillna(0)
-    return final_df
\ No newline at end of file
+    if group['runs'] != runs or group['policy'] != policy:
+        present, peptide_matrix, peptide_lists = _peptide_matrix(
+            tsv_files, runs, group['peptides'], max_workers, progress_callback, cancel_event)
+        with perf.span("protein rollup", policy=policy):
+            matrix = pr.rollup(peptide_matrix, peptide_lists, policy)
+        del peptide_matrix
+
+        # The statistics of the old runs are only valid if their protein intensities did not change
+        stats = group['stats']
+        keys = [runs[i] for i in present]
+        if group['matrix'] is not None:
+            new_positions = {run: j for j, run in enumerate(keys)}
+            kept = [(i, new_positions[run]) for i, run in enumerate(stats.keys) if run in new_positions]
+            if kept:
+                old_kept = group['matrix'].select_columns([i for i, _ in kept])
+                new_kept = matrix.select_columns([j for _, j in kept])
+                old_kept.columns = new_kept.columns # Only the cells are compared
+                if not old_kept.equals(new_kept):
+                    stats = CorrelationStats()
+        with perf.span("correlation statistics", runs=len(keys)):
+            stats.update(matrix, keys)
+        group = {
+            'runs': runs,
+            'policy': policy,
+            'peptides': group['peptides'], # Peptide intensities of every run when there is no group store
+            'files': [tsv_files[i] for i in present],
+            'dates': [dates[i] for i in present],
+            'matrix': matrix,
+            'stats': stats,
+        }
+
+    # The most recently used group goes last; the oldest ones are dropped first
+    _protein_cache[key] = group
+    while len(_protein_cache) > MAX_CACHED_GROUPS:
+        _protein_cache.pop(next(iter(_protein_cache)))
+    return group
+
+def get_protein_correlation(group, positions, missing_aware=False, min_overlap=3):
+    """
+    Pearson correlation between the runs at 'positions' of a cached protein group.
+    By default missing intensities count as 0 and only the proteins found in those runs
+    are used. With missing_aware=True the log2 intensities are correlated using, for
+    each pair of runs, the proteins found in both (at least 'min_overlap' of them).
+    """
+    matrix = group['matrix']
+    columns = [matrix.columns[i] for i in positions]
+    if missing_aware:
+        return group['stats'].log_corr(positions, min_overlap=min_overlap, columns=columns)
+    return group['stats'].corr(positions, matrix.count_rows(positions), columns=columns)
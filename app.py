@@ -0,0 +1,952 @@
+import os
+import time
+import customtkinter
+import database as db # Importamos nuestro nuevo módulo de base de datos
+import analysis as an # Importamos nuestro nuevo módulo de análisis
+import protein_rollup as pr # Reparto de los péptidos compartidos entre proteínas
+import importer # Importación en paralelo de las carpetas de las máquinas
+import exporter # Exportación por bloques a Excel, CSV/TSV y Parquet (openpyxl y pyarrow solo al exportar)
+from background import BackgroundTask # Ejecuta el trabajo pesado fuera del hilo de Tk
+from widgets import ProgressPanel, DataFrameTable, PerformanceWindow
+import heatmap as hm # Mapa de calor como imagen para muchos archivos
+from datetime import datetime, timedelta
+from tkinter import messagebox, filedialog
+import numpy as np
+import instrumentation as perf # Tiempos por etapa y por archivo de cada operación
+
+# --- Procesamiento en Paralelo ---
+# Número de procesos usados para leer y agregar los archivos TSV.
+# Por defecto 1: todo se procesa en este proceso. El pool se activa al lanzar la
+# aplicación con '--workers N' (p. ej. 'python main.py --workers 4', ver main.py).
+ANALYSIS_WORKERS = 1
+
+# --- Configuración de la Apariencia ---
+# Establece el tema de la aplicación (System, Dark, Light)
+customtkinter.set_appearance_mode("System")  
+# Establece el color por defecto de los widgets (blue, dark-blue, green)
+customtkinter.set_default_color_theme("blue") 
+
+
+class App(customtkinter.CTk):
+    def __init__(self):
+        super().__init__()
+
+        # --- Configuración de la Ventana Principal ---
+        self.title("Proteomics Analyzer")
+        self.geometry("800x600") # Ancho x Alto
+
+        # --- Configuración de la Cuadrícula (Grid) ---
+        # Hacemos que la columna central (1) se expanda para ocupar el espacio disponible
+        self.grid_columnconfigure(1, weight=1)
+        # Hacemos que la fila principal (0) se expanda
+        self.grid_rowconfigure(0, weight=1)
+
+        # --- Frame Izquierdo para Botones ---
+        self.left_frame = customtkinter.CTkFrame(self, width=180, corner_radius=0)
+        self.left_frame.grid(row=0, column=0, rowspan=4, sticky="nsew")
+        self.left_frame.grid_rowconfigure(6, weight=1) # Espacio para empujar botones hacia arriba
+
+        # --- Sección de Experimentos (antes Clientes) ---
+        self.experiments_label = customtkinter.CTkLabel(self.left_frame, text="Experiments", font=customtkinter.CTkFont(size=20, weight="bold"))
+        self.experiments_label.grid(row=0, column=0, padx=20, pady=(20, 10))
+
+        self.add_experiment_button = customtkinter.CTkButton(self.left_frame, text="Add Experiment", command=self.add_experiment_event)
+        self.add_experiment_button.grid(row=1, column=0, padx=20, pady=10)
+
+        self.delete_experiment_button = customtkinter.CTkButton(self.left_frame, text="Delete Experiment", command=self.delete_experiment_event)
+        self.delete_experiment_button.grid(row=2, column=0, padx=20, pady=10)
+
+        # --- Nueva Sección de Máquina ---
+        self.machine_label = customtkinter.CTkLabel(self.left_frame, text="Machine", font=customtkinter.CTkFont(size=20, weight="bold"))
+        self.machine_label.grid(row=3, column=0, padx=20, pady=(20, 10))
+        self.import_machine_button = customtkinter.CTkButton(self.left_frame, text="Import Machine Folder", command=self.import_machine_data_event)
+        self.import_machine_button.grid(row=4, column=0, padx=20, pady=10)
+        # Vuelve a leer las carpetas de los grupos (archivos añadidos o modificados fuera de la aplicación)
+        self.refresh_button = customtkinter.CTkButton(self.left_frame, text="Refresh", command=self.sync_index_event)
+        self.refresh_button.grid(row=5, column=0, padx=20, pady=10)
+        self.sync_task = None
+
+        # --- Rendimiento: tiempos de las últimas operaciones ---
+        self.performance_button = customtkinter.CTkButton(self.left_frame, text="Performance", command=self.show_performance_event)
+        self.performance_button.grid(row=7, column=0, padx=20, pady=(10, 20))
+        self.performance_window = None
+
+        # --- Frame Izquierdo para la Vista de Cliente (inicialmente oculto) ---
+        self.client_view_left_frame = customtkinter.CTkFrame(self, width=180, corner_radius=0)
+        self.client_view_left_frame.grid_rowconfigure(7, weight=1) # Espacio para empujar botones hacia abajo
+
+        self.client_docs_label = customtkinter.CTkLabel(self.client_view_left_frame, text="Documents", font=customtkinter.CTkFont(size=20, weight="bold"))
+        self.client_docs_label.grid(row=0, column=0, padx=20, pady=(20, 10))
+
+        self.add_doc_button = customtkinter.CTkButton(self.client_view_left_frame, text="Add Document", command=self.add_document_event)
+        self.add_doc_button.grid(row=1, column=0, padx=20, pady=10)
+
+        # Frame para la lista de documentos
+        self.document_list_frame = customtkinter.CTkScrollableFrame(self.client_view_left_frame, label_text="TSV Files")
+        self.document_list_frame.grid(row=2, column=0, padx=20, pady=10, sticky="nsew")
+
+        self.generate_heatmap_button = customtkinter.CTkButton(self.client_view_left_frame, text="Generate Heatmap", command=self.generate_heatmap_event)
+        self.generate_heatmap_button.grid(row=3, column=0, padx=20, pady=(20, 5)) 
+
+        self.generate_triangle_button = customtkinter.CTkButton(self.client_view_left_frame, text="Generate Tri-Report", command=self.generate_triangle_report_event)
+        self.generate_triangle_button.grid(row=4, column=0, padx=20, pady=(5, 5))
+
+        self.generate_pdf_button = customtkinter.CTkButton(self.client_view_left_frame, text="Generate PDF", command=self.generate_pdf_report_event)
+        self.generate_pdf_button.grid(row=5, column=0, padx=20, pady=(5, 20))
+
+        self.export_excel_button = customtkinter.CTkButton(self.client_view_left_frame, text="Export Data", command=self.export_to_excel_event)
+        self.export_excel_button.grid(row=6, column=0, padx=20, pady=(5, 20))
+
+
+        # --- Frame Derecho para la Lista de Clientes ---
+        self.right_frame = customtkinter.CTkFrame(self)
+        self.right_frame.grid(row=0, column=1, padx=20, pady=20, sticky="nsew")
+        self.right_frame.grid_rowconfigure(1, weight=1) # La segunda fila (lista de máquinas) se expandirá
+        self.right_frame.grid_columnconfigure(0, weight=1)
+
+        # --- Lista de Experimentos (antes Clientes) ---
+        self.experiment_list_frame = customtkinter.CTkScrollableFrame(self.right_frame, label_text="Experiments (Manual Groups)")
+        self.experiment_list_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        
+        # --- Nueva Lista de Máquinas ---
+        self.machine_list_frame = customtkinter.CTkScrollableFrame(self.right_frame, label_text="Machines (Automatic Groups)")
+        self.machine_list_frame.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
+
+        # Panel de progreso de la importación (oculto hasta que se necesite)
+        self.import_progress_panel = ProgressPanel(
+            self.right_frame, layout=lambda w: w.grid(row=2, column=0, padx=10, pady=(0, 10), sticky="ew")
+        )
+
+        self.group_buttons = {} # Diccionario para guardar los botones de cada grupo (experimento o máquina)
+        self.selected_group = None
+        self.selected_group_type = None # 'experiment' o 'machine'
+        self.current_df = None # Para guardar el DataFrame actual
+        self.load_task = None # Carga en segundo plano del grupo abierto
+
+        # --- Vista de Cliente Individual (inicialmente oculta) ---
+        self.client_view_frame = customtkinter.CTkFrame(self.right_frame)
+        # No usamos .grid() aquí para mantenerlo oculto hasta que se necesite
+
+        self.back_button = customtkinter.CTkButton(self.client_view_frame, text="< Back to Lists", command=self.show_main_lists)
+        self.back_button.pack(anchor="nw", padx=10, pady=10)
+
+        self.main_list_frame = customtkinter.CTkFrame(self.right_frame, fg_color="transparent")
+        self.main_list_frame.grid(row=0, column=1, sticky="nsew")
+
+        # --- Frame de Controles (para el menú desplegable) ---
+        self.controls_frame = customtkinter.CTkFrame(self.client_view_frame, fg_color="transparent")
+        self.controls_frame.pack(fill="x", padx=10, pady=(0, 10))
+
+        self.metric_label = customtkinter.CTkLabel(self.controls_frame, text="Metric to display:")
+        self.metric_label.pack(side="left", padx=(0, 10))
+
+        metric_options = [
+            "Count",
+            "Total Intensity",
+            "Average Score",
+            "Best Score",
+            "Best q-value",
+            "Average Angle",
+            "Best Angle",
+            "Charge States" # 'Associated Proteins' removed
+        ]
+        self.metric_selector = customtkinter.CTkComboBox(self.controls_frame, values=metric_options, command=self.metric_changed)
+        self.metric_selector.set("Total Intensity") # Valor por defecto
+        self.metric_selector.pack(side="left")
+
+        # --- Frame para la Tabla de Datos ---
+        self.data_table_frame = customtkinter.CTkFrame(self.client_view_frame)
+        self.data_table_frame.pack(expand=True, fill="both", padx=10, pady=10)
+        self.tree = None # Placeholder para la tabla
+
+        # Panel de progreso de la carga (se muestra encima de la tabla mientras se procesan los archivos)
+        self.load_progress_panel = ProgressPanel(
+            self.client_view_frame, layout=lambda w: w.pack(fill="x", padx=10, pady=(0, 10), before=self.data_table_frame)
+        )
+
+        # --- Carga Inicial de Datos ---
+        self.refresh_group_lists()
+        # Mostramos la lista de clientes al iniciar
+        self.show_main_lists()
+        # El índice se concilia con las carpetas en segundo plano, con la ventana ya abierta
+        self.sync_index_event()
+
+    def sync_index_event(self):
+        """Concilia el índice de metadatos con las carpetas en un hilo de trabajo y refresca las listas."""
+        if self.sync_task and not self.sync_task.finished:
+            return
+
+        def on_success(_):
+            self.refresh_group_lists()
+            if self.selected_group and self.client_view_frame.winfo_ismapped():
+                self.refresh_document_list()
+
+        def on_error(e):
+            messagebox.showerror("Error", f"Could not read the group folders: {e}")
+
+        self.sync_task = BackgroundTask(self, lambda progress_callback, cancel_event: db.sync_index(), on_success, on_error)
+
+    def refresh_group_lists(self):
+        """Actualiza las listas de Experimentos y Máquinas."""
+        # Limpiar listas actuales
+        for widget in self.experiment_list_frame.winfo_children():
+            widget.destroy()
+        for widget in self.machine_list_frame.winfo_children():
+            widget.destroy()
+        self.group_buttons = {}
+
+        # Cargar grupos (clientes/experimentos) desde la base de datos
+        groups = db.get_clients() # db.get_clients() now returns all groups
+        for group_name in groups:
+            # We assume machine names won't contain " (Manual)"
+            # --- FIX: Case-insensitive machine detection ---
+            # Convert the group name to lowercase for robust matching.
+            # This way, "Orbitrap Astral" will match "orbitrap".
+            is_manual = not any(k in group_name.lower() for k in ["orbitrap", "exactive"])
+            
+            target_frame = self.experiment_list_frame if is_manual else self.machine_list_frame
+            
+            button = customtkinter.CTkButton(target_frame, text=group_name, command=lambda name=group_name: self.select_group(name))
+            button.pack(fill="x", padx=5, pady=2)
+            # Añadir evento de doble clic para abrir la vista del cliente
+            button.bind("<Double-1>", lambda event, name=group_name: self.open_group_on_double_click(name))
+            self.group_buttons[group_name] = button
+
+    def select_group(self, name):
+        # Deseleccionar el cliente anterior si lo hay
+        if self.selected_group and self.selected_group in self.group_buttons:
+            self.group_buttons[self.selected_group].configure(fg_color=customtkinter.ThemeManager.theme["CTkButton"]["fg_color"])
+
+        # Seleccionar el nuevo cliente
+        self.selected_group = name
+        self.group_buttons[name].configure(fg_color="green") # Resaltar el seleccionado
+
+    def open_group_on_double_click(self, group_name):
+        """Selecciona un cliente y abre su vista, llamado por el evento de doble clic."""
+        self.select_group(group_name)
+        self.open_group_view()
+
+    def open_group_view(self):
+        if not self.selected_group:
+            # With double-clicking, this is less likely to happen, but it's a good safeguard.
+            messagebox.showwarning("Warning", "No group selected.")
+            return
+
+        # Ocultar el frame derecho de la lista de clientes y mostrar el de la vista de cliente
+        self.experiment_list_frame.grid_forget()
+        self.machine_list_frame.grid_forget()
+        self.main_list_frame.grid_forget()
+        self.client_view_frame.grid(row=0, column=0, sticky="nsew")
+
+        # Ocultar el menú principal izquierdo y mostrar el menú de documentos del cliente
+        self.left_frame.grid_forget()
+        self.client_view_left_frame.grid(row=0, column=0, rowspan=4, sticky="nsew")
+
+        # When opening the view, reset the selector and load the data
+        self.refresh_document_list()
+        self.metric_selector.set("Total Intensity") # La métrica principal por defecto
+        self.load_group_data()
+
+    def metric_changed(self, choice):
+        """Se llama cuando el usuario cambia la métrica en el ComboBox."""
+        self.load_group_data()
+
+    def run_in_background(self, panel, text, func, on_success, on_error, on_finish=None, progress_text=None, operation=None):
+        """
+        Ejecuta func(progress_callback, cancel_event) en un hilo de trabajo, mostrando
+        el progreso por archivo y un botón de Cancelar en 'panel'.
+        progress_text(done, total) puede dar el texto del progreso (por defecto, por archivo).
+        'operation' (de instrumentation) recibe los tiempos del trabajo y de on_success,
+        y se cierra al terminar la tarea.
+        """
+        task = None
+
+        if operation is not None:
+            func, on_success, on_error = self._instrument_task(operation, func, on_success, on_error)
+
+        def is_current():
+            return panel.task is task
+
+        def progress(done, total):
+            if is_current():
+                panel.update_progress(done, total, progress_text(done, total) if progress_text else None)
+
+        def finish():
+            if is_current():
+                panel.task = None
+                panel.stop()
+            if operation is not None and task.cancel_event.is_set():
+                operation.finish('cancelled')
+            if on_finish:
+                on_finish()
+
+        panel.start(text, cancel_command=lambda: task.cancel())
+        task = BackgroundTask(self, func, on_success, on_error, on_progress=progress, on_finish=finish)
+        panel.task = task
+        return task
+
+    def _instrument_task(self, operation, func, on_success, on_error):
+        """Envuelve las funciones de una tarea para que registren sus etapas en 'operation'."""
+        def timed_func(progress_callback, cancel_event):
+            # Las etapas de analysis se registran en la operación activa de este hilo
+            with perf.activate(operation):
+                try:
+                    return func(progress_callback, cancel_event)
+                except an.AnalysisCancelled:
+                    operation.finish('cancelled')
+                    raise
+
+        def timed_success(result):
+            try:
+                with perf.activate(operation), operation.span("update view"):
+                    on_success(result)
+            finally:
+                operation.finish()
+
+        def timed_error(e):
+            operation.finish(type(e).__name__)
+            on_error(e)
+
+        return timed_func, timed_success, timed_error
+
+    def show_performance_event(self):
+        """Abre (o trae al frente) la ventana con los tiempos de las últimas operaciones."""
+        if self.performance_window is not None and self.performance_window.winfo_exists():
+            self.performance_window.refresh()
+            self.performance_window.focus()
+            return
+        self.performance_window = PerformanceWindow(self, log_path=perf.log_path())
+
+    def export_in_background(self, panel, dataframe, parent=None):
+        """
+        Pide un archivo y exporta 'dataframe' en el formato de su extensión (.xlsx, .csv,
+        .tsv o .parquet) en un hilo de trabajo, mostrando las filas por segundo en 'panel'.
+        """
+        dialog_options = {'parent': parent} if parent else {}
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=exporter.EXPORT_FILETYPES,
+            title="Export Data",
+            **dialog_options
+        )
+        if not filepath:
+            return # El usuario canceló el diálogo
+
+        if panel.task and not panel.task.finished:
+            messagebox.showwarning("Warning", "Please wait until the current task finishes.", **dialog_options)
+            return
+
+        start = time.perf_counter()
+
+        def export(progress_callback, cancel_event):
+            return exporter.export_dataframe(dataframe, filepath, progress_callback, cancel_event)
+
+        def progress_text(done, total):
+            rows_per_second = done / max(time.perf_counter() - start, 1e-6)
+            return f"Exported {done:,} of {total:,} rows ({rows_per_second:,.0f} rows/s)..."
+
+        def on_success(stats):
+            messagebox.showinfo("Success",
+                                f"Data successfully exported to:\n{filepath}\n\n"
+                                f"{stats['rows']:,} rows in {stats['seconds']:.1f} s ({stats['rows_per_second']:,.0f} rows/s).",
+                                **dialog_options)
+
+        def on_error(e):
+            messagebox.showerror("Error", f"Failed to export the data: {e}", **dialog_options)
+
+        operation = perf.start_operation("Export", file=os.path.basename(filepath), rows=len(dataframe))
+        return self.run_in_background(panel, "Exporting...", export, on_success, on_error,
+                                      progress_text=progress_text, operation=operation)
+
+    def load_group_data(self):
+        """
+        Carga los datos del grupo seleccionado según la métrica elegida y puebla la tabla.
+        El análisis se ejecuta en segundo plano para que la ventana no se bloquee.
+        """
+        # Cancelar una carga anterior que siga en curso
+        if self.load_task and not self.load_task.finished:
+            self.load_task.cancel()
+
+        # Limpiar la tabla anterior si existe
+        if self.tree:
+            self.tree.destroy()
+            self.tree = None # Asegurarse de que se limpia
+        self.current_df = None # Limpiar el DataFrame guardado
+        for widget in self.data_table_frame.winfo_children():
+            widget.destroy()
+
+        # Los archivos y sus firmas (ruta, mtime, tamaño) salen del índice de metadatos
+        runs = db.get_client_runs(self.selected_group)
+        tsv_files = [run['path'] for run in runs]
+        signatures = [run['signature'] for run in runs]
+
+        if not tsv_files:
+            label = customtkinter.CTkLabel(self.data_table_frame, text="No .tsv files found in this client's folder.")
+            label.grid(row=0, column=0, padx=20, pady=20)
+            return
+
+        selected_metric = self.metric_selector.get()
+
+        # --- FINAL FIX: Assign correct column names ---
+        # 1. Create a list of short, descriptive column names from the filenames.
+        #    e.g., '2024-10-28_..._R01.tsv' -> '2024-10-28_..._R01'
+        column_names = [os.path.splitext(os.path.basename(f))[0] for f in tsv_files]
+
+        def analyze(progress_callback, cancel_event):
+            # Procesar los archivos con nuestro módulo de análisis (en el hilo de trabajo)
+            # 2. Pass both the file paths and the desired column names.
+            return an.process_tsv_files(
+                tsv_files, column_names, default_peptide_column='Peptide', metric_column=selected_metric,
+                max_workers=ANALYSIS_WORKERS, progress_callback=progress_callback, cancel_event=cancel_event,
+                sparse=True, # Las columnas de los archivos solo guardan los péptidos encontrados
+                signatures=signatures
+            )
+
+        def on_success(dataframe):
+            if dataframe.empty:
+                label = customtkinter.CTkLabel(self.data_table_frame, text="Could not process TSV files or they contain no valid data.")
+                label.grid(row=0, column=0, padx=20, pady=20)
+                return
+
+            # Crear y poblar la tabla
+            self.current_df = dataframe
+            self.populate_data_table(self.current_df)
+
+        def on_error(e):
+            if isinstance(e, FileNotFoundError):
+                messagebox.showerror("Error", f"Data folder for group {self.selected_group} not found.")
+            else:
+                messagebox.showerror("Analysis Error", f"An error occurred while analyzing the files: {e}")
+
+        operation = perf.start_operation("Load group", group=self.selected_group, metric=selected_metric, files=len(tsv_files))
+        self.load_task = self.run_in_background(
+            self.load_progress_panel, f"Loading {len(tsv_files)} files...", analyze, on_success, on_error,
+            operation=operation
+        )
+
+    def populate_data_table(self, dataframe):
+        # Limpiar el frame por si había un mensaje de "no hay archivos"
+        for widget in self.data_table_frame.winfo_children():
+            widget.destroy()
+
+        # Tabla virtual: solo se crean en el Treeview las filas visibles de 'dataframe',
+        # así que el coste no depende del número de péptidos.
+        self.tree = DataFrameTable(self.data_table_frame, dataframe)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+
+        self.data_table_frame.grid_rowconfigure(0, weight=1)
+        self.data_table_frame.grid_columnconfigure(0, weight=1)
+
+    def add_experiment_event(self):
+        dialog = customtkinter.CTkInputDialog(text="Enter the new experiment's name:", title="Add Experiment")
+        experiment_name = dialog.get_input()
+        if experiment_name:
+            if db.add_client(experiment_name):
+                self.refresh_group_lists()
+            else:
+                messagebox.showerror("Error", f"Experiment '{experiment_name}' already exists.")
+
+    def delete_experiment_event(self):
+        if self.selected_group:
+            if messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete the group '{self.selected_group}' and all its data?"):
+                db.delete_client(self.selected_group)
+                self.selected_group = None
+                self.refresh_group_lists()
+        else:
+            messagebox.showwarning("Warning", "Please select a group to delete.")
+
+    def show_main_lists(self):
+        # Si se sale de la vista mientras se cargan datos, no tiene sentido seguir leyendo archivos
+        if self.load_task and not self.load_task.finished:
+            self.load_task.cancel()
+
+        # Ocultar la vista de cliente (derecha) y mostrar la lista de clientes
+        self.client_view_frame.grid_forget()
+        
+        # Mostrar los frames de las listas principales
+        self.main_list_frame.grid(row=0, column=1, rowspan=2, padx=20, pady=20, sticky="nsew")
+        self.experiment_list_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        self.machine_list_frame.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
+
+        # Ocultar el menú de documentos y mostrar el menú principal
+        self.client_view_left_frame.grid_forget()
+        self.left_frame.grid(row=0, column=0, rowspan=4, sticky="nsew")
+
+    def refresh_document_list(self):
+        """Actualiza la lista de documentos en el panel izquierdo de la vista de cliente."""
+        # Limpiar la lista actual
+        for widget in self.document_list_frame.winfo_children():
+            widget.destroy()
+
+        if not self.selected_group:
+            return
+
+        documents = db.get_client_documents(self.selected_group)
+        for doc_name in documents:
+            # Crear un frame para cada fila (documento + botón de borrar)
+            doc_frame = customtkinter.CTkFrame(self.document_list_frame, fg_color="transparent")
+            doc_frame.pack(fill="x", pady=2)
+            doc_frame.columnconfigure(0, weight=1) # El label se expande
+
+            label = customtkinter.CTkLabel(doc_frame, text=doc_name, anchor="w")
+            label.grid(row=0, column=0, sticky="ew", padx=(5,0))
+
+            delete_button = customtkinter.CTkButton(
+                doc_frame, text="X", width=20, height=20,
+                command=lambda name=doc_name: self.delete_document_event(name)
+            )
+            delete_button.grid(row=0, column=1, padx=5)
+
+    def add_document_event(self):
+        """Abre un diálogo para seleccionar y añadir un archivo .tsv al cliente actual."""
+        if not self.selected_group:
+            return
+
+        filepaths = filedialog.askopenfilenames(
+            title="Select TSV files",
+            filetypes=[("TSV files", "*.tsv"), ("All files", "*.*")]
+        )
+        if filepaths:
+            for path in filepaths:
+                db.add_document_to_client(self.selected_group, path)
+            self.refresh_document_list()
+            self.load_group_data() # Recargar la tabla con los nuevos datos
+
+    def delete_document_event(self, doc_name):
+        """Elimina un documento del cliente actual."""
+        if messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete the document '{doc_name}'?"):
+            if db.delete_client_document(self.selected_group, doc_name):
+                self.refresh_document_list()
+                self.load_group_data() # Recargar la tabla
+
+    def import_machine_data_event(self):
+        """
+        Abre un diálogo para seleccionar una carpeta, la escanea en busca de datos de experimentos
+        y los importa automáticamente, organizándolos por máquina.
+        """
+        root_folder = filedialog.askdirectory(title="Select the main folder containing all experiments")
+        if not root_folder:
+            return
+
+        if self.import_progress_panel.task and not self.import_progress_panel.task.finished:
+            messagebox.showwarning("Warning", "An import is already running.")
+            return
+
+        def import_runs(progress_callback, cancel_event):
+            # Las carpetas se buscan y se copian en paralelo; las ejecuciones ya importadas
+            # (según el manifiesto o el contenido del archivo) se omiten.
+            return importer.import_machine_data(
+                root_folder, progress_callback=progress_callback, cancel_event=cancel_event
+            )
+
+        def on_success(counts):
+            messagebox.showinfo("Import Complete",
+                                f"Successfully imported {counts['imported']} experiments.\n"
+                                f"Skipped {counts['skipped']} experiments already imported.\n"
+                                f"Failed to import {counts['failed']} experiments.")
+
+        def on_error(e):
+            messagebox.showerror("Error", f"The import failed: {e}")
+
+        # La lista de grupos se refresca siempre, también si se cancela a mitad de la importación
+        self.run_in_background(
+            self.import_progress_panel, "Importing...", import_runs, on_success, on_error,
+            on_finish=self.refresh_group_lists
+        )
+
+    # --- REFACTORIZACIÓN: Mover la lógica de generación de reportes a una función interna ---
+    def _generate_correlation_report(self, is_triangular: bool):
+        """
+        Función interna que genera una ventana con un mapa de calor (cuadrado o triangular)
+        y añade filtros de fecha para actualizarlo dinámicamente.
+        """
+        try:
+            # 1. Crear la ventana emergente para el reporte
+            report_window = customtkinter.CTkToplevel(self)
+            report_type = "Triangular" if is_triangular else "Square"
+            report_window.title(f"{report_type} Correlation Report - {self.selected_group}")
+            report_window.geometry("950x750") # Aumentamos el ancho para que quepan los botones
+            report_window.grab_set()
+
+            # 2. Crear el frame para los filtros de fecha
+            filter_frame = customtkinter.CTkFrame(report_window)
+            filter_frame.pack(fill="x", padx=10, pady=(10, 0))
+
+            customtkinter.CTkLabel(filter_frame, text="Desde:").pack(side="left", padx=(10, 5))
+            start_date_entry = customtkinter.CTkEntry(filter_frame, placeholder_text="YYYY-MM-DD", width=120)
+            start_date_entry.pack(side="left", padx=5)
+
+            customtkinter.CTkLabel(filter_frame, text="Hasta:").pack(side="left", padx=(10, 5))
+            end_date_entry = customtkinter.CTkEntry(filter_frame, placeholder_text="YYYY-MM-DD", width=120)
+            end_date_entry.pack(side="left", padx=5)
+
+            # Frame para el lienzo del gráfico (inicialmente vacío)
+            canvas_frame = customtkinter.CTkFrame(report_window)
+            canvas_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+            # Panel de progreso mientras se procesan los archivos
+            chart_progress_panel = ProgressPanel(
+                report_window, layout=lambda w: w.pack(fill="x", padx=10, pady=(10, 0), before=canvas_frame)
+            )
+            
+            # --- MEJORA: Función para cambiar la fecha con la rueda del ratón/teclas ---
+            def _change_date(event, delta):
+                """
+                Incrementa/decrementa el día, mes o año en el widget de entrada,
+                dependiendo de la posición del cursor.
+                """
+                entry_widget = event.widget
+                current_date_str = entry_widget.get()
+                
+                try:
+                    current_date = datetime.strptime(current_date_str, '%Y-%m-%d').date()
+                except ValueError:
+                    current_date = datetime.now().date()
+
+                cursor_pos = entry_widget.index("insert")
+                year, month, day = current_date.year, current_date.month, current_date.day
+
+                if 0 <= cursor_pos <= 4: # Modificar año (YYYY)
+                    year += delta
+                elif 5 <= cursor_pos <= 7: # Modificar mes (-MM)
+                    month += delta
+                    if month > 12:
+                        month = 1
+                        year += 1
+                    elif month < 1:
+                        month = 12
+                        year -= 1
+                else: # Modificar día (-DD)
+                    new_date = current_date + timedelta(days=delta)
+                    year, month, day = new_date.year, new_date.month, new_date.day
+                
+                # Prevenir fechas inválidas como el 31 de febrero
+                try:
+                    new_date = datetime(year, month, day).date()
+                except ValueError:
+                    # Si el día es inválido para el nuevo mes/año, ajústalo al último día válido
+                    last_day_of_month = (datetime(year, month, 1) + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+                    new_date = last_day_of_month.date()
+
+                entry_widget.delete(0, "end")
+                entry_widget.insert(0, new_date.strftime('%Y-%m-%d'))
+                entry_widget.icursor(cursor_pos) # <-- ¡CORRECCIÓN! Mantiene el cursor en su sitio.
+
+            # Vinculamos los eventos a los campos de fecha
+            for entry in [start_date_entry, end_date_entry]:
+                entry.bind("<MouseWheel>", lambda e: _change_date(e, 1 if e.delta > 0 else -1))
+                entry.bind("<Up>", lambda e: _change_date(e, 1))
+                entry.bind("<Down>", lambda e: _change_date(e, -1))
+
+            # Variables to hold references to the canvas, figure, and data
+            current_canvas = None
+            current_fig = None
+            current_corr_matrix = None # Para guardar la matriz de correlación
+            chart_task = None # Cálculo en segundo plano de la correlación
+            missing_aware_var = customtkinter.BooleanVar(value=False)
+            policy_var = customtkinter.StringVar(value=pr.DEFAULT_POLICY)
+
+            def update_chart():
+                nonlocal chart_task
+
+                # Obtener todos los archivos TSV del grupo con su fecha, desde el índice de metadatos
+                group_runs = db.get_client_runs(self.selected_group)
+                all_tsv_files = [run['path'] for run in group_runs]
+
+                # Filter files by date
+                try:
+                    start_date = datetime.strptime(start_date_entry.get(), '%Y-%m-%d').date() if start_date_entry.get() else None
+                    end_date = datetime.strptime(end_date_entry.get(), '%Y-%m-%d').date() if end_date_entry.get() else None
+                except ValueError:
+                    messagebox.showwarning("Warning", "Dates must use the YYYY-MM-DD format.", parent=report_window)
+                    return
+
+                # Consulta indexada por fecha: no hace falta leer los archivos
+                if len(db.get_client_runs(self.selected_group, start_date, end_date)) < 2:
+                    messagebox.showwarning("Warning", "At least 2 documents in the selected date range are required to generate a correlation report.", parent=report_window)
+                    return
+
+                # Cancelar un cálculo anterior que siga en curso
+                if chart_task and not chart_task.finished:
+                    chart_task.cancel()
+
+                missing_aware = missing_aware_var.get() # Las variables de Tk solo se leen en su hilo
+                policy = policy_var.get()
+
+                def compute_correlation(progress_callback, cancel_event):
+                    # Process data (in the worker thread)
+                    # La matriz de proteínas del grupo y sus estadísticos se calculan una vez y se
+                    # guardan en memoria; cambiar las fechas solo selecciona filas y columnas de ellos.
+                    protein_group = an.get_protein_group(
+                        all_tsv_files, dates=[run['acquisition_date'] for run in group_runs],
+                        signatures=[run['signature'] for run in group_runs], max_workers=ANALYSIS_WORKERS,
+                        progress_callback=progress_callback, cancel_event=cancel_event, policy=policy
+                    )
+                    positions = an.select_runs_by_date(protein_group['dates'], start_date, end_date)
+                    if len(positions) < 2:
+                        return None
+                    with perf.span("correlation", runs=len(positions), missing_aware=missing_aware):
+                        return an.get_protein_correlation(protein_group, positions, missing_aware=missing_aware)
+
+                def on_success(corr_matrix):
+                    if corr_matrix is None:
+                        messagebox.showerror("Error", "Could not process data. Please ensure the TSV files contain a 'proteins' column and intensity data.", parent=report_window)
+                        return
+                    draw_chart(corr_matrix)
+
+                def on_error(e):
+                    messagebox.showerror("Error", f"Could not generate the report: {e}", parent=report_window)
+
+                operation = perf.start_operation("Correlation report", group=self.selected_group, files=len(all_tsv_files),
+                                                 start=start_date, end=end_date, policy=policy)
+                chart_task = self.run_in_background(
+                    chart_progress_panel, f"Processing {len(all_tsv_files)} files...",
+                    compute_correlation, on_success, on_error, operation=operation
+                )
+
+            def draw_chart(corr_matrix):
+                """Dibuja el mapa de calor en la ventana (siempre en el hilo de Tk)."""
+                nonlocal current_canvas, current_fig, current_corr_matrix
+                # matplotlib y seaborn se cargan con el primer gráfico (el arranque no los necesita)
+                with perf.timed_import('matplotlib', 'seaborn'):
+                    import matplotlib.pyplot as plt
+                    import seaborn as sns
+                    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+                    from matplotlib.colors import LinearSegmentedColormap
+
+                # Clear the previous chart if it exists
+                if current_canvas:
+                    current_canvas.get_tk_widget().destroy()
+                if current_fig:
+                    plt.close(current_fig)
+
+                current_corr_matrix = corr_matrix # Save the matrix
+                min_val = corr_matrix.where(corr_matrix < 1.0).min().min()
+                max_val = 1.0
+
+                corr_matrix.columns = [f"run {i+1}" for i in range(len(corr_matrix.columns))]
+                corr_matrix.index = corr_matrix.columns
+
+                num_items = len(corr_matrix.columns)
+                # Con muchos archivos se dibuja una sola imagen en lugar de un parche por celda
+                use_raster = num_items > hm.RASTER_MIN_RUNS
+                base_size = max(8, min(num_items * 0.5, 12 if use_raster else 25))
+                fig_size = (base_size, base_size)
+
+                current_fig, ax = plt.subplots(figsize=fig_size)
+                # Píxeles disponibles para la matriz: si hay más archivos, se promedian en bloques
+                pixel_budget = int(min(report_window.winfo_screenheight(), base_size * current_fig.dpi) * 0.75)
+
+                if is_triangular:
+                    mask = np.triu(np.ones_like(corr_matrix, dtype=bool), k=1)
+                    custom_colors = ["#69e4ff", "#48f1a0"]
+                    custom_cmap = LinearSegmentedColormap.from_list("custom_gradient", custom_colors)
+                    if use_raster:
+                        hm.draw_raster_heatmap(ax, corr_matrix, custom_cmap, min_val, max_val, pixel_budget, mask_upper=True)
+                    else:
+                        sns.heatmap(corr_matrix, mask=mask, cmap=custom_cmap, annot=False, vmin=min_val, vmax=max_val, cbar_kws={'shrink': .8}, ax=ax)
+                    
+                    lower_triangle = corr_matrix.where(np.tril(np.ones(corr_matrix.shape).astype(bool), k=-1))
+                    mean_corr = lower_triangle.stack().mean()
+                    ax.text(0.98, 0.98, f">{mean_corr:.2f}\nMean Pearson\nCorrelation", transform=ax.transAxes,
+                            horizontalalignment='right', verticalalignment='top', fontsize=12, color='black',
+                            bbox=dict(facecolor='white', alpha=0.7, edgecolor='none', boxstyle='round,pad=0.5'))
+                else: # Gráfico cuadrado
+                    show_annotations = num_items <= 10
+                    custom_colors = ["#b9edf9", "#48f1a0"]
+                    custom_cmap = LinearSegmentedColormap.from_list("custom_gradient", custom_colors)
+                    if use_raster:
+                        hm.draw_raster_heatmap(ax, corr_matrix, custom_cmap, min_val, max_val, pixel_budget)
+                    else:
+                        sns.heatmap(corr_matrix, annot=show_annotations, cmap=custom_cmap, ax=ax, fmt='.3f', vmin=min_val, vmax=max_val, linewidths=.5, linecolor='gray')
+
+                if num_items > 2 and not use_raster:
+                    xticks = ax.get_xticklabels()
+                    [label.set_visible(False) for i, label in enumerate(xticks) if i != 0 and i != len(xticks) - 1]
+                    yticks = ax.get_yticklabels()
+                    [label.set_visible(False) for i, label in enumerate(yticks) if i != 0 and i != len(yticks) - 1]
+
+                ax.set_title("Pearson Correlation Matrix (Protein Intensities)")
+                plt.subplots_adjust(left=0.15, bottom=0.15, right=0.9, top=0.9)
+
+                # Incrustar la figura en la ventana
+                current_canvas = FigureCanvasTkAgg(current_fig, master=canvas_frame)
+                current_canvas.draw()
+                current_canvas.get_tk_widget().pack(side="top", fill="both", expand=True)
+
+            # Button to update the chart
+            update_button = customtkinter.CTkButton(filter_frame, text="Update Chart", command=update_chart)
+            update_button.pack(side="left", padx=(20, 10))
+
+            # Correlación de log2 ignorando las proteínas que faltan en cada par de archivos
+            missing_aware_checkbox = customtkinter.CTkCheckBox(filter_frame, text="Log2, ignore missing", variable=missing_aware_var)
+            missing_aware_checkbox.pack(side="left", padx=5)
+
+            # Cómo se reparten los péptidos compartidos por varias proteínas (ver protein_rollup)
+            customtkinter.CTkLabel(filter_frame, text="Shared peptides:").pack(side="left", padx=(10, 5))
+            policy_menu = customtkinter.CTkOptionMenu(filter_frame, values=pr.POLICIES, variable=policy_var, width=90)
+            policy_menu.pack(side="left", padx=5)
+            
+
+            # El lienzo del gráfico ahora se empaqueta después de los filtros (arriba)
+            # y antes de los botones (abajo), por lo que ocupará todo el espacio restante.
+            canvas_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+            def export_chart_data():
+                """Exports the correlation matrix (Excel, CSV/TSV or Parquet, by file extension)."""
+                if current_corr_matrix is None or current_corr_matrix.empty:
+                    messagebox.showwarning("No Data", "There is no correlation data to export.", parent=report_window)
+                    return
+                self.export_in_background(chart_progress_panel, current_corr_matrix, parent=report_window)
+
+            # Button to save the chart as an image
+            save_chart_button = customtkinter.CTkButton(
+                filter_frame, # Mover al frame de filtros superior
+                text="Export Chart (Image)",
+                command=lambda: self.save_figure(current_fig) if current_fig else None
+            )
+            save_chart_button.pack(side="right", padx=(5, 10), pady=5) # Empaquetar a la derecha
+
+            # Mover el botón de exportar datos al frame de filtros superior
+            save_data_button = customtkinter.CTkButton(
+                filter_frame, # Mover al frame de filtros superior
+                text="Export Data",
+                command=export_chart_data
+            )
+            save_data_button.pack(side="right", padx=5, pady=5) # Empaquetar a la derecha
+            
+            # Cerrar la figura de matplotlib al cerrar la ventana para liberar memoria
+            def on_close():
+                if chart_task and not chart_task.finished:
+                    chart_task.cancel()
+                if current_fig:
+                    import matplotlib.pyplot as plt # Ya importado por draw_chart
+                    plt.close(current_fig)
+                report_window.destroy()
+
+            report_window.protocol("WM_DELETE_WINDOW", on_close)
+
+            # Load the initial chart without filters
+            update_chart()
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not generate the report: {e}")
+
+    def generate_heatmap_event(self):
+        """
+        Genera un mapa de calor cuadrado con filtros de fecha.
+        """
+        self._generate_correlation_report(is_triangular=False)
+
+    def generate_triangle_report_event(self):
+        """
+        Genera un mapa de calor triangular con filtros de fecha.
+        """
+        self._generate_correlation_report(is_triangular=True)
+
+    def save_figure(self, fig):
+        """Abre un diálogo para guardar una figura de matplotlib en un archivo."""
+        if not fig:
+            messagebox.showwarning("Warning", "No chart has been generated yet.")
+            return
+
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            filetypes=[
+                ("PNG Image", "*.png"),
+                ("SVG Vector Image", "*.svg"),
+                ("JPEG Image", "*.jpg"),
+                ("PDF Document", "*.pdf"),
+                ("All files", "*.*")
+            ],
+            title="Save Chart As"
+        )
+        if not filepath:
+            return # El usuario canceló
+
+        try:
+            # Guardamos la figura con buena resolución y sin bordes cortados
+            fig.savefig(filepath, dpi=300, bbox_inches='tight')
+            messagebox.showinfo("Success", f"Chart successfully saved to:\n{filepath}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save chart: {e}")
+
+    def generate_pdf_report_event(self):
+        """
+        Genera un reporte en PDF de la tabla de datos que se está mostrando actualmente.
+        """
+        if self.current_df is None or self.current_df.empty:
+            messagebox.showwarning("No Data", "There is no data to generate a report from. Please load some documents first.")
+            return
+
+        # Abrir diálogo para guardar archivo
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[("PDF Documents", "*.pdf"), ("All files", "*.*")],
+            title="Save PDF Report As"
+        )
+
+        if not filepath:
+            return # El usuario canceló el diálogo
+
+        if self.load_progress_panel.task and not self.load_progress_panel.task.finished:
+            messagebox.showwarning("Warning", "Please wait until the current task finishes.")
+            return
+
+        # Los datos y el título del reporte (la métrica) se leen en el hilo de Tk
+        dataframe = self.current_df
+        title = self.metric_selector.get()
+
+        def generate(progress_callback, cancel_event):
+            # --- MEJORA: Preparar datos para el reporte en PDF (en el hilo de trabajo) ---
+
+            # 1. Crear una copia del DataFrame para no modificar el original que se muestra en la GUI.
+            report_df = dataframe.copy()
+
+            # 2. Crear nombres de columna más cortos y un mapa para la leyenda.
+            #    Ej: 'C:\\path\\to\\file.tsv' -> 'file'
+            original_columns = report_df.columns.tolist()
+            short_columns = [os.path.splitext(os.path.basename(col))[0] for col in original_columns]
+
+            # Crear un diccionario de mapeo para la leyenda del PDF
+            column_mapping = {short: full for short, full in zip(short_columns, original_columns)}
+
+            # 3. Renombrar las columnas en la copia del DataFrame.
+            report_df.columns = short_columns
+
+            # 4. Llamar a la función de generación de PDF con los datos mejorados.
+            #    Pasamos el DataFrame modificado, el mapa de columnas y pedimos orientación horizontal.
+            # reportlab y pypdf solo se cargan al generar el primer reporte
+            with perf.timed_import('report_generator'):
+                import report_generator as rg
+            rg.create_pdf_report(
+                filepath=filepath,
+                title=title,
+                dataframe=report_df,
+                column_mapping=column_mapping,
+                max_workers=ANALYSIS_WORKERS, # Las partes del reporte se generan en paralelo
+                progress_callback=progress_callback,
+                cancel_event=cancel_event
+            )
+
+        def on_success(_):
+            messagebox.showinfo("Success", f"Report successfully saved to:\n{filepath}")
+
+        def on_error(e):
+            messagebox.showerror("Error", f"Failed to generate PDF report: {e}")
+
+        operation = perf.start_operation("PDF report", file=os.path.basename(filepath), rows=len(dataframe))
+        self.run_in_background(self.load_progress_panel, "Generating PDF report...", generate, on_success, on_error,
+                               progress_text=lambda done, total: f"Rendered part {done} of {total}...",
+                               operation=operation)
+
+    def export_to_excel_event(self):
+        """
+        Exporta el DataFrame actual a Excel (.xlsx), CSV/TSV o Parquet, según la extensión elegida.
+        """
+        if self.current_df is None or self.current_df.empty:
+            messagebox.showwarning("No Data", "There is no data to export. Please load some documents first.")
+            return
+
+        # El índice (la columna de péptidos) se exporta siempre
+        self.export_in_background(self.load_progress_panel, self.current_df)
@@ -0,0 +1,73 @@
+import threading
+import queue
+import tkinter
+from cancellation import AnalysisCancelled
+
+class BackgroundTask:
+    """
+    Runs a heavy function in a worker thread so the Tk mainloop never blocks.
+
+    The function is called as func(progress_callback, cancel_event). Tk widgets are not
+    thread-safe, so progress and the final result are passed through a queue and
+    delivered on the Tk thread by polling it with widget.after().
+    """
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, widget, func, on_success, on_error=None, on_progress=None, on_finish=None):
+        self.widget = widget
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+        self.cancel_event = threading.Event()
+        self.finished = False
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(func,), daemon=True)
+        self._thread.start()
+        self.widget.after(self.POLL_INTERVAL_MS, self._poll)
+
+    def cancel(self):
+        """Asks the worker to stop; the remaining files will not be read."""
+        self.cancel_event.set()
+
+    def _report_progress(self, done, total):
+        self._queue.put(('progress', (done, total)))
+
+    def _run(self, func):
+        try:
+            result = func(self._report_progress, self.cancel_event)
+            self._queue.put(('success', result))
+        except AnalysisCancelled:
+            self._queue.put(('cancelled', None))
+        except Exception as e:
+            self._queue.put(('error', e))
+
+    def _poll(self):
+        try:
+            while True:
+                kind, payload = self._queue.get_nowait()
+                if kind == 'progress':
+                    if self.on_progress and not self.cancel_event.is_set():
+                        self.on_progress(*payload)
+                    continue
+                self._finish(kind, payload)
+                return
+        except queue.Empty:
+            pass
+        try:
+            self.widget.after(self.POLL_INTERVAL_MS, self._poll)
+        except tkinter.TclError:
+            # The widget was destroyed while the task was running
+            self.cancel()
+
+    def _finish(self, kind, payload):
+        self.finished = True
+        if self.on_finish:
+            self.on_finish()
+        # A cancelled task never delivers its result, even if it completed meanwhile
+        if self.cancel_event.is_set():
+            return
+        if kind == 'success':
+            self.on_success(payload)
+        elif kind == 'error' and self.on_error:
+            self.on_error(payload)
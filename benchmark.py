@@ -0,0 +1,317 @@
+"""
+Benchmark of the analysis pipeline over synthetic and real lfq.tsv groups.
+
+Synthetic groups are shaped like the files in client_data/Todos (peptide, charge,
+proteins, q_value, score, spectral_angle and one intensity column per run) and are
+generated from a seed, so every version of the code is measured on the same data.
+Every stage runs in its own process, so its peak RSS is not hidden by the stages
+before it; the peak of its largest pool worker (RUSAGE_CHILDREN, where available)
+is reported next to it. The results are appended to a JSON history and compared with the last
+entry for the same dataset:
+
+    python benchmark.py --runs 40 --peptides 20000 --overlap 0.6
+    python benchmark.py --group "client_data/Todos" --stages process_tsv_files,corr
+"""
+import os
+import json
+import queue as queue_module
+import time
+import glob
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, date, timedelta
+import numpy as np
+import pandas as pd
+import instrumentation as perf
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_history.json")
+AMINO_ACIDS = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+STAGES = ['process_single_tsv', 'process_tsv_files', 'protein_matrix', 'corr', 'corr_log2', 'pdf_report']
+
+# --- SYNTHETIC GROUPS ---
+
+def _peptides(count, rng):
+    """Random peptide sequences (7 to 30 residues, ending in K or R like tryptic peptides)."""
+    lengths = rng.integers(7, 31, size=count)
+    letters = AMINO_ACIDS[rng.integers(0, len(AMINO_ACIDS), size=lengths.sum())]
+    ends = np.cumsum(lengths)
+    sequences = [''.join(letters[end - length:end - 1]) for end, length in zip(ends, lengths)]
+    tails = rng.choice(['K', 'R'], size=count)
+    # The index makes every sequence unique
+    return [f"{sequence}{i:X}{tail}" for i, (sequence, tail) in enumerate(zip(sequences, tails))]
+
+def _protein_groups(count, fanout, n_proteins, rng):
+    """Protein group of every peptide: 1 + Poisson(fanout - 1) semicolon-separated accessions."""
+    sizes = 1 + rng.poisson(max(fanout - 1, 0), size=count)
+    accessions = rng.integers(0, n_proteins, size=sizes.sum())
+    ends = np.cumsum(sizes)
+    return [';'.join(f"sp|P{a:05d}|PROT{a}_HUMAN" for a in accessions[end - size:end])
+            for end, size in zip(ends, sizes)]
+
+def generate_group(directory, runs=40, peptides=20000, overlap=0.6, fanout=1.15, seed=0):
+    """
+    Writes a synthetic group of 'runs' lfq.tsv files to 'directory' and returns their paths.
+    Every run observes 'peptides' peptides drawn from a shared universe of peptides/overlap,
+    so two runs share about 'overlap' of their peptides. Peptides map to protein groups of
+    'fanout' proteins on average, and have one to three charge states (rows).
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    universe = max(peptides, int(peptides / max(overlap, 1e-3)))
+    sequences = np.array(_peptides(universe, rng), dtype=object)
+    proteins = np.array(_protein_groups(universe, fanout, max(universe // 8, 1), rng), dtype=object)
+    abundance = rng.lognormal(mean=11, sigma=2, size=universe) # Intensidad típica de cada péptido
+
+    paths = []
+    first_day = date(2024, 1, 1)
+    for run in range(runs):
+        run_name = f"{(first_day + timedelta(days=run)).strftime('%Y%m%d')}_Synthetic_run{run:04d}"
+        path = os.path.join(directory, f"{run_name}__lfq.tsv")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        chosen = rng.choice(universe, size=min(peptides, universe), replace=False)
+        charges = rng.integers(1, 4, size=len(chosen))
+        rows = np.repeat(chosen, charges)
+        frame = pd.DataFrame({
+            'peptide': sequences[rows],
+            'charge': np.concatenate([np.arange(2, 2 + c) for c in charges]).astype(np.int8),
+            'proteins': proteins[rows],
+            'q_value': rng.uniform(0, 0.2, size=len(rows)),
+            'score': rng.uniform(0.3, 1.0, size=len(rows)),
+            'spectral_angle': rng.uniform(0.3, 1.0, size=len(rows)),
+            f"{run_name}.mzML": abundance[rows] * rng.lognormal(0, 0.5, size=len(rows)),
+        })
+        frame = frame.iloc[rng.permutation(len(frame))]
+        temp_path = path + '.part'
+        frame.to_csv(temp_path, sep='\t', index=False)
+        os.replace(temp_path, path)
+    return paths
+
+def synthetic_group_dir(params, base_dir=None):
+    """Folder of the synthetic group for some parameters (it is reused while they do not change)."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(base_dir or tempfile.gettempdir(), f"tsv_benchmark_{digest}")
+
+# --- MEASUREMENT ---
+
+def _column_names(files):
+    return [os.path.splitext(os.path.basename(f))[0] for f in files]
+
+def _stage_process_single_tsv(files, options):
+    import analysis as an
+    sample = files[:min(len(files), 10)]
+    start = time.perf_counter()
+    for path in sample:
+        an.process_single_tsv(path, 'Peptide', options['metric'])
+    return {'seconds': (time.perf_counter() - start) / len(sample), 'files': len(sample)}
+
+def _stage_process_tsv_files(files, options):
+    import analysis as an
+    results = {}
+    for metric in an.AGGREGATION_STRATEGIES:
+        an.clear_group_cache() # Cada métrica se mide desde cero (lectura de los archivos incluida)
+        start = time.perf_counter()
+        table = an.process_tsv_files(files, _column_names(files), 'Peptide', metric,
+                                     max_workers=options['workers'], sparse=options['sparse'])
+        results[metric] = {'seconds': time.perf_counter() - start, 'shape': list(table.shape)}
+    # Cambiar de métrica con el grupo ya en memoria
+    start = time.perf_counter()
+    an.process_tsv_files(files, _column_names(files), 'Peptide', options['metric'],
+                         max_workers=options['workers'], sparse=options['sparse'])
+    results['cached metric switch'] = {'seconds': time.perf_counter() - start}
+    return {'seconds': sum(r['seconds'] for m, r in results.items() if m != 'cached metric switch'),
+            'metrics': results}
+
+def _stage_protein_matrix(files, options):
+    import analysis as an
+    start = time.perf_counter()
+    matrix = an.get_protein_intensity_matrix(files, max_workers=options['workers'], sparse=True,
+                                              policy=options['policy'])
+    return {'seconds': time.perf_counter() - start, 'shape': list(matrix.shape)}
+
+def _stage_corr(files, options, missing_aware=False):
+    import analysis as an
+    from correlation import CorrelationStats
+    matrix = an.get_protein_intensity_matrix(files, max_workers=options['workers'], sparse=True,
+                                              policy=options['policy'])
+    start = time.perf_counter()
+    # Estadísticas de todas las ejecuciones desde cero y la correlación que pide la aplicación
+    stats = CorrelationStats()
+    stats.update(matrix, matrix.columns)
+    an.get_protein_correlation({'matrix': matrix, 'stats': stats}, range(matrix.shape[1]), missing_aware=missing_aware)
+    return {'seconds': time.perf_counter() - start, 'runs': matrix.shape[1]}
+
+def _stage_pdf_report(files, options):
+    import analysis as an
+    import report_generator as rg
+    table = an.process_tsv_files(files, _column_names(files), 'Peptide', 'Total Intensity',
+                                 max_workers=options['workers'], sparse=True)
+    table = table.iloc[:options['pdf_rows']]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        start = time.perf_counter()
+        rg.create_pdf_report(os.path.join(temp_dir, "report.pdf"), "Total Intensity", table,
+                             max_workers=options['workers'])
+        seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'shape': list(table.shape)}
+
+STAGE_FUNCTIONS = {
+    'process_single_tsv': _stage_process_single_tsv,
+    'process_tsv_files': _stage_process_tsv_files,
+    'protein_matrix': _stage_protein_matrix,
+    'corr': _stage_corr,
+    'corr_log2': lambda files, options: _stage_corr(files, options, missing_aware=True),
+    'pdf_report': _stage_pdf_report,
+}
+
+def _run_stage(stage, files, options, queue):
+    try:
+        if options.get('cache_dir'):
+            import run_cache
+            run_cache.CACHE_DIR = options['cache_dir']
+        result = STAGE_FUNCTIONS[stage](files, options)
+        result['peak_rss_mb'] = perf.peak_rss_mb()
+        result['peak_children_rss_mb'] = perf.peak_rss_mb(children=True) # The largest pool worker
+        queue.put(result)
+    except Exception as e:
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+
+def run_stage(stage, files, options):
+    """Runs one stage in a new process and returns its result (time, peak RSS and details)."""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_stage, args=(stage, files, options, queue))
+    process.start()
+    # A stage that dies (e.g. killed for running out of memory) never puts its result
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except queue_module.Empty:
+            if not process.is_alive():
+                try:
+                    result = queue.get(timeout=1) # Put just before exiting
+                except queue_module.Empty:
+                    result = {'error': f"The stage process exited with code {process.exitcode} without a result"}
+                break
+    process.join()
+    return result
+
+# --- HISTORY ---
+
+def load_history(path=HISTORY_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def save_history(history, path=HISTORY_FILE):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=1)
+    os.replace(temp_path, path)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _change(new, old):
+    if new is None or not old:
+        return ""
+    return f" ({(new - old) / old:+.0%})"
+
+def print_results(entry, previous=None):
+    """Prints the time and peak RSS of every stage, with the change since 'previous' (same dataset)."""
+    previous_results = previous['results'] if previous else {}
+    print(f"{'stage':<22} {'seconds':>18} {'peak RSS (MB)':>20} {'worker peak (MB)':>20}")
+    for stage, result in entry['results'].items():
+        if 'error' in result:
+            print(f"{stage:<22} {result['error']}")
+            continue
+        old = previous_results.get(stage, {})
+        seconds = f"{result['seconds']:.3f}{_change(result['seconds'], old.get('seconds'))}"
+        rss_texts = []
+        for field in ['peak_rss_mb', 'peak_children_rss_mb']:
+            rss = result.get(field)
+            rss_texts.append(f"{rss:.0f}{_change(rss, old.get(field))}" if rss else "n/a")
+        print(f"{stage:<22} {seconds:>18} {rss_texts[0]:>20} {rss_texts[1]:>20}")
+        for metric, detail in result.get('metrics', {}).items():
+            old_seconds = old.get('metrics', {}).get(metric, {}).get('seconds')
+            print(f"  {metric:<20} {detail['seconds']:.3f}{_change(detail['seconds'], old_seconds)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the lfq.tsv analysis pipeline.")
+    parser.add_argument('--group', action='append', default=[],
+                        help="Folder of a real group to benchmark (repeatable). Without it a synthetic group is used.")
+    parser.add_argument('--runs', type=int, default=40, help="Runs of the synthetic group.")
+    parser.add_argument('--peptides', type=int, default=20000, help="Peptides per synthetic run.")
+    parser.add_argument('--overlap', type=float, default=0.6, help="Fraction of peptides shared by two synthetic runs.")
+    parser.add_argument('--fanout', type=float, default=1.15, help="Average proteins per peptide in the synthetic group.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=None, help="Where synthetic groups are written (default: temp folder).")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Comma-separated stages: {', '.join(STAGES)}.")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) - 1))
+    parser.add_argument('--metric', default='Total Intensity', help="Metric of the process_single_tsv stage.")
+    parser.add_argument('--policy', default='first', help="Shared-peptide policy of the protein stages (see protein_rollup).")
+    parser.add_argument('--dense', action='store_true', help="Build dense tables in process_tsv_files.")
+    parser.add_argument('--pdf-rows', type=int, default=2000, help="Rows of the table rendered by pdf_report.")
+    parser.add_argument('--cache-dir', default=None, help="Keep the group stores in this cache folder (default: no cache).")
+    parser.add_argument('--label', default=None, help="Free text stored with the results (e.g. a branch name).")
+    parser.add_argument('--history', default=HISTORY_FILE, help="JSON history file.")
+    parser.add_argument('--no-save', action='store_true', help="Do not append the results to the history.")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGE_FUNCTIONS]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    if args.group:
+        datasets = [({'group': os.path.abspath(g)}, sorted(glob.glob(os.path.join(g, '*.tsv')))) for g in args.group]
+    else:
+        params = {'runs': args.runs, 'peptides': args.peptides, 'overlap': args.overlap,
+                  'fanout': args.fanout, 'seed': args.seed}
+        directory = synthetic_group_dir(params, args.data_dir)
+        print(f"Synthetic group: {directory}")
+        datasets = [({'synthetic': params}, generate_group(directory, **params))]
+
+    options = {'workers': args.workers, 'metric': args.metric, 'sparse': not args.dense, 'policy': args.policy,
+               'pdf_rows': args.pdf_rows, 'cache_dir': args.cache_dir}
+    history = load_history(args.history)
+    for dataset, files in datasets:
+        if not files:
+            print(f"No .tsv files in {dataset}")
+            continue
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'label': args.label,
+            'commit': _git_commit(),
+            'dataset': dataset,
+            'files': len(files),
+            'options': options,
+            'versions': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__},
+            'platform': platform.platform(),
+            'results': {},
+        }
+        print(f"\n{dataset} - {len(files)} files")
+        for stage in stages:
+            entry['results'][stage] = run_stage(stage, files, options)
+        # Se compara con la última medida del mismo conjunto de datos y opciones
+        previous = next((e for e in reversed(history)
+                         if e['dataset'] == dataset and e.get('options') == options), None)
+        print_results(entry, previous)
+        history.append(entry)
+    if not args.no_save:
+        save_history(history, args.history)
+        print(f"\nResults saved to {args.history}")
+
+if __name__ == "__main__":
+    main()
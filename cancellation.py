@@ -0,0 +1,7 @@
+# --- CANCELLATION ---
+# Long operations (analysis, import, export) accept a cancel_event (threading.Event)
+# and raise AnalysisCancelled when it is set. This module has no dependencies, so the
+# importer and the GUI can catch it without loading the analysis stack.
+
+class AnalysisCancelled(Exception):
+    """Raised when an analysis is stopped through its cancel_event."""
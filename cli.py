@@ -0,0 +1,211 @@
+"""
+Headless entry point: processes groups of client_data without the GUI.
+
+For every group it builds the peptide table of each requested metric, the protein
+intensity matrix and the correlation matrix of the runs (optionally filtered by date),
+exports them to --output-dir and reports the time of every stage as JSON. No GUI
+module (customtkinter, matplotlib, seaborn) is imported, so it can run on a server:
+
+    python cli.py --all --output-dir exports --format parquet --jobs 2 --workers 4
+    python cli.py "APEM ION 26" --metric "Total Intensity" --metric Count --timings timings.json
+
+The same steps are available from Python with process_group() and process_groups().
+"""
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import analysis as an
+import database as db
+import exporter
+import run_cache
+import protein_rollup as pr
+import instrumentation as perf
+
+DEFAULT_BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORKERS = 1
+OUTPUT_FORMATS = ['csv', 'tsv', 'xlsx', 'parquet']
+PRODUCTS = ['peptides', 'proteins', 'correlation']
+
+def setup(base_path=DEFAULT_BASE_PATH, sync=True):
+    """Points the data index and the cache folder at base_path (the folder that holds client_data)."""
+    db.set_data_dir(base_path)
+    if sync:
+        db.initialize_database()
+        db.sync_index() # Picks up the files added or modified outside the application
+    run_cache.set_cache_dir(base_path)
+
+def _file_stem(text):
+    """A file name for a group or metric name (path separators are not allowed)."""
+    return "".join("_" if c in '<>:"/\\|?*' else c for c in text).strip()
+
+def _export(dataframe, output_dir, name, file_format):
+    path = os.path.join(output_dir, f"{_file_stem(name)}.{file_format}")
+    stats = exporter.export_dataframe(dataframe, path)
+    return {'file': path, 'rows': stats['rows'], 'columns': dataframe.shape[1], 'seconds': stats['seconds']}
+
+def process_group(group, output_dir=None, metrics=('Total Intensity',), products=PRODUCTS, file_format='csv',
+                  start_date=None, end_date=None, missing_aware=False, policy=pr.DEFAULT_POLICY,
+                  max_workers=DEFAULT_WORKERS):
+    """
+    Runs the analysis of one group of client_data (setup() must have been called).
+
+    Builds the peptide table of every metric in 'metrics', the protein intensity matrix
+    and the correlation matrix of the runs between start_date and end_date, and writes
+    them to output_dir/<group>/ in 'file_format' (nothing is written if output_dir is None).
+    'products' selects which of 'peptides', 'proteins' and 'correlation' are built, and
+    'policy' is the shared-peptide policy of the protein intensities (see protein_rollup).
+    Returns the timings of the operation (see instrumentation.Operation.to_dict) with
+    the 'group', its 'outputs' and, if it failed, the 'error'.
+    """
+    runs = db.get_client_runs(group)
+    tsv_files = [run['path'] for run in runs]
+    signatures = [run['signature'] for run in runs]
+    column_names = [os.path.splitext(os.path.basename(f))[0] for f in tsv_files]
+    group_dir = os.path.join(output_dir, _file_stem(group)) if output_dir else None
+    if group_dir:
+        os.makedirs(group_dir, exist_ok=True)
+
+    outputs = []
+    error = None
+    op = perf.start_operation("Batch group", group=group, files=len(tsv_files), workers=max_workers)
+    try:
+        with perf.activate(op):
+            if not tsv_files:
+                raise ValueError(f"The group '{group}' has no .tsv files.")
+
+            if 'peptides' in products:
+                for metric in metrics:
+                    with perf.span("peptide table", metric=metric):
+                        table = an.process_tsv_files(tsv_files, column_names, default_peptide_column='Peptide',
+                                                     metric_column=metric, max_workers=max_workers,
+                                                     sparse=True, signatures=signatures)
+                    if group_dir:
+                        outputs.append(_export(table, group_dir, metric, file_format))
+                    del table
+
+            if 'proteins' in products or 'correlation' in products:
+                with perf.span("protein matrix", policy=policy):
+                    protein_group = an.get_protein_group(tsv_files, dates=[run['acquisition_date'] for run in runs],
+                                                         signatures=signatures, max_workers=max_workers, policy=policy)
+
+                if 'proteins' in products and group_dir:
+                    with perf.span("protein frame"):
+                        proteins = protein_group['matrix'].to_frame(sparse=True)
+                        proteins.index.name = 'Protein'
+                    outputs.append(_export(proteins, group_dir, "proteins", file_format))
+                    del proteins
+
+                if 'correlation' in products:
+                    positions = an.select_runs_by_date(protein_group['dates'], start_date, end_date)
+                    if len(positions) < 2:
+                        raise ValueError("At least 2 runs with protein intensities in the selected date range "
+                                         "are required for the correlation matrix.")
+                    with perf.span("correlation", runs=len(positions), missing_aware=missing_aware):
+                        corr = an.get_protein_correlation(protein_group, positions, missing_aware=missing_aware)
+                    if group_dir:
+                        outputs.append(_export(corr, group_dir, "correlation", file_format))
+    except Exception as e:
+        # activate() ya ha cerrado la operación con el nombre de la excepción
+        error = f"{type(e).__name__}: {e}"
+    op.finish()
+
+    result = op.to_dict()
+    result.update({'group': group, 'outputs': outputs, 'error': error})
+    return result
+
+def _init_group_worker(base_path):
+    # El índice ya se ha sincronizado en el proceso principal
+    setup(base_path, sync=False)
+
+def process_groups(groups, jobs=1, base_path=DEFAULT_BASE_PATH, on_result=None, **options):
+    """
+    Runs process_group() for every group, 'jobs' groups at a time (each one in its own
+    process when jobs > 1, with up to max_workers processes of its own to read the files).
+    on_result(result) is called as every group finishes. Returns the results in input order.
+    """
+    results = [None] * len(groups)
+    if jobs <= 1 or len(groups) < 2:
+        for i, group in enumerate(groups):
+            results[i] = process_group(group, **options)
+            if on_result:
+                on_result(results[i])
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(groups)), initializer=_init_group_worker,
+                             initargs=(base_path,)) as executor:
+        futures = {executor.submit(process_group, group, **options): i for i, group in enumerate(groups)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if on_result:
+                on_result(results[futures[future]])
+    return results
+
+def _print_result(result):
+    """One line per group on stderr (stdout is kept for the JSON timings)."""
+    status = "ok" if result['error'] is None else f"FAILED ({result['error']})"
+    print(f"{result['group']}: {result['fields']['files']} files, {result['seconds']:.1f} s, "
+          f"peak {result['peak_rss_mb'] or 0:.0f} MB - {status}", file=sys.stderr)
+    for output in result['outputs']:
+        print(f"  {output['file']} ({output['rows']:,} rows, {output['seconds']:.1f} s)", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process groups of lfq.tsv files without the GUI.")
+    parser.add_argument('groups', nargs='*', help="Names of the groups (folders of client_data).")
+    parser.add_argument('--all', action='store_true', help="Process every group.")
+    parser.add_argument('--base-path', default=DEFAULT_BASE_PATH, help="Folder that contains client_data.")
+    parser.add_argument('--output-dir', default=None, help="Export the tables to this folder (one subfolder per group).")
+    parser.add_argument('--format', default='csv', choices=OUTPUT_FORMATS, help="Format of the exported tables.")
+    parser.add_argument('--metric', action='append', default=[],
+                        help=f"Metric of the peptide table (repeatable; default: Total Intensity). "
+                             f"One of: {', '.join(an.AGGREGATION_STRATEGIES)}, or 'all'.")
+    parser.add_argument('--products', default=','.join(PRODUCTS),
+                        help=f"Comma-separated outputs to build: {', '.join(PRODUCTS)}.")
+    parser.add_argument('--start', type=date.fromisoformat, default=None, help="First run date of the correlation (YYYY-MM-DD).")
+    parser.add_argument('--end', type=date.fromisoformat, default=None, help="Last run date of the correlation (YYYY-MM-DD).")
+    parser.add_argument('--policy', default=pr.DEFAULT_POLICY, choices=pr.POLICIES,
+                        help="How the intensity of a peptide shared by several proteins is assigned.")
+    parser.add_argument('--missing-aware', action='store_true', help="Correlate log2 intensities of the shared proteins only.")
+    parser.add_argument('--jobs', type=int, default=1, help="Groups processed at the same time.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Processes that read the files of each group.")
+    parser.add_argument('--timings', default='-', help="Write the JSON timings to this file ('-': standard output).")
+    args = parser.parse_args(argv)
+
+    metrics = args.metric or ['Total Intensity']
+    if 'all' in metrics:
+        metrics = list(an.AGGREGATION_STRATEGIES)
+    unknown = [m for m in metrics if m not in an.AGGREGATION_STRATEGIES]
+    if unknown:
+        parser.error(f"Unknown metrics: {', '.join(unknown)}")
+    products = [p.strip() for p in args.products.split(',') if p.strip()]
+    unknown = [p for p in products if p not in PRODUCTS]
+    if unknown:
+        parser.error(f"Unknown products: {', '.join(unknown)}")
+
+    setup(args.base_path)
+    groups = db.get_clients() if args.all else args.groups
+    if not groups:
+        parser.error("Give the names of the groups or --all.")
+    missing = [g for g in groups if g not in db.get_clients()]
+    if missing:
+        parser.error(f"Unknown groups: {', '.join(missing)}")
+
+    results = process_groups(
+        groups, jobs=args.jobs, base_path=args.base_path, on_result=_print_result,
+        output_dir=args.output_dir, metrics=metrics, products=products, file_format=args.format,
+        start_date=args.start, end_date=args.end, missing_aware=args.missing_aware, policy=args.policy,
+        max_workers=args.workers,
+    )
+
+    timings = json.dumps({'jobs': args.jobs, 'workers': args.workers, 'groups': results}, indent=2, default=str)
+    if args.timings == '-':
+        print(timings)
+    else:
+        with open(args.timings, 'w', encoding='utf-8') as f:
+            f.write(timings)
+    return 0 if all(result['error'] is None for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
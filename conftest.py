@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import analysis as an
+import run_cache
+
+# Shared fixtures of the tests: a small synthetic group of lfq.tsv files (peptide, charge,
+# proteins, q_value, score, spectral_angle and the intensity of the run as the last column).
+
+def write_group(directory, runs=5, peptides=200, seed=0):
+    """Writes 'runs' lfq.tsv files drawing from a shared set of peptides and returns their paths."""
+    rng = np.random.default_rng(seed)
+    universe = peptides * 2
+    sequences = np.array([f"PEP{i:05d}K" for i in range(universe)], dtype=object)
+    # One to three proteins per peptide, so some peptides are shared
+    proteins = np.array([';'.join(f"sp|P{p:04d}|PROT{p}" for p in rng.integers(0, universe // 6, size=rng.integers(1, 4)))
+                         for _ in range(universe)], dtype=object)
+    paths = []
+    for run in range(runs):
+        name = f"2024010{run + 1}_run{run}"
+        chosen = rng.choice(universe, size=peptides, replace=False)
+        charges = rng.integers(1, 4, size=peptides)
+        rows = np.repeat(chosen, charges)
+        frame = pd.DataFrame({
+            'peptide': sequences[rows],
+            'charge': np.concatenate([np.arange(2, 2 + c) for c in charges]),
+            'proteins': proteins[rows],
+            'q_value': rng.uniform(0, 0.2, size=len(rows)),
+            'score': rng.uniform(0.3, 1.0, size=len(rows)),
+            'spectral_angle': rng.uniform(0.3, 1.0, size=len(rows)),
+            f"{name}.mzML": rng.lognormal(10, 2, size=len(rows)),
+        }).sample(frac=1, random_state=run)
+        path = os.path.join(directory, f"{name}.tsv")
+        frame.to_csv(path, sep='\t', index=False)
+        paths.append(path)
+    return paths
+
+def column_names(files):
+    return [os.path.splitext(os.path.basename(f))[0] for f in files]
+
+@pytest.fixture(scope="module")
+def group_files(tmp_path_factory):
+    return write_group(str(tmp_path_factory.mktemp("group")), seed=3)
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    """Every test starts without cached groups and without a cache folder."""
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', None)
+    an.clear_group_cache()
+    yield
+    an.clear_group_cache()
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+class CorrelationStats:
+    """
+    Cached sufficient statistics for the Pearson correlations between the runs
+    (columns) of a SparseMatrix of intensities, where a stored cell means 'observed'.
+
+    Two correlations are available:
+      - corr(): missing intensities count as 0 (the classic zero-filled report).
+      - log_corr(): log2 intensities, using for each pair of runs only the rows observed
+        in both runs (missing-aware, pairwise complete observations).
+
+    Per-run sums and the pairwise cross-products and overlap counts are kept for every
+    run, so adding runs only computes their new rows/columns of the statistics, and
+    selecting a subset of runs (e.g. by date) is pure indexing.
+    """
+    BLOCK_ROWS = 20000 # Rows densified at a time while accumulating the cross-products
+
+    def __init__(self):
+        self.keys = []                    # Identifier of every run (e.g. its file signature)
+        self.sums = np.zeros(0)           # Σx of every run
+        self.cross = np.zeros((0, 0))     # Σ x_j x_k over all rows
+        self.log_shift = np.zeros(0)      # Mean log2 of every run, subtracted for conditioning
+        self.counts = np.zeros((0, 0))    # Rows observed in both runs j and k
+        self.log_sums = np.zeros((0, 0))  # Σ log x_j over the rows observed in both j and k
+        self.log_sumsq = np.zeros((0, 0)) # Σ (log x_j)² over the rows observed in both j and k
+        self.log_cross = np.zeros((0, 0)) # Σ log x_j log x_k over the rows observed in both
+
+    def update(self, matrix, keys):
+        """
+        Brings the statistics in line with 'matrix', whose columns are identified by 'keys'.
+        Statistics of known keys are reused; only the new columns are computed.
+        """
+        keys = list(keys)
+        old_positions = {key: i for i, key in enumerate(self.keys)}
+        kept = np.array([j for j, key in enumerate(keys) if key in old_positions], dtype=np.int64)
+        added = [j for j, key in enumerate(keys) if key not in old_positions]
+        old = np.array([old_positions[keys[j]] for j in kept], dtype=np.int64)
+
+        size = len(keys)
+        sums = np.bincount(matrix.indices, weights=matrix.data.astype(np.float64), minlength=size)
+        log_shift = np.zeros(size)
+        log_shift[kept] = self.log_shift[old]
+        if added:
+            log_values = np.log2(matrix.data.astype(np.float64))
+            log_means = np.bincount(matrix.indices, weights=log_values, minlength=size) / np.maximum(matrix.column_counts(), 1)
+            log_shift[added] = log_means[added]
+
+        def reuse(stat):
+            result = np.zeros((size, size))
+            result[np.ix_(kept, kept)] = stat[np.ix_(old, old)]
+            return result
+
+        cross, counts = reuse(self.cross), reuse(self.counts)
+        log_sums, log_sumsq, log_cross = reuse(self.log_sums), reuse(self.log_sumsq), reuse(self.log_cross)
+
+        if added:
+            for _, block in matrix.iter_row_blocks(self.BLOCK_ROWS):
+                values = block.astype(np.float64)
+                observed = values != matrix.fill_value
+                logs = np.zeros_like(values)
+                logs[observed] = np.log2(values[observed])
+                logs = np.where(observed, logs - log_shift, 0.0)
+                observed = observed.astype(np.float64)
+
+                new_values, new_observed, new_logs = values[:, added], observed[:, added], logs[:, added]
+                cross[:, added] += values.T @ new_values
+                counts[:, added] += observed.T @ new_observed
+                log_cross[:, added] += logs.T @ new_logs
+                # Not symmetric: the new runs' sums over the rows shared with the kept runs too
+                log_sums[:, added] += logs.T @ new_observed
+                log_sums[np.ix_(added, kept)] += new_logs.T @ observed[:, kept]
+                log_sumsq[:, added] += (logs ** 2).T @ new_observed
+                log_sumsq[np.ix_(added, kept)] += (new_logs ** 2).T @ observed[:, kept]
+
+            # The symmetric statistics are mirrored instead of computed twice
+            for stat in (cross, counts, log_cross):
+                stat[added, :] = stat[:, added].T
+
+        self.keys = keys
+        self.sums, self.log_shift = sums, log_shift
+        self.cross, self.counts = cross, counts
+        self.log_sums, self.log_sumsq, self.log_cross = log_sums, log_sumsq, log_cross
+
+    def corr(self, positions, n_rows, columns=None):
+        """
+        Zero-filled Pearson correlation between the runs at 'positions', over 'n_rows' rows
+        (the rows observed in at least one of those runs).
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        sums = self.sums[positions]
+        cov = self.cross[np.ix_(positions, positions)] - np.outer(sums, sums) / max(n_rows, 1)
+        variance = np.diag(cov)
+        corr = self._pearson(cov, np.outer(variance, variance))
+        return pd.DataFrame(corr, index=columns, columns=columns)
+
+    def log_corr(self, positions, min_overlap=3, columns=None):
+        """
+        Missing-aware Pearson correlation of log2 intensities between the runs at 'positions'.
+        Pairs of runs with fewer than 'min_overlap' rows observed in both are NaN.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        index = np.ix_(positions, positions)
+        n = self.counts[index]
+        sx, sxx = self.log_sums[index], self.log_sumsq[index]
+        sy, syy = sx.T, sxx.T
+        cov = n * self.log_cross[index] - sx * sy
+        corr = self._pearson(cov, (n * sxx - sx ** 2) * (n * syy - sy ** 2))
+        corr[n < min_overlap] = np.nan
+        return pd.DataFrame(corr, index=columns, columns=columns)
+
+    @staticmethod
+    def _pearson(cov, variance_product):
+        # Constant runs (zero variance) give NaN, like DataFrame.corr()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = cov / np.sqrt(variance_product)
+        return np.clip(corr, -1.0, 1.0)
@@ -1,36 +1,231 @@
 import os
 import shutil
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+from datetime import datetime, date
 
 # Variable para el directorio de datos. Será establecida por main.py
 # para asegurar que los datos se guarden junto al ejecutable.
 DATA_DIR = None
 
+# --- ÍNDICE DE METADATOS ---
+# Un archivo SQLite en DATA_DIR guarda los grupos y, para cada archivo .tsv, su tamaño,
+# fecha de modificación, hash, instrumento, fecha de adquisición, muestra, número de filas
+# y columnas. Así listar grupos y archivos o filtrar por fecha son consultas indexadas
+# en lugar de recorrer las carpetas. Las consultas confían en el índice: lo actualizan
+# todas las funciones de este módulo que modifican los datos y la importación, y
+# sync_index() lo concilia con las carpetas (la aplicación lo llama en segundo plano al
+# arrancar y al pulsar Refresh). La conciliación solo lee la cabecera de los archivos
+# nuevos o modificados; el hash y el número de filas los calcula la importación.
+INDEX_NAME = "index.sqlite"
+
+# Formatos de fecha al inicio del nombre de los archivos (los importados usan el primero)
+RUN_DATE_FORMATS = ['%Y-%m-%d', '%Y%m%d']
+
+_write_lock = threading.Lock() # La importación escribe en el índice desde varios hilos
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS runs (
+    group_name TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    instrument TEXT,
+    acquisition_date TEXT,      -- YYYY-MM-DD
+    acquisition_datetime TEXT,  -- ISO, when known (from payload.json)
+    sample_name TEXT,
+    row_count INTEGER,
+    columns TEXT,               -- Column names separated by tabs
+    PRIMARY KEY (group_name, file_name)
+);
+CREATE INDEX IF NOT EXISTS runs_by_date ON runs (group_name, acquisition_date);
+CREATE INDEX IF NOT EXISTS runs_by_hash ON runs (hash);
+"""
+
 def set_data_dir(base_path):
     """Establece la ruta del directorio de datos principal."""
     global DATA_DIR
     DATA_DIR = os.path.join(base_path, "client_data")
 
 def initialize_database():
-    """Asegura que el directorio de datos principal exista."""
+    """Asegura que el directorio de datos principal y su índice existan (sin conciliarlo, ver sync_index)."""
     if DATA_DIR is None:
         raise RuntimeError("El directorio de datos no ha sido inicializado. Llama a set_data_dir() primero.")
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
+    with _write_lock, closing(_connect()) as connection, connection:
+        connection.executescript(_SCHEMA)
+
+def _connect():
+    connection = sqlite3.connect(os.path.join(DATA_DIR, INDEX_NAME), timeout=30)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+def get_run_date(file_name):
+    """Devuelve la fecha al inicio del nombre de un archivo ('YYYY-MM-DD_...' o 'YYYYMMDD_...'), o None."""
+    prefix = os.path.basename(file_name).split('_')[0]
+    for date_format in RUN_DATE_FORMATS:
+        try:
+            return datetime.strptime(prefix, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """Devuelve el SHA-1 del contenido de un archivo."""
+    return describe_file(file_path, chunk_size)['hash']
+
+def describe_file(file_path, chunk_size=1 << 20):
+    """
+    Lee un archivo .tsv una sola vez y devuelve su 'hash' (SHA-1), su número de filas
+    de datos ('row_count') y sus nombres de columna ('columns').
+    """
+    digest = hashlib.sha1()
+    lines = 0
+    header = b''
+    last_byte = b'\n'
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            if not header:
+                header = chunk.split(b'\n', 1)[0]
+            digest.update(chunk)
+            lines += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+    if last_byte != b'\n':
+        lines += 1 # Última línea sin salto de línea
+    columns = header.decode('utf-8', errors='replace').rstrip('\r').split('\t') if header else []
+    return {'hash': digest.hexdigest(), 'row_count': max(lines - 1, 0), 'columns': columns}
+
+def read_columns(file_path):
+    """Devuelve los nombres de columna de un archivo .tsv (solo lee la primera línea)."""
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+    return header.decode('utf-8', errors='replace').rstrip('\r\n').split('\t') if header else []
+
+def index_run(client_name, file_name, content=None, instrument=None, acquisition_datetime=None, sample_name=None):
+    """
+    Guarda en el índice los metadatos de un archivo de un cliente.
+    'content' es el resultado de describe_file() si ya se ha calculado (la importación);
+    si no, solo se leen las columnas y el hash y el número de filas quedan vacíos.
+    Si no se indica la fecha de adquisición, se toma del nombre del archivo.
+    """
+    file_path = os.path.join(DATA_DIR, client_name, file_name)
+    stat = os.stat(file_path)
+    content = content or {'hash': None, 'row_count': None, 'columns': read_columns(file_path)}
+    if acquisition_datetime is not None:
+        acquisition_date = acquisition_datetime.date()
+    else:
+        acquisition_date = get_run_date(file_name)
+    with _write_lock, closing(_connect()) as connection, connection:
+        connection.execute("INSERT OR IGNORE INTO groups (name) VALUES (?)", (client_name,))
+        connection.execute(
+            """INSERT OR REPLACE INTO runs (group_name, file_name, size, mtime_ns, hash, instrument, acquisition_date,
+                                           acquisition_datetime, sample_name, row_count, columns)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (client_name, file_name, stat.st_size, stat.st_mtime_ns, content['hash'], instrument,
+             acquisition_date.isoformat() if acquisition_date else None,
+             acquisition_datetime.isoformat() if acquisition_datetime else None,
+             sample_name, content['row_count'], '\t'.join(content['columns'])))
+
+def sync_index(client_name=None):
+    """
+    Concilia el índice con las carpetas de DATA_DIR: añade los grupos y archivos nuevos,
+    vuelve a leer los modificados (tamaño o fecha de modificación distintos) y borra los que ya no existen.
+    Con client_name solo se concilia ese grupo. Cuesta un os.stat por archivo más la cabecera
+    de los nuevos o modificados (no se calcula su hash): la aplicación lo llama en segundo plano.
+    """
+    if client_name is None:
+        groups = sorted(d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d)))
+    else:
+        groups = [client_name] if os.path.isdir(os.path.join(DATA_DIR, client_name)) else []
+    group_filter, params = ("", []) if client_name is None else (" WHERE group_name = ?", [client_name])
+    with closing(_connect()) as connection:
+        indexed_groups = {row['name'] for row in connection.execute("SELECT name FROM groups")}
+        if client_name is not None:
+            indexed_groups &= {client_name}
+        indexed_runs = {(row['group_name'], row['file_name']): (row['size'], row['mtime_ns'])
+                        for row in connection.execute("SELECT group_name, file_name, size, mtime_ns FROM runs" + group_filter, params)}
+
+    on_disk = set()
+    changed = []
+    for group in groups:
+        group_path = os.path.join(DATA_DIR, group)
+        with os.scandir(group_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.tsv') or not entry.is_file():
+                    continue
+                key = (group, entry.name)
+                on_disk.add(key)
+                stat = entry.stat()
+                if indexed_runs.get(key) != (stat.st_size, stat.st_mtime_ns):
+                    changed.append(key)
+
+    removed_groups = [(g,) for g in indexed_groups - set(groups)]
+    removed_runs = [key for key in indexed_runs if key not in on_disk]
+    new_groups = [(g,) for g in groups if g not in indexed_groups]
+    if removed_groups or removed_runs or new_groups:
+        with _write_lock, closing(_connect()) as connection, connection:
+            connection.executemany("INSERT OR IGNORE INTO groups (name) VALUES (?)", new_groups)
+            connection.executemany("DELETE FROM runs WHERE group_name = ?", removed_groups)
+            connection.executemany("DELETE FROM groups WHERE name = ?", removed_groups)
+            connection.executemany("DELETE FROM runs WHERE group_name = ? AND file_name = ?", removed_runs)
+
+    for group, file_name in changed:
+        try:
+            index_run(group, file_name)
+        except OSError as e:
+            print(f"Warning: Could not index {file_name} of {group}: {e}")
+
+def get_client_runs(client_name, start_date=None, end_date=None):
+    """
+    Devuelve los archivos de un cliente con sus metadatos, ordenados por nombre, opcionalmente
+    filtrados por fecha de adquisición (los archivos sin fecha solo se incluyen sin filtros).
+    Cada archivo es un diccionario con 'path', 'file_name', 'signature' (ruta, mtime, tamaño),
+    'acquisition_date' (date o None) y el resto de columnas del índice.
+    Solo se consulta el índice: los cambios hechos fuera de la aplicación aparecen tras sync_index().
+    """
+    query = "SELECT * FROM runs WHERE group_name = ?"
+    params = [client_name]
+    if start_date is not None or end_date is not None:
+        query += " AND acquisition_date IS NOT NULL"
+    if start_date is not None:
+        query += " AND acquisition_date >= ?"
+        params.append(start_date.isoformat())
+    if end_date is not None:
+        query += " AND acquisition_date <= ?"
+        params.append(end_date.isoformat())
+    query += " ORDER BY file_name"
+
+    with closing(_connect()) as connection:
+        rows = connection.execute(query, params).fetchall()
+    runs = []
+    for row in rows:
+        run = dict(row)
+        run['path'] = os.path.abspath(os.path.join(DATA_DIR, client_name, row['file_name']))
+        run['signature'] = (run['path'], row['mtime_ns'], row['size'])
+        run['acquisition_date'] = date.fromisoformat(row['acquisition_date']) if row['acquisition_date'] else None
+        run['columns'] = row['columns'].split('\t') if row['columns'] else []
+        runs.append(run)
+    return runs
 
 def get_clients():
-    """Devuelve una lista con los nombres de todos los clientes (carpetas)."""
-    try:
-        # Lista solo los directorios dentro de DATA_DIR
-        clients = [d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))]
-        return sorted(clients)
-    except FileNotFoundError:
-        return []
+    """Devuelve una lista con los nombres de todos los clientes (según el índice)."""
+    with closing(_connect()) as connection:
+        return [row['name'] for row in connection.execute("SELECT name FROM groups ORDER BY name")]
 
 def add_client(client_name):
     """Añade un nuevo cliente creando su carpeta. Devuelve True si tiene éxito, False si ya existe."""
     client_path = os.path.join(DATA_DIR, client_name)
     if not os.path.exists(client_path):
         os.makedirs(client_path)
+        with _write_lock, closing(_connect()) as connection, connection:
+            connection.execute("INSERT OR IGNORE INTO groups (name) VALUES (?)", (client_name,))
         print(f"Carpeta para el cliente '{client_name}' creada en: {client_path}")
         return True
     else:
@@ -43,6 +238,9 @@ def delete_client(client_name):
     if os.path.exists(client_path):
         try:
             shutil.rmtree(client_path)
+            with _write_lock, closing(_connect()) as connection, connection:
+                connection.execute("DELETE FROM runs WHERE group_name = ?", (client_name,))
+                connection.execute("DELETE FROM groups WHERE name = ?", (client_name,))
             print(f"Cliente '{client_name}' y todos sus datos han sido eliminados.")
             return True
         except OSError as e:
@@ -55,14 +253,10 @@ def get_client_documents(client_name, full_path=False):
     Devuelve una lista de archivos .tsv para un cliente específico.
     Si full_path es True, devuelve las rutas completas, si no, solo los nombres de archivo.
     """
-    client_path = os.path.join(DATA_DIR, client_name)
-    try:
-        files = [f for f in os.listdir(client_path) if f.endswith('.tsv')]
-        if full_path:
-            return [os.path.join(client_path, f) for f in files]
-        return sorted(files)
-    except FileNotFoundError:
-        return []
+    runs = get_client_runs(client_name)
+    if full_path:
+        return [run['path'] for run in runs]
+    return [run['file_name'] for run in runs]
 
 def add_document_to_client(client_name, source_file_path):
     """Copies a document file to a client's folder."""
@@ -73,6 +267,7 @@ def add_document_to_client(client_name, source_file_path):
     file_name = os.path.basename(source_file_path)
     destination_path = os.path.join(client_path, file_name)
     shutil.copy(source_file_path, destination_path)
+    index_run(client_name, file_name)
     return True
 
 def delete_client_document(client_name, document_name):
@@ -80,5 +275,7 @@ def delete_client_document(client_name, document_name):
     doc_path = os.path.join(DATA_DIR, client_name, document_name)
     if os.path.exists(doc_path):
         os.remove(doc_path)
+        with _write_lock, closing(_connect()) as connection, connection:
+            connection.execute("DELETE FROM runs WHERE group_name = ? AND file_name = ?", (client_name, document_name))
         return True
     return False
\ No newline at end of file
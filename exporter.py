@@ -0,0 +1,160 @@
+import os
+import csv
+import time
+import numpy as np
+import pandas as pd
+import analysis as an
+import instrumentation as perf
+
+# --- DATA EXPORT ---
+# Tables (the peptide matrix, the correlation matrix) are written in blocks of rows, so a
+# 100k x 280 sparse matrix is never converted to dense (or held as a workbook) at once.
+# The format is chosen by the file extension. Every export is written to a temporary
+# file that replaces the destination only when it is complete.
+
+CHUNK_ROWS = 10000
+
+EXPORT_FILETYPES = [
+    ("Excel Workbook", "*.xlsx"),
+    ("CSV (comma-separated)", "*.csv"),
+    ("TSV (tab-separated)", "*.tsv"),
+    ("Parquet", "*.parquet"),
+    ("All files", "*.*"),
+]
+
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_COLUMNS = 16384
+
+def _dense_chunks(dataframe, chunk_rows=CHUNK_ROWS, cancel_event=None):
+    """Yields consecutive blocks of rows of the DataFrame, with the sparse columns made dense."""
+    dense_dtypes = {col: dtype.subtype for col, dtype in dataframe.dtypes.items() if isinstance(dtype, pd.SparseDtype)}
+    for start in range(0, len(dataframe), chunk_rows):
+        if cancel_event is not None and cancel_event.is_set():
+            raise an.AnalysisCancelled("The export was cancelled.")
+        chunk = dataframe.iloc[start:start + chunk_rows]
+        yield chunk.astype(dense_dtypes) if dense_dtypes else chunk
+
+def _index_label(dataframe):
+    return dataframe.index.name if dataframe.index.name is not None else ''
+
+def _text_column(values):
+    """
+    Cells of a column as text, formatted as DataFrame.to_csv() does (missing values are
+    empty). Only the stored cells of a sparse column are formatted.
+    """
+    if isinstance(values, pd.arrays.SparseArray):
+        text = np.full(len(values), _text_column(np.array([values.fill_value], dtype=values.sp_values.dtype))[0], dtype=object)
+        text[values.sp_index.indices] = _text_column(values.sp_values)
+        return text
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        text = values.astype(str).astype(object)
+        text[np.isnan(values)] = ''
+        return text
+    # Texto, enteros, categorías: el módulo csv escribe str(valor) y None como vacío
+    text = np.asarray(values, dtype=object)
+    text[pd.isna(text)] = None
+    return text
+
+def _write_delimited(dataframe, file_path, sep, progress_callback=None, cancel_event=None):
+    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=sep, lineterminator='\n')
+        writer.writerow([_index_label(dataframe)] + [str(col) for col in dataframe.columns])
+        for start in range(0, len(dataframe), CHUNK_ROWS):
+            if cancel_event is not None and cancel_event.is_set():
+                raise an.AnalysisCancelled("The export was cancelled.")
+            # Las columnas dispersas se cortan sin hacerlas densas
+            chunk = dataframe.iloc[start:start + CHUNK_ROWS]
+            columns = [_text_column(chunk.index.array)] + [_text_column(chunk.iloc[:, j].array) for j in range(chunk.shape[1])]
+            writer.writerows(zip(*columns))
+            if progress_callback:
+                progress_callback(start + len(chunk), len(dataframe))
+
+def _excel_column(series):
+    """Values of a column as Python objects; missing values become empty cells, as in DataFrame.to_excel."""
+    values = series.tolist()
+    missing = np.flatnonzero(series.isna().to_numpy())
+    for i in missing:
+        values[i] = None
+    return values
+
+def _write_excel(dataframe, file_path, progress_callback=None, cancel_event=None):
+    # Import diferido: openpyxl solo hace falta para exportar a Excel
+    from openpyxl import Workbook
+
+    if len(dataframe) + 1 > EXCEL_MAX_ROWS or dataframe.shape[1] + 1 > EXCEL_MAX_COLUMNS:
+        raise ValueError(f"The table ({dataframe.shape[0]} x {dataframe.shape[1]}) does not fit in an Excel sheet. "
+                         "Export it as CSV, TSV or Parquet instead.")
+
+    # Write-only workbook: the rows are streamed to the file instead of kept in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append([_index_label(dataframe)] + [str(col) for col in dataframe.columns])
+    done = 0
+    for chunk in _dense_chunks(dataframe, cancel_event=cancel_event):
+        columns = [_excel_column(chunk.index.to_series())] + [_excel_column(chunk.iloc[:, j]) for j in range(chunk.shape[1])]
+        for row in zip(*columns):
+            sheet.append(row)
+        done += len(chunk)
+        if progress_callback:
+            progress_callback(done, len(dataframe))
+    workbook.save(file_path)
+
+def _write_parquet(dataframe, file_path, progress_callback=None, cancel_event=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs the 'pyarrow' package (pip install pyarrow).")
+
+    writer = None
+    schema = None
+    done = 0
+    try:
+        for chunk in _dense_chunks(dataframe, cancel_event=cancel_event):
+            chunk = chunk.rename(columns=str) # Parquet column names must be strings
+            # Every block is one row group with the schema of the first block
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=True)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(file_path, schema)
+            writer.write_table(table)
+            done += len(chunk)
+            if progress_callback:
+                progress_callback(done, len(dataframe))
+        if writer is None:
+            pq.write_table(pa.Table.from_pandas(dataframe.rename(columns=str), preserve_index=True), file_path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+EXPORTERS = {
+    '.xlsx': _write_excel,
+    '.csv': lambda df, path, **kwargs: _write_delimited(df, path, ',', **kwargs),
+    '.tsv': lambda df, path, **kwargs: _write_delimited(df, path, '\t', **kwargs),
+    '.parquet': _write_parquet,
+}
+
+def export_dataframe(dataframe, file_path, progress_callback=None, cancel_event=None):
+    """
+    Writes a DataFrame (index included) to file_path in the format given by its extension
+    (.xlsx, .csv, .tsv or .parquet). progress_callback(rows_done, total_rows) reports progress
+    and cancel_event stops the export (the destination is left untouched).
+    Returns a dictionary with the exported 'rows', the 'seconds' taken and 'rows_per_second'.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in EXPORTERS:
+        raise ValueError(f"Unsupported export format '{extension}'. Use one of: {', '.join(EXPORTERS)}.")
+
+    start = time.perf_counter()
+    temp_path = file_path + '.part'
+    try:
+        with perf.span(f"write {extension[1:]}", rows=len(dataframe), columns=dataframe.shape[1]):
+            EXPORTERS[extension](dataframe, temp_path, progress_callback=progress_callback, cancel_event=cancel_event)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    seconds = time.perf_counter() - start
+    return {'rows': len(dataframe), 'seconds': seconds,
+            'rows_per_second': len(dataframe) / seconds if seconds > 0 else float('inf')}
@@ -0,0 +1,241 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import string_ids
+import protein_rollup as pr
+
+# --- GROUP STORE ---
+# All the runs of a group in one folder of flat binary columns (client_cache/groups/<hash>/),
+# one row per row of the TSV files (peptide x charge):
+#   peptide, proteins   int32 IDs of the peptide and protein strings (see string_ids)
+#   charge              int8
+#   intensity, score, q_value, spectral_angle   float32
+# The rows of every run are contiguous and the manifest records where each run starts and
+# stops. The columns are opened with np.memmap, so opening a group costs page faults instead
+# of parsing, and the columns of a run are views of the files (no copy).
+# New runs are appended (the manifest is written last, so a crash only leaves unused bytes
+# at the end of the files); removed or modified runs are dropped by rewriting the columns
+# into a new generation of files. Updates hold a lock file in the folder of the store (see
+# string_ids.file_lock) and re-read the manifest first, so several processes (the CLI
+# with --jobs, the GUI) can share a store.
+# Missing values are NaN, or -1 for the IDs and the charge.
+
+STORE_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "store.lock"
+
+COLUMNS = {
+    'peptide': np.int32,
+    'proteins': np.int32,
+    'charge': np.int8,
+    'intensity': np.float32,
+    'score': np.float32,
+    'q_value': np.float32,
+    'spectral_angle': np.float32,
+}
+ID_COLUMNS = {'peptide': 'peptides', 'proteins': 'proteins'} # Column -> kind of string (see string_ids)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def store_path(cache_dir, folder, peptide_column):
+    """Folder of the store of a group (the same files read with another peptide column get their own)."""
+    key = f"{os.path.abspath(folder)}\n{peptide_column}"
+    return os.path.join(cache_dir, "groups", hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+def open_store(cache_dir, folder, peptide_column):
+    """Returns the store of a group (empty if it does not exist yet). Stores are opened once per process."""
+    path = store_path(cache_dir, folder, peptide_column)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = GroupStore(path)
+        return _stores[path]
+
+class GroupStore:
+    """
+    The memory-mapped columns of the runs of a group, by file signature (path, mtime, size).
+    'lock' must be held while the store is updated or its columns are read; between
+    processes, update() also holds the lock file of the store.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._reset()
+        self.refresh()
+
+    def refresh(self):
+        """Reads the manifest again, with the runs other processes may have added or dropped."""
+        with self.lock:
+            try:
+                self._load()
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Ignoring unreadable group store {self.path}: {e}")
+                self._reset()
+
+    def _reset(self):
+        self.generation = 0
+        self.rows = 0
+        self.runs = {}  # signature -> {'start', 'stop', 'columns' (found in the file), 'index_name'}
+        self._columns = {}
+
+    def _file(self, name, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.path, f"{name}.{generation}.bin")
+
+    def _load(self):
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            self._reset()
+            return
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['version'] != STORE_VERSION:
+            self._reset()
+            return
+        if self._columns and (manifest['generation'], manifest['rows']) == (self.generation, self.rows):
+            return # Unchanged since it was read (appends change the rows, compactions the generation)
+        self.generation = manifest['generation']
+        self.rows = manifest['rows']
+        self.runs = {tuple(run['signature']): {key: run[key] for key in ['start', 'stop', 'columns', 'index_name']}
+                     for run in manifest['runs']}
+        for kind, size in manifest['strings'].items():
+            string_ids.dictionary(kind).ensure(size)
+        self._map_columns()
+
+    def _map_columns(self):
+        self._columns = {
+            name: np.memmap(self._file(name), dtype=dtype, mode='r', shape=(self.rows,))
+                  if self.rows else np.zeros(0, dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+
+    def _write_manifest(self):
+        manifest = {
+            'version': STORE_VERSION,
+            'generation': self.generation,
+            'rows': self.rows,
+            'strings': {kind: len(string_ids.dictionary(kind)) for kind in ID_COLUMNS.values()},
+            'runs': [{'signature': list(signature), **run} for signature, run in self.runs.items()],
+        }
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + '.tmp', manifest_path) # Atomic: the store is always consistent
+
+    def missing(self, signatures):
+        """Positions of the signatures whose runs are not in the store."""
+        return [i for i, signature in enumerate(signatures) if tuple(signature) not in self.runs]
+
+    def column(self, name, signature):
+        """The values of a column for one run (a view of the mapped file)."""
+        run = self.runs[tuple(signature)]
+        return self._columns[name][run['start']:run['stop']]
+
+    def has_column(self, name, signature):
+        return name in self.runs[tuple(signature)]['columns']
+
+    def update(self, signatures, parsed):
+        """
+        Adds the runs in 'parsed', given as (signature, columns) pairs (see analysis.load_run_columns),
+        and drops the stale runs: other versions of the files in 'signatures' and files that
+        no longer exist. Runs of other files are kept, so subsets of a group share the store.
+        """
+        requested = {tuple(signature) for signature in signatures}
+        paths = {signature[0] for signature in requested}
+        os.makedirs(self.path, exist_ok=True)
+        with self.lock, string_ids.file_lock(os.path.join(self.path, LOCK_NAME)):
+            self.refresh() # Another process may have changed the store since it was read
+            stale = {signature for signature in self.runs if signature not in requested
+                     and (signature[0] in paths or not os.path.exists(signature[0]))}
+            if stale:
+                self._compact([signature for signature in self.runs if signature not in stale])
+            parsed = [(tuple(signature), columns) for signature, columns in parsed if tuple(signature) not in self.runs]
+            if parsed:
+                self._append(parsed)
+
+    def _append(self, parsed):
+        # The strings of every run are turned into IDs all at once
+        encoded = {}
+        for column, kind in ID_COLUMNS.items():
+            parts = [columns[column] for _, columns in parsed if columns[column] is not None]
+            if not parts:
+                continue
+            codes = string_ids.ids(kind, np.concatenate([part.categories.to_numpy(dtype=object) for part in parts]))
+            bounds = np.cumsum([0] + [len(part.categories) for part in parts])
+            encoded[column] = iter([np.append(codes[bounds[i]:bounds[i + 1]], -1).astype(np.int32)
+                                    for i in range(len(parts))])
+
+        blocks = {name: [] for name in COLUMNS}
+        start = self.rows
+        for signature, columns in parsed:
+            size = len(columns['peptide'])
+            for name, dtype in COLUMNS.items():
+                values = columns[name]
+                if values is None:
+                    values = np.full(size, -1 if name in ID_COLUMNS or name == 'charge' else np.nan, dtype=dtype)
+                elif name in ID_COLUMNS:
+                    values = next(encoded[name])[values.codes] # Code -1 picks the trailing -1
+                elif name == 'charge':
+                    values = np.where(np.isfinite(values), values, -1).astype(dtype)
+                blocks[name].append(np.asarray(values, dtype=dtype))
+            self.runs[signature] = {'start': start, 'stop': start + size, 'index_name': columns['index_name'],
+                                    'columns': [name for name in COLUMNS if columns[name] is not None]}
+            start += size
+
+        self._columns = {} # Release the mapped files before they grow
+        for name, parts in blocks.items():
+            self._append_bytes(self._file(name), self.rows * np.dtype(COLUMNS[name]).itemsize,
+                               b''.join(part.tobytes() for part in parts))
+        self.rows = start
+        self._write_manifest()
+        self._map_columns()
+
+    @staticmethod
+    def _append_bytes(path, size, data):
+        """Writes data after the first 'size' bytes of the file (what the manifest knows of)."""
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.truncate(size)
+            f.seek(size)
+            f.write(data)
+
+    def _compact(self, keep):
+        """Rewrites the columns with only the runs 'keep', into the next generation of files."""
+        old_generation = self.generation
+        self.generation += 1
+        runs = {}
+        start = 0
+        for name in COLUMNS:
+            with open(self._file(name), 'wb') as f:
+                for signature in keep:
+                    f.write(self.column(name, signature).tobytes())
+        for signature in keep:
+            run = dict(self.runs[signature])
+            size = run['stop'] - run['start']
+            run.update(start=start, stop=start + size)
+            runs[signature] = run
+            start += size
+        self.runs = runs
+        self.rows = start
+        self._columns = {}
+        self._write_manifest()
+        self._map_columns()
+        for name in COLUMNS:
+            try:
+                os.remove(self._file(name, old_generation))
+            except OSError:
+                pass # Still mapped somewhere (Windows); the next compaction will not need it
+
+    def peptide_matrix(self, signatures, columns):
+        """
+        Same as protein_rollup.PeptideRuns.matrix(), from the stored rows: the peptide_matrix()
+        of the summed positive intensities of the runs 'signatures' (named 'columns'), with
+        the protein list of the first row of every peptide.
+        """
+        size = len(string_ids.dictionary('peptides'))
+        runs = []
+        for signature in signatures:
+            runs.append(pr.sum_by_peptide(self.column('peptide', signature), self.column('intensity', signature),
+                                          self.column('proteins', signature), size))
+        return pr.peptide_matrix(runs, columns)
@@ -0,0 +1,51 @@
+import warnings
+import numpy as np
+
+# Above this number of runs the correlation heatmap is drawn as a single raster image
+# instead of one patch per cell (sns.heatmap), which takes seconds and a lot of memory.
+RASTER_MIN_RUNS = 50
+
+def downsample_matrix(values, max_cells):
+    """
+    Averages square blocks of a matrix so that it has at most 'max_cells' rows and columns.
+    NaN cells (masked or missing) are ignored; a block with only NaN cells stays NaN.
+    Returns the reduced matrix and the block size.
+    """
+    n = values.shape[0]
+    factor = -(-n // max_cells) if max_cells > 0 else 1 # Ceiling division
+    if factor <= 1:
+        return values, 1
+    size = -(-n // factor)
+    padded = np.full((size * factor, size * factor), np.nan)
+    padded[:n, :n] = values
+    blocks = padded.reshape(size, factor, size, factor)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning) # All-NaN blocks
+        return np.nanmean(blocks, axis=(1, 3)), factor
+
+def draw_raster_heatmap(ax, corr_matrix, cmap, vmin, vmax, max_cells, mask_upper=False):
+    """
+    Draws a correlation matrix on 'ax' as one image. If it has more runs than 'max_cells'
+    (the pixels available on screen), blocks of runs are averaged. With mask_upper=True
+    only the lower triangle and the diagonal are shown. Returns the block size used.
+    """
+    values = corr_matrix.to_numpy(dtype=float, copy=True)
+    n = values.shape[0]
+    if mask_upper:
+        values[np.triu_indices(n, k=1)] = np.nan
+    values, factor = downsample_matrix(values, max_cells)
+
+    cmap = cmap.copy()
+    cmap.set_bad(alpha=0) # Masked cells are transparent
+    # The extent keeps the axes in run units, whatever the block size
+    image = ax.imshow(np.ma.masked_invalid(values), cmap=cmap, vmin=vmin, vmax=vmax,
+                      interpolation='nearest', aspect='equal', extent=(0, n, n, 0))
+    ax.figure.colorbar(image, ax=ax, shrink=.8)
+
+    # Only the first and last runs are labelled, as in the patch heatmap
+    labels = [str(corr_matrix.columns[0]), str(corr_matrix.columns[-1])]
+    ax.set_xticks([0.5, n - 0.5], labels, rotation=90)
+    ax.set_yticks([0.5, n - 0.5], labels)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    return factor
@@ -0,0 +1,282 @@
+import os
+import ast
+import json
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import database as db
+from cancellation import AnalysisCancelled
+
+# --- MACHINE DATA IMPORT ---
+# Every run folder of an instrument export (with 'lfq.tsv' and 'payload.json') is copied
+# to the group of its machine. Folders are scanned and runs are copied in a thread pool
+# (the work is I/O bound). A manifest in DATA_DIR remembers every imported 'lfq.tsv'
+# (size, modification time and content hash), so importing the same tree again only
+# stats the files, runs whose content was already imported are skipped, and an
+# interrupted import resumes where it stopped. Two runs with the same destination name
+# (same date and sample folder) are kept as '<name>.tsv' and '<name>_2.tsv'. The metadata
+# of the payload (instrument, acquisition time, sample) is recorded in the metadata
+# index of DATA_DIR.
+
+IMPORT_WORKERS = 8
+MANIFEST_NAME = ".import_manifest.json"
+MANIFEST_VERSION = 1
+MANIFEST_SAVE_EVERY = 50 # The manifest is saved after this many runs (and at the end)
+
+_client_lock = threading.Lock() # Creating group folders from several threads
+_hash_lock = threading.Lock()   # Claiming content hashes, so duplicates are copied once
+
+def _scan_folder(path):
+    """Returns (is_run_folder, subfolders) for a single folder."""
+    try:
+        with os.scandir(path) as entries:
+            files, subfolders = set(), []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                else:
+                    files.add(entry.name)
+    except OSError as e:
+        print(f"Warning: Could not scan folder {path}: {e}")
+        return False, []
+    return 'lfq.tsv' in files and 'payload.json' in files, subfolders
+
+def find_run_folders(root_folder, max_workers=IMPORT_WORKERS):
+    """
+    Finds every folder under root_folder with both 'lfq.tsv' and 'payload.json'.
+    The tree is scanned level by level, with the folders of each level listed in parallel.
+    """
+    run_folders = []
+    level = [root_folder]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while level:
+            next_level = []
+            for path, (is_run_folder, subfolders) in zip(level, pool.map(_scan_folder, level)):
+                if is_run_folder:
+                    run_folders.append(path)
+                next_level.extend(subfolders)
+            level = next_level
+    return sorted(run_folders)
+
+def parse_run_folder(dirpath):
+    """
+    Reads the 'payload.json' of a run folder and returns (machine_model, file_name, metadata),
+    where file_name is 'YYYY-MM-DD_<sample>.tsv' and metadata holds the 'instrument',
+    'acquisition_datetime' (None if the payload has no creation time) and 'sample_name'.
+    """
+    payload_path = os.path.join(dirpath, 'payload.json')
+    with open(payload_path, 'r', encoding='utf-8') as f:
+        payload_data = json.load(f)
+
+    # Extraer el modelo de la máquina
+    instrument_info_str = payload_data.get('instrument_info', '{}')
+    # El campo es un string que parece un dict, usamos ast.literal_eval para convertirlo
+    instrument_info = ast.literal_eval(instrument_info_str)
+    machine_model = instrument_info.get('model', 'Unknown_Machine').strip()
+
+    date_prefix = "YYYY-MM-DD" # Prefijo por defecto si no se encuentra ninguna fecha
+    date_found = False
+    acquisition_datetime = None
+
+    # Paso 1: Intentar extraer la fecha de 'thermo_creation_datetime'
+    creation_datetime_str = payload_data.get('thermo_creation_datetime')
+    if creation_datetime_str:
+        try:
+            # Intentar parsear formato '4/15/2025 10:22:04 PM'
+            dt_obj = datetime.strptime(creation_datetime_str, '%m/%d/%Y %I:%M:%S %p')
+            date_prefix = dt_obj.strftime('%Y-%m-%d')
+            acquisition_datetime = dt_obj
+            date_found = True
+        except ValueError:
+            try:
+                # Intentar parsear formato '24/08/2019 10:39:28'
+                dt_obj = datetime.strptime(creation_datetime_str, '%d/%m/%Y %H:%M:%S')
+                date_prefix = dt_obj.strftime('%Y-%m-%d')
+                acquisition_datetime = dt_obj
+                date_found = True
+            except ValueError:
+                # Falló el parseo, se intentará el Paso 2
+                pass
+
+    # Paso 2: Si no se encontró la fecha en el Paso 1, intentar de 'raw_file_name'
+    if not date_found:
+        raw_file_name_from_payload = payload_data.get('raw_file_name')
+        if raw_file_name_from_payload and len(raw_file_name_from_payload) >= 8:
+            # Se espera un formato YYYYMMDD_... al inicio del nombre del archivo
+            date_part = raw_file_name_from_payload[:8]
+            try:
+                dt_obj = datetime.strptime(date_part, '%Y%m%d')
+                date_prefix = dt_obj.strftime('%Y-%m-%d')
+            except ValueError:
+                # Si no tiene el formato YYYYMMDD, se mantiene el prefijo por defecto
+                pass
+
+    # --- CORRECCIÓN: Usar el nombre de la carpeta padre para garantizar unicidad ---
+    # El 'Sample_Name' del JSON puede repetirse, pero el nombre de la carpeta
+    # que contiene la carpeta 'Results' suele ser único para cada ejecución.
+    sample_name = os.path.basename(os.path.dirname(dirpath))
+    metadata = {
+        'instrument': machine_model,
+        'acquisition_datetime': acquisition_datetime,
+        'sample_name': payload_data.get('Sample_Name') or sample_name,
+    }
+    return machine_model, f"{date_prefix}_{sample_name}.tsv", metadata
+
+def _manifest_path():
+    return os.path.join(db.DATA_DIR, MANIFEST_NAME)
+
+def load_manifest():
+    """Returns the manifest entries (by source 'lfq.tsv' path), or an empty dict."""
+    try:
+        with open(_manifest_path(), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest['runs']
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        if os.path.exists(_manifest_path()):
+            print(f"Warning: Ignoring unreadable import manifest: {e}")
+    return {}
+
+def save_manifest(runs):
+    """Writes the manifest atomically, so an interrupted import never leaves it half-written."""
+    temp_path = _manifest_path() + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'runs': runs}, f)
+        os.replace(temp_path, _manifest_path())
+    except OSError as e:
+        print(f"Warning: Could not save the import manifest: {e}")
+
+def _claim_destination(destination_path, source, size, content_hash, destinations):
+    """
+    Returns the destination of a run: its file name, or '<name>_2.tsv', '<name>_3.tsv'...
+    when another source run already uses it (in the manifest or in this import), or a file
+    with other content is there. Called with _hash_lock held; 'destinations' maps every
+    claimed destination to its source.
+    """
+    base, extension = os.path.splitext(destination_path)
+    candidate, number = destination_path, 1
+    while True:
+        owner = destinations.get(candidate)
+        if owner == source:
+            return candidate # The previous copy of the same source is replaced
+        if owner is None:
+            # A copy finished before an interruption has the same content
+            if not os.path.exists(candidate) or (os.path.getsize(candidate) == size
+                                                 and db.file_hash(candidate) == content_hash):
+                destinations[candidate] = source
+                return candidate
+        number += 1
+        candidate = f"{base}_{number}{extension}"
+
+def _import_run(dirpath, source, entry, hashes, pending, destinations):
+    """
+    Imports one run folder. Returns ('imported' or 'skipped', manifest entry).
+    Runs in a worker thread of the import pool. 'hashes' maps the content hash of the
+    imported runs to their copy, 'pending' the hashes being copied by other threads and
+    'destinations' the claimed destination files to their source (see _claim_destination).
+    """
+    lfq_path = os.path.join(dirpath, 'lfq.tsv')
+    stat = os.stat(lfq_path)
+
+    # Same source file as in the manifest, and its copy is still there: nothing to do
+    if (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+            and os.path.exists(entry['destination'])):
+        return 'skipped', entry
+
+    # Hash, row count and header in one read; the index reuses them for the copy
+    content = db.describe_file(lfq_path)
+    content_hash = content['hash']
+    machine_model, new_filename, metadata = parse_run_folder(dirpath)
+
+    # The same content was already imported (e.g. the export tree was moved or copied),
+    # or another thread of this import is copying it. Otherwise the destination is
+    # claimed, so two runs with the same file name never overwrite each other.
+    with _hash_lock:
+        existing = pending.get(content_hash)
+        if existing is None and hashes.get(content_hash) and os.path.exists(hashes[content_hash]):
+            existing = hashes[content_hash]
+        if existing:
+            return 'skipped', {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content_hash, 'destination': existing}
+        destination_path = _claim_destination(os.path.join(db.DATA_DIR, machine_model, new_filename),
+                                               source, stat.st_size, content_hash, destinations)
+        pending[content_hash] = destination_path
+    new_filename = os.path.basename(destination_path)
+    new_entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content_hash, 'destination': destination_path}
+
+    try:
+        # A copy finished before an interruption is only checked, not copied again
+        if (os.path.exists(destination_path) and os.path.getsize(destination_path) == stat.st_size
+                and db.file_hash(destination_path) == content_hash):
+            db.index_run(machine_model, new_filename, content=content, **metadata)
+            with _hash_lock:
+                hashes[content_hash] = destination_path
+            return 'skipped', new_entry
+
+        # Crear el grupo de máquina si no existe
+        with _client_lock:
+            if not os.path.isdir(os.path.join(db.DATA_DIR, machine_model)):
+                db.add_client(machine_model) # Reutilizamos la función add_client
+
+        # Copiar y renombrar el archivo lfq.tsv (a un temporal único, para no dejar copias a medias)
+        fd, temp_path = tempfile.mkstemp(suffix='.part', prefix=new_filename + '.', dir=os.path.dirname(destination_path))
+        os.close(fd)
+        try:
+            shutil.copy(lfq_path, temp_path)
+            os.replace(temp_path, destination_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        db.index_run(machine_model, new_filename, content=content, **metadata)
+        with _hash_lock:
+            hashes[content_hash] = destination_path
+        return 'imported', new_entry
+    finally:
+        with _hash_lock:
+            if pending.get(content_hash) == destination_path:
+                del pending[content_hash]
+
+def import_machine_data(root_folder, max_workers=IMPORT_WORKERS, progress_callback=None, cancel_event=None):
+    """
+    Imports every run folder under root_folder into the group of its machine.
+    Returns a dictionary with the number of 'imported', 'skipped' and 'failed' runs.
+    progress_callback(done, total) reports progress and cancel_event stops the import
+    (the runs already imported are kept in the manifest).
+    """
+    run_folders = find_run_folders(root_folder, max_workers)
+    manifest = load_manifest()
+    hashes = {entry['hash']: entry['destination'] for entry in manifest.values()}
+    destinations = {entry['destination']: source for source, entry in manifest.items()}
+    pending = {}
+    counts = {'imported': 0, 'skipped': 0, 'failed': 0}
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {}
+        for dirpath in run_folders:
+            source = os.path.abspath(os.path.join(dirpath, 'lfq.tsv'))
+            futures[pool.submit(_import_run, dirpath, source, manifest.get(source), hashes, pending, destinations)] = (dirpath, source)
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise AnalysisCancelled("The import was cancelled.")
+            dirpath, source = futures[future]
+            try:
+                status, entry = future.result()
+                manifest[source] = entry
+                counts[status] += 1
+            except Exception as e:
+                print(f"Failed to process folder {dirpath}: {e}")
+                counts['failed'] += 1
+            if done % MANIFEST_SAVE_EVERY == 0:
+                save_manifest(manifest)
+            if progress_callback:
+                progress_callback(done, len(run_folders))
+    finally:
+        # The copies in progress finish, the pending ones are dropped
+        pool.shutdown(wait=True, cancel_futures=True)
+        save_manifest(manifest)
+    return counts
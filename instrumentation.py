@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# --- PERFORMANCE INSTRUMENTATION ---
+# An operation (opening a group, a correlation report, an export...) is a list of named
+# timing spans, one per stage, plus the time of every file read in it. While operations
+# are running a background thread samples the memory of the process, so every span and
+# operation records its peak RSS. Finished operations are kept in memory for the
+# Performance panel and written as JSON lines to a rotating log file.
+# Spans outside of an active operation cost nothing, so the analysis functions can be
+# instrumented unconditionally (e.g. for the benchmark or the command line).
+
+LOG_FILE_NAME = "performance.log"
+LOG_MAX_BYTES = 2 * 2**20
+LOG_BACKUP_COUNT = 3
+HISTORY_SIZE = 50            # Operations kept for the Performance panel
+SAMPLE_INTERVAL = 0.05       # Seconds between memory samples
+
+_logger = logging.getLogger("performance")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+
+_history = deque(maxlen=HISTORY_SIZE)
+_history_lock = threading.Lock()
+_current = contextvars.ContextVar("performance_operation", default=None)
+_stack = contextvars.ContextVar("performance_spans", default=())
+
+_active = set()              # Operations and spans whose peak memory is being sampled
+_active_lock = threading.Lock()
+_sampler = None
+
+def set_log_dir(base_path):
+    """Writes the finished operations to a rotating log file in base_path."""
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(os.path.join(base_path, LOG_FILE_NAME), maxBytes=LOG_MAX_BYTES,
+                                  backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    _logger.addHandler(handler)
+
+def log_path():
+    """Path of the current log file, or None if the operations are not being logged."""
+    for handler in _logger.handlers:
+        return handler.baseFilename
+    return None
+
+def _windows_memory_counters():
+    """PROCESS_MEMORY_COUNTERS of this process through the Win32 API, or None outside Windows."""
+    if os.name != 'nt':
+        return None
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL('kernel32')
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    get_info = kernel32.K32GetProcessMemoryInfo # Exported by kernel32 since Windows 7
+    get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    get_info.restype = wintypes.BOOL
+    if not get_info(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+def current_rss_mb():
+    """Resident memory of this process in MB, or None if the platform does not report it."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        counters = _windows_memory_counters()
+    except (OSError, AttributeError):
+        return None
+    return counters.WorkingSetSize / 2**20 if counters else None
+
+def process_age():
+    """Seconds since this process was started (interpreter start-up included), or None if unknown."""
+    try:
+        import psutil
+        return time.time() - psutil.Process().create_time()
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19]) # Field 22: starttime
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident memory of this process in MB, or None if the platform does not report it.
+    With children=True, the peak of its largest finished child process (e.g. a pool worker),
+    which is only reported where getrusage() is available.
+    """
+    try:
+        import resource
+    except ImportError:
+        if children:
+            return None
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2**20 # Windows
+        except (ImportError, AttributeError):
+            pass
+        try:
+            counters = _windows_memory_counters()
+        except (OSError, AttributeError):
+            return None
+        return counters.PeakWorkingSetSize / 2**20 if counters else None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KB on Linux
+
+# --- MEMORY SAMPLING ---
+
+class _Measure:
+    """Time and memory of an operation or a span."""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.rss_start = current_rss_mb()
+        self.peak_rss = self.rss_start
+        with _active_lock:
+            _active.add(self)
+        _ensure_sampler()
+
+    def sample(self, rss):
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+
+    def stop(self):
+        with _active_lock:
+            _active.discard(self)
+        self.sample(current_rss_mb())
+        self.seconds = time.perf_counter() - self.start
+
+def _sample_memory():
+    global _sampler
+    while True:
+        with _active_lock:
+            measures = list(_active)
+            if not measures:
+                _sampler = None
+                return
+        rss = current_rss_mb()
+        for measure in measures:
+            measure.sample(rss)
+        time.sleep(SAMPLE_INTERVAL)
+
+def _ensure_sampler():
+    global _sampler
+    with _active_lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_memory, name="memory-sampler", daemon=True)
+            _sampler.start()
+
+# --- OPERATIONS AND SPANS ---
+
+class Operation:
+    """
+    A user-level operation: its spans (stages) and the files it read.
+    Created with start_operation() or operation(); made current in a thread with activate().
+    """
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.started = datetime.now()
+        self.spans = []      # dicts: name, depth, offset, seconds, rss_start, peak_rss, fields
+        self.files = []      # dicts: file, seconds, stage
+        self.status = None
+        self._measure = _Measure()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status is not None
+
+    @property
+    def seconds(self):
+        return self._measure.seconds if self.finished else time.perf_counter() - self._measure.start
+
+    @property
+    def peak_rss(self):
+        return self._measure.peak_rss
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Times a stage of this operation (from any thread)."""
+        stack = _stack.get()
+        measure = _Measure()
+        token = _stack.set(stack + (name,))
+        try:
+            yield
+        finally:
+            _stack.reset(token)
+            measure.stop()
+            with self._lock:
+                self.spans.append({
+                    'name': name, 'depth': len(stack), 'offset': measure.start - self._measure.start,
+                    'seconds': measure.seconds, 'rss_start': measure.rss_start, 'peak_rss': measure.peak_rss,
+                    'fields': fields,
+                })
+
+    def record_file(self, file, seconds):
+        stack = _stack.get()
+        with self._lock:
+            self.files.append({'file': file, 'seconds': seconds, 'stage': stack[-1] if stack else None})
+
+    def finish(self, status='ok'):
+        """Ends the operation, keeps it for the Performance panel and logs it. Only the first call counts."""
+        with self._lock:
+            if self.finished:
+                return
+            self.status = status
+        self._measure.stop()
+        with _history_lock:
+            _history.append(self)
+        if _logger.handlers:
+            _logger.info(json.dumps(self.to_dict(), default=str))
+
+    def to_dict(self):
+        return {
+            'operation': self.name, 'started': self.started.isoformat(timespec='seconds'),
+            'status': self.status, 'seconds': self.seconds, 'peak_rss_mb': self.peak_rss,
+            'fields': self.fields, 'spans': self.spans, 'files': self.files,
+        }
+
+def start_operation(name, **fields):
+    """Starts an operation without making it current (see activate())."""
+    return Operation(name, **fields)
+
+@contextmanager
+def activate(op):
+    """
+    Makes 'op' the current operation of this thread, so span() and record_file() go to it.
+    If the block raises, the operation is finished with the exception name as its status.
+    """
+    token = _current.set(op)
+    try:
+        yield op
+    except BaseException as e:
+        op.finish(type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def operation(name, **fields):
+    """Starts an operation, makes it current and finishes it at the end of the block."""
+    op = start_operation(name, **fields)
+    with activate(op):
+        yield op
+    op.finish()
+
+@contextmanager
+def span(name, **fields):
+    """Times a stage of the current operation; does nothing if there is none."""
+    op = _current.get()
+    if op is None:
+        yield
+        return
+    with op.span(name, **fields):
+        yield
+
+def record_file(file, seconds):
+    """Records how long a file took in the current stage of the current operation."""
+    op = _current.get()
+    if op is not None:
+        op.record_file(file, seconds)
+
+# --- IMPORT TIMING ---
+# timed_import() times the import statements of a block as a span "import <modules>" of
+# the current operation, with the cost of everything they import in turn. Only the first
+# import is recorded, and the import system itself is not modified. The imports stay as
+# plain statements, so PyInstaller still finds them.
+
+@contextmanager
+def timed_import(*names):
+    """Times the block that imports the modules 'names', unless they were all imported already."""
+    if all(name in sys.modules for name in names):
+        yield
+        return
+    with span("import " + ", ".join(names)):
+        yield
+
+def current_operation():
+    return _current.get()
+
+def recent_operations():
+    """The last finished operations, newest first."""
+    with _history_lock:
+        return list(reversed(_history))
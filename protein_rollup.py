@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+from sparse_matrix import SparseMatrix
+import string_ids
+
+# --- PROTEIN ROLLUP ---
+# Protein intensities are computed for all the runs of a group at once, as one sparse
+# product of a peptide x protein incidence matrix and the peptide x run intensity matrix.
+# A peptide can be shared by several proteins ('sp|P1|A;sp|P2|B'); the policy decides
+# which of them its intensity counts for:
+#   - 'first':  the first protein listed (what the correlation report always did).
+#   - 'razor':  the protein with the most peptides in the group (Occam's razor);
+#               ties go to the protein listed first.
+#   - 'split':  every protein gets an equal share.
+#   - 'unique': shared peptides are left out.
+# The proteins of a peptide are taken from the first run (in run order) where it appears.
+
+POLICIES = ['first', 'razor', 'split', 'unique']
+DEFAULT_POLICY = 'first'
+
+PROTEIN_SEPARATOR = ';'
+
+def sum_by_peptide(peptides, intensities, proteins, size):
+    """
+    Sums the positive intensities of the rows of a run by peptide and keeps the protein
+    list of the first row of every peptide. 'peptides' and 'proteins' are integer codes
+    (negative if missing) and 'size' is the number of peptide codes. Returns the
+    (peptide codes, float32 sums, protein list codes) of the peptides with a positive sum.
+    """
+    keep = (peptides >= 0) & (proteins >= 0) & (intensities > 0)
+    codes = peptides[keep]
+    sums = np.bincount(codes, weights=intensities[keep], minlength=size)
+    found, first_row = np.unique(codes, return_index=True) # The first row of every peptide
+    positive = sums[found] > 0
+    found, first_row = found[positive], first_row[positive]
+    return found, sums[found].astype(np.float32), proteins[keep][first_row]
+
+def peptide_matrix(runs, columns):
+    """
+    Peptide x run SparseMatrix of runs given as (peptide IDs, intensities, protein IDs)
+    arrays with one entry per peptide, named 'columns'. Its rows are every peptide ID (see
+    string_ids). Also returns, for every peptide, the ID of its protein list in the first
+    run where it appears (-1 if in none of them).
+    """
+    size = len(string_ids.dictionary('peptides'))
+    rows = np.concatenate([run[0] for run in runs]).astype(np.int64) if runs else np.zeros(0, dtype=np.int64)
+    cols = np.repeat(np.arange(len(runs)), [len(run[0]) for run in runs])
+    values = np.concatenate([run[1] for run in runs]) if runs else np.zeros(0, dtype=np.float32)
+    lists = np.concatenate([run[2] for run in runs]).astype(np.int64) if runs else np.zeros(0, dtype=np.int64)
+
+    # The runs are concatenated in order, so the first row of a peptide is in its first run
+    peptide_lists = np.full(size, -1, dtype=np.int64)
+    found, _, first_lists = sum_by_peptide(rows, values, lists, size)
+    peptide_lists[found] = first_lists
+    return SparseMatrix.from_coo(rows, cols, values, pd.RangeIndex(size), columns, fill_value=0), peptide_lists
+
+class PeptideRuns:
+    """
+    Peptide intensities of the runs of a group, kept as peptide and protein list IDs
+    (see string_ids), so runs can be added and dropped, and the peptide matrix rebuilt,
+    without hashing any string again.
+    """
+    def __init__(self):
+        self.runs = {} # key -> (peptide IDs, intensities, protein list IDs), or None
+
+    def add(self, items):
+        """
+        Adds runs given as (key, frame) pairs, where frame has one row per peptide with
+        'peptide', 'proteins' (categorical) and 'intensity' columns, or is None (a run
+        without proteins). All the runs are encoded in one pass over their labels.
+        """
+        items = list(items)
+        frames = [frame for _, frame in items if frame is not None]
+        if frames:
+            peptide_ids = string_ids.ids('peptides', np.concatenate([frame['peptide'].to_numpy(dtype=object) for frame in frames]))
+            list_ids = string_ids.ids('proteins', np.concatenate([frame['proteins'].cat.categories.to_numpy(dtype=object) for frame in frames]))
+            peptide_bounds = np.cumsum([0] + [len(frame) for frame in frames])
+            list_bounds = np.cumsum([0] + [len(frame['proteins'].cat.categories) for frame in frames])
+
+        i = 0
+        for key, frame in items:
+            if frame is None:
+                self.runs[key] = None
+                continue
+            lists = list_ids[list_bounds[i]:list_bounds[i + 1]]
+            self.runs[key] = (
+                peptide_ids[peptide_bounds[i]:peptide_bounds[i + 1]],
+                frame['intensity'].to_numpy(),
+                lists[frame['proteins'].cat.codes.to_numpy()],
+            )
+            i += 1
+
+    def keep(self, keys):
+        """Forgets the runs that are not in 'keys'."""
+        keys = set(keys)
+        for key in [key for key in self.runs if key not in keys]:
+            del self.runs[key]
+
+    def matrix(self, keys, columns):
+        """The peptide_matrix() of the runs 'keys' (named 'columns')."""
+        return peptide_matrix([self.runs[key] for key in keys], columns)
+
+def incidence(peptide_lists, policy=DEFAULT_POLICY):
+    """
+    Peptide x protein incidence matrix of a shared-peptide policy, given the protein list
+    ID of every peptide (-1: none). Returns the (peptide, protein, weight) triplets and the
+    protein dictionary (sorted accessions).
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown shared-peptide policy '{policy}'. Use one of: {', '.join(POLICIES)}.")
+
+    # Accessions of every protein list in use, in the listed order and without repeats
+    used = np.unique(peptide_lists[peptide_lists >= 0])
+    accessions = pd.Series(string_ids.labels('proteins', used), index=used, dtype=object).str.split(PROTEIN_SEPARATOR).explode().str.strip()
+    accessions = accessions[accessions.notna() & (accessions != '')]
+    accessions = accessions[~pd.MultiIndex.from_arrays([accessions.index, accessions.to_numpy()]).duplicated()]
+    list_of_accession = accessions.index.to_numpy(dtype=np.int64)
+    accession_codes, proteins = pd.factorize(accessions.to_numpy(), sort=True)
+    starts = np.searchsorted(list_of_accession, used)
+    sizes = np.searchsorted(list_of_accession, used, side='right') - starts
+    ranks = np.arange(len(accession_codes)) - np.repeat(starts, sizes)
+
+    # One (peptide, protein) pair per accession of the list of every peptide
+    peptides = np.flatnonzero(peptide_lists >= 0)
+    position = np.searchsorted(used, peptide_lists[peptides])
+    lengths = sizes[position]
+    offsets = np.repeat(starts[position] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    pair_peptides = np.repeat(peptides, lengths)
+    pair_proteins = accession_codes[offsets]
+    pair_ranks = ranks[offsets]
+    pair_sizes = np.repeat(lengths, lengths)
+
+    if policy == 'split':
+        keep = np.ones(len(pair_peptides), dtype=bool)
+    elif policy == 'first':
+        keep = pair_ranks == 0
+    elif policy == 'unique':
+        keep = pair_sizes == 1
+    else: # razor
+        evidence = np.bincount(pair_proteins, minlength=len(proteins)) # Peptides of every protein
+        order = np.lexsort((pair_ranks, -evidence[pair_proteins], pair_peptides))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_peptides[order][1:] != pair_peptides[order][:-1]
+        keep = np.zeros(len(order), dtype=bool)
+        keep[order[first]] = True
+
+    weights = 1.0 / pair_sizes[keep] if policy == 'split' else np.ones(keep.sum())
+    return pair_peptides[keep], pair_proteins[keep], weights, pd.Index(proteins)
+
+def rollup(peptides, peptide_lists, policy=DEFAULT_POLICY):
+    """Protein x run SparseMatrix of the intensities of a peptide matrix under a shared-peptide policy."""
+    rows, targets, weights, proteins = incidence(peptide_lists, policy)
+    return peptides.aggregate_rows(rows, targets, weights, proteins)
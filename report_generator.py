@@ -1,102 +1,268 @@
+import io
 import os
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pypdf import PdfReader, PdfWriter
+from xml.sax.saxutils import escape
+from reportlab.platypus import Table, TableStyle, Paragraph, Spacer, PageBreak, Frame
+from reportlab.platypus.doctemplate import LayoutError
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib import colors
 from reportlab.lib.units import inch
+from sparse_matrix import frame_arrays, take_rows
+import instrumentation as perf
+from cancellation import AnalysisCancelled
 
-def create_pdf_report(filepath, title, dataframe, column_mapping=None):
-    """
-    Generates a multi-page PDF report from a pandas DataFrame, splitting wide tables
-    across multiple pages by chunking columns to ensure readability.
+# --- STREAMING PDF ---
+# The report is not built as one story of giant tables: rows are cut into page-sized table
+# blocks (all with the same column widths and one shared style), which are created lazily
+# and drawn page by page on the canvas. Only the blocks of the current page are alive, the
+# layout of each block is independent of the size of the table, and every finished page
+# is compressed into the document, so time is linear in the number of cells.
+#
+# Large reports are cut into parts (a column chunk, or a segment of its rows) that are
+# rendered to temporary PDFs in worker processes and merged in order into the final
+# file, where the page numbers ("Page i of N") are stamped on the merged pages.
 
-    Args:
-        filepath (str): The path where the PDF file will be saved.
-        title (str): The main title of the report (the metric used).
-        dataframe (pd.DataFrame): The DataFrame with the data to display.
-        column_mapping (dict, optional): A dictionary mapping short column names to full paths.
+PAGE_SIZE = landscape(letter) # Forzar siempre landscape para más ancho
+MARGIN = inch
+MAX_DATA_COLS_PER_PAGE = 6 # Reducido a 6 para dar más espacio a la columna de péptidos
+FONT_SIZE = 8
+ROW_HEIGHT = FONT_SIZE * 1.2 + 6 # Altura mínima de una fila (una línea de texto más el padding)
+HEADER_HEIGHT = 3 * FONT_SIZE * 1.2 + 15 # Encabezado de un bloque, con nombres de hasta tres líneas
+CELL_PADDING = 12 # Padding horizontal (izquierda + derecha) de las celdas
+PART_ROWS = 4000 # Filas de cada parte que se renderiza por separado (unas 130 páginas)
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),      # Header background color
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), # Header text color
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),             # Center align everything
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),            # Centrar verticalmente todo el contenido
+    ('FONTSIZE', (0, 0), (-1, -1), FONT_SIZE),         # Reduce font size
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),            # Padding in header
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),       # Grid for the whole table
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.whitesmoke]), # Alternar colores de fila
+])
+
+def _frame_size():
+    return PAGE_SIZE[0] - 2 * MARGIN, PAGE_SIZE[1] - 2 * MARGIN
+
+def _column_widths(text_columns):
+    """
+    Text columns (the peptides and e.g. the proteins) get twice the width of a numeric
+    column; the widths are the same for every block of a column chunk.
     """
-    # 1. Configuración de Página: Forzar siempre landscape para más ancho.
-    doc = SimpleDocTemplate(filepath, pagesize=landscape(letter))
+    units = [2 if is_text else 1 for is_text in text_columns]
+    width = _frame_size()[0] / sum(units)
+    return [unit * width for unit in units]
+
+def _cell_text(value):
+    # Los float32 se escriben con sus dígitos significativos y sin notación científica
+    if isinstance(value, np.floating):
+        return np.format_float_positional(value, trim='0')
+    return str(value.item() if isinstance(value, np.generic) else value)
+
+def _title_flowables(title, column_mapping=None):
+    """Yields the title and the column legend of the report."""
     styles = getSampleStyleSheet()
-    header_style = styles['Normal'] # Estilo para los encabezados
-    cell_style = styles['Normal']   # Estilo para las celdas de datos (para el word wrap)
-    
-    story = []
 
     # 1. Report Title
-    story.append(Paragraph(title, styles['h1']))
-    story.append(Spacer(1, 0.2*inch))
+    yield Paragraph(title, styles['h1'])
+    yield Spacer(1, 0.2*inch)
 
-    # 2. Column Legend (if provided)
+    # 2. Column Legend (if provided), one paragraph per column so it splits cheaply across pages
     if column_mapping:
-        story.append(Paragraph("Column Legend (Short Name -> Full Path):", styles['h3']))
-        legend_text = [f"<b>{short}</b>: {full}" for short, full in sorted(column_mapping.items())]
-        story.append(Paragraph('<br/>'.join(legend_text), styles['Normal']))
-        story.append(Spacer(1, 0.3*inch))
-
-    # 3. Preparación de Datos: Resetear el índice para que la columna de péptidos sea la columna 0.
-    df_reset = dataframe.reset_index()
-    peptide_col_name = df_reset.columns[0]
-    data_cols = df_reset.columns[1:]
-
-    # 4. Lógica de Chunking de Columnas
-    MAX_DATA_COLS_PER_PAGE = 6 # Reducido a 6 para dar más espacio a la columna de péptidos
-    num_chunks = -(-len(data_cols) // MAX_DATA_COLS_PER_PAGE) # Ceiling division
+        yield Paragraph("Column Legend (Short Name -> Full Path):", styles['h3'])
+        for short, full in sorted(column_mapping.items()):
+            yield Paragraph(f"<b>{escape(str(short))}</b>: {escape(str(full))}", styles['Normal'])
+        yield Spacer(1, 0.3*inch)
+
+def _table_flowables(dataframe, subtitle=None):
+    """
+    Yields the table blocks of one column chunk (at most MAX_DATA_COLS_PER_PAGE columns),
+    preceded by its subtitle if there is one.
+    """
+    styles = getSampleStyleSheet()
+    header_style = styles['Normal'] # Estilo para los encabezados
+    # Estilo para las celdas de péptidos que necesitan word wrap, del mismo tamaño que el resto de la tabla
+    cell_style = ParagraphStyle('ReportCell', parent=styles['Normal'], fontSize=FONT_SIZE, leading=FONT_SIZE * 1.2)
+
+    # Añadir subtítulo para el bloque de columnas
+    if subtitle:
+        yield Paragraph(subtitle, styles['h3'])
+        yield Spacer(1, 0.1*inch)
+
+    # La columna de péptidos es el índice; las filas se leen por bloques (también de tablas dispersas)
+    arrays = frame_arrays(dataframe)
+    rows_per_block = max(1, int((_frame_size()[1] - HEADER_HEIGHT) // ROW_HEIGHT))
 
+    # Generación de Tablas: un bloque de filas del tamaño de una página cada vez
+    header = [Paragraph(f'<b>{escape(str(col))}</b>', header_style)
+              for col in [dataframe.index.name or 'index'] + list(dataframe.columns)]
+    # El índice (péptidos) y las columnas de texto se parten en líneas si no caben
+    text_columns = [True] + [not pd.api.types.is_numeric_dtype(dtype) for dtype in dataframe.dtypes]
+    col_widths = _column_widths(text_columns)
+    wrap_widths = [width - CELL_PADDING if is_text else None for width, is_text in zip(col_widths, text_columns)]
+    for start in range(0, len(dataframe), rows_per_block):
+        rows = take_rows(arrays, range(start, min(start + rows_per_block, len(dataframe))))
+        data = [header]
+        for row in rows:
+            # Solo los textos que no caben en su columna van en un Paragraph (con word wrap),
+            # que es mucho más lento que el texto normal
+            cells = [_cell_text(value) for value in row]
+            for j, wrap_width in enumerate(wrap_widths):
+                if wrap_width is not None and stringWidth(cells[j], cell_style.fontName, FONT_SIZE) > wrap_width:
+                    cells[j] = Paragraph(escape(cells[j]), cell_style)
+            data.append(cells)
+        # repeatRows=1 repite el encabezado si un bloque no cabe en lo que queda de página
+        yield Table(data, colWidths=col_widths, repeatRows=1, style=TABLE_STYLE)
+
+def _report_parts(title, dataframe, column_mapping=None, part_rows=PART_ROWS):
+    """
+    Cuts the report into independent parts: (title, column_mapping, dataframe slice, subtitle).
+    Every column chunk starts a new page, as before, and is cut into segments of
+    'part_rows' rows. The first part also carries the title and the legend.
+    """
+    data_cols = list(dataframe.columns)
+    num_chunks = -(-len(data_cols) // MAX_DATA_COLS_PER_PAGE) # Ceiling division
+    parts = []
     for i in range(num_chunks):
         start_col_idx = i * MAX_DATA_COLS_PER_PAGE
-        end_col_idx = start_col_idx + MAX_DATA_COLS_PER_PAGE
-        
-        # Seleccionar el bloque de columnas de datos
-        current_cols_chunk = data_cols[start_col_idx:end_col_idx]
-        
-        # Crear el sub-dataframe: siempre incluye la columna de péptidos
-        sub_df_cols = [peptide_col_name] + list(current_cols_chunk)
-        sub_df = df_reset[sub_df_cols]
-
-        # Añadir subtítulo para el bloque de columnas
-        if num_chunks > 1:
-            story.append(Paragraph(f"Columns {start_col_idx + 1} to {min(end_col_idx, len(data_cols))}", styles['h3']))
-            story.append(Spacer(1, 0.1*inch))
-
-        # 5. Generación de Tablas
-        # Usar Paragraph en los encabezados para permitir el ajuste de texto (word wrap)
-        header = [Paragraph(f'<b>{col}</b>', header_style) for col in sub_df.columns]
-        
-        # Convertir datos a lista, aplicando Paragraph a la columna de péptidos para el ajuste de texto
-        data_rows = []
-        for index, row in sub_df.iterrows():
-            row_data = [Paragraph(str(row.iloc[0]), cell_style)] # Columna de péptido con word wrap
-            row_data.extend(row.iloc[1:].astype(str).tolist())   # El resto de columnas como texto normal
-            data_rows.append(row_data)
-        data = [header] + data_rows
-
-        pdf_table = Table(data, repeatRows=1) # repeatRows=1 repite el encabezado en cada página vertical
-
-        # 6. Estilos
-        style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),      # Header background color
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), # Header text color
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),             # Center align everything
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),            # Centrar verticalmente todo el contenido
-            ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),             # Vertically align header text
-            ('FONTSIZE', (0, 0), (-1, -1), 8),                 # Reduce font size
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),            # Padding in header
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)        # Grid for the whole table
-        ])
-        pdf_table.setStyle(style)
-
-        # Alternar colores de fila para mejor legibilidad
-        for row_idx, row in enumerate(data[1:], start=1):
-            bg_color = colors.whitesmoke if row_idx % 2 == 0 else colors.beige
-            style.add('BACKGROUND', (0, row_idx), (-1, row_idx), bg_color)
-
-        story.append(pdf_table)
-        
-        # Añadir un salto de página después de cada tabla, excepto la última
-        if i < num_chunks - 1:
-            story.append(PageBreak())
-
-    # Build the PDF
-    doc.build(story)
\ No newline at end of file
+        end_col_idx = min(start_col_idx + MAX_DATA_COLS_PER_PAGE, len(data_cols))
+        for start in range(0, max(len(dataframe), 1), part_rows):
+            subtitle = f"Columns {start_col_idx + 1} to {end_col_idx}" if num_chunks > 1 and start == 0 else None
+            part_df = dataframe.iloc[start:start + part_rows, start_col_idx:end_col_idx]
+            parts.append((None, None, part_df, subtitle))
+    if not parts:
+        parts.append((None, None, None, None))
+    parts[0] = (title, column_mapping) + parts[0][2:]
+    return parts
+
+def render_part(filepath, title, column_mapping, dataframe, subtitle):
+    """Renders one part of a report to 'filepath' and returns its number of pages."""
+    flowables = []
+    if title is not None:
+        flowables.append(_title_flowables(title, column_mapping))
+    if dataframe is not None:
+        flowables.append(_table_flowables(dataframe, subtitle))
+    canvas = Canvas(filepath, pagesize=PAGE_SIZE, pageCompression=1)
+    pages = draw_pages(canvas, (flowable for part in flowables for flowable in part))
+    canvas.save()
+    return pages
+
+def draw_pages(canvas, flowables):
+    """
+    Lays out the flowables on the pages of 'canvas', taking them from the iterable only
+    when the current page needs them. Flowables that do not fit are split across pages.
+    Returns the number of pages drawn.
+    """
+    flowables = iter(flowables)
+    pending = []
+    pages = 0
+    done = False
+    while not done:
+        frame = Frame(MARGIN, MARGIN, *_frame_size(), leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+        drawn = False
+        while True:
+            if not pending:
+                flowable = next(flowables, None)
+                if flowable is None:
+                    done = True
+                    break
+                pending.append(flowable)
+            flowable = pending[0]
+            if isinstance(flowable, PageBreak):
+                pending.pop(0)
+                if drawn:
+                    break
+                continue
+            if frame.add(flowable, canvas, trySplit=1):
+                pending.pop(0)
+                drawn = True
+                continue
+            # No cabe en lo que queda de página: se parte, y lo que sobra pasa a la siguiente
+            parts = frame.split(flowable, canvas)
+            if parts and frame.add(parts[0], canvas, trySplit=1):
+                pending[0:1] = parts[1:]
+                drawn = True
+            elif not drawn:
+                raise LayoutError(f"{flowable.__class__.__name__} is too large for a page.")
+            break
+        if drawn:
+            canvas.showPage() # La página se comprime y se guarda; sus bloques ya no se usan
+            pages += 1
+    return pages
+
+def _footer_pages(total):
+    """Renders the footers 'Page i of N' (one per page, nothing else) into an in-memory PDF."""
+    buffer = io.BytesIO()
+    canvas = Canvas(buffer, pagesize=PAGE_SIZE, pageCompression=1)
+    for number in range(1, total + 1):
+        canvas.setFont('Helvetica', FONT_SIZE)
+        canvas.drawRightString(PAGE_SIZE[0] - MARGIN, MARGIN / 2, f"Page {number} of {total}")
+        canvas.showPage()
+    canvas.save()
+    buffer.seek(0)
+    return PdfReader(buffer).pages
+
+def number_pages(writer):
+    """Stamps the footer 'Page i of N' on every page of a PdfWriter, merging a footer page over each one."""
+    for page, footer in zip(writer.pages, _footer_pages(len(writer.pages))):
+        page.merge_page(footer)
+
+def merge_parts(filepath, part_paths, title=None):
+    """Merges the part PDFs in order into 'filepath' and numbers the pages of the result."""
+    writer = PdfWriter()
+    for path in part_paths:
+        writer.append(path)
+    number_pages(writer)
+    if title:
+        writer.add_metadata({'/Title': title})
+    # Se escribe a un temporal, para no dejar un reporte a medias si algo falla
+    temp_path = filepath + '.part'
+    with open(temp_path, 'wb') as f:
+        writer.write(f)
+    os.replace(temp_path, filepath)
+
+def create_pdf_report(filepath, title, dataframe, column_mapping=None, max_workers=None,
+                      progress_callback=None, cancel_event=None):
+    """
+    Generates a multi-page PDF report from a pandas DataFrame, splitting wide tables
+    across multiple pages by chunking columns to ensure readability.
+    The parts of the report are rendered in up to 'max_workers' processes
+    (None: one per CPU, 1: in this process) and merged in order.
+
+    Args:
+        filepath (str): The path where the PDF file will be saved.
+        title (str): The main title of the report (the metric used).
+        dataframe (pd.DataFrame): The DataFrame with the data to display.
+        column_mapping (dict, optional): A dictionary mapping short column names to full paths.
+        max_workers (int, optional): The number of worker processes.
+        progress_callback (callable, optional): Called as progress_callback(done, total) after every part.
+        cancel_event (threading.Event, optional): Stops rendering the remaining parts.
+    """
+    parts = _report_parts(title, dataframe, column_mapping)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(parts))
+    with tempfile.TemporaryDirectory(prefix='report_') as temp_dir:
+        part_paths = [os.path.join(temp_dir, f"part_{i:05d}.pdf") for i in range(len(parts))]
+        with perf.span("render parts", parts=len(parts), workers=max_workers):
+            executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+            try:
+                # Las partes se renderizan en orden; el primer error de un proceso se propaga
+                arguments = (part_paths, *zip(*parts))
+                rendered = executor.map(render_part, *arguments) if executor else map(render_part, *arguments)
+                for done, _ in enumerate(rendered, start=1):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise AnalysisCancelled("The report was cancelled.")
+                    if progress_callback:
+                        progress_callback(done, len(parts))
+            finally:
+                if executor:
+                    executor.shutdown(wait=True, cancel_futures=True)
+        with perf.span("merge parts"):
+            merge_parts(filepath, part_paths, title)
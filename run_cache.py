@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pandas as pd
+
+# --- CACHE FOLDER AND TSV READING ---
+# The cache folder (client_cache, next to 'client_data') holds the group stores (see
+# group_store) and the string dictionaries (see string_ids): the group store is the only
+# copy of the parsed runs. A version of a file is identified by its path, modification
+# time and size.
+
+# Será establecida por main.py (junto a 'client_data'). Si es None, no se usa caché.
+CACHE_DIR = None
+
+def set_cache_dir(base_path):
+    """Sets the cache folder and removes the per-file entries left by older versions."""
+    global CACHE_DIR
+    CACHE_DIR = os.path.join(base_path, "client_cache")
+    _remove_old_entries()
+
+def _remove_old_entries():
+    # Older versions kept every parsed file as an .npz entry at the top of the folder
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.npz') or name.endswith('.npz.tmp'):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                pass
+
+def file_signature(file_path):
+    """Returns the (path, mtime, size) tuple that identifies a version of a file."""
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+def read_header(file_path):
+    """Returns the list of column names of a TSV file."""
+    return pd.read_csv(file_path, sep='\t', nrows=0).columns.tolist()
+
+def parse_tsv(file_path, dtype=None, usecols=None):
+    """
+    Parses a TSV file with pandas, using the explicit dtypes when given.
+    If a column does not match its dtype (e.g. empty or non-numeric values), the file is
+    parsed again with inferred types and the numeric columns are coerced to their dtype.
+    """
+    if usecols is not None:
+        wanted = set(usecols)
+        usecols = lambda col: col in wanted # Columns missing from the file are ignored
+    if not dtype:
+        return pd.read_csv(file_path, sep='\t', usecols=usecols)
+    try:
+        return pd.read_csv(file_path, sep='\t', dtype=dtype, usecols=usecols)
+    except (ValueError, TypeError, OverflowError):
+        df = pd.read_csv(file_path, sep='\t', usecols=usecols)
+        for col, col_dtype in dtype.items():
+            if col not in df.columns:
+                continue
+            if col_dtype == 'category':
+                df[col] = df[col].astype('category')
+            else:
+                # Integers can't hold missing values, so they fall back to float32
+                target = col_dtype if np.dtype(col_dtype).kind == 'f' else 'float32'
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(target)
+        return df
+
+def read_tsv(file_path, usecols=None, dtype=None):
+    """
+    Reads a TSV file with the given dtypes (see parse_tsv). 'usecols' limits the columns
+    parsed; columns missing from the file are ignored.
+    """
+    return parse_tsv(file_path, dtype, usecols)
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+
+class SparseMatrix:
+    """
+    Labelled sparse matrix (peptides or proteins x runs) in CSR layout.
+
+    Only the observed cells are stored: 'data' holds their values, 'indices' their
+    column positions and 'indptr' where the cells of each row start. Memory therefore
+    scales with the observed (row, run) pairs instead of rows x runs. The row labels
+    ('index') are a dictionary shared by every run of the matrix, and the cells that
+    were not observed read as 'fill_value'.
+    """
+    def __init__(self, data, indices, indptr, index, columns, fill_value=0):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.index = index
+        self.columns = list(columns)
+        self.fill_value = fill_value
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, index, columns, fill_value=0):
+        """Builds the matrix from (row position, column position, value) triplets."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int32)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(index) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(index)), out=indptr[1:])
+        return cls(np.asarray(values)[order], cols[order], indptr, index, columns, fill_value)
+
+    @classmethod
+    def from_series(cls, series_list, fill_value=0):
+        """
+        Builds the matrix from one Series per run (indexed by row label, named after the run).
+        The row dictionary is the sorted union of the labels of every Series.
+        """
+        if not series_list:
+            return cls(np.array([], dtype=np.float64), np.array([], dtype=np.int32),
+                       np.zeros(1, dtype=np.int64), pd.Index([]), [], fill_value)
+        labels = np.concatenate([series.index.to_numpy(dtype=object) for series in series_list])
+        codes, index = pd.factorize(labels, sort=True)
+        cols = np.repeat(np.arange(len(series_list)), [len(series) for series in series_list])
+        values = np.concatenate([series.to_numpy() for series in series_list])
+        return cls.from_coo(codes, cols, values, pd.Index(index), [series.name for series in series_list], fill_value)
+
+    @property
+    def shape(self):
+        return (len(self.index), len(self.columns))
+
+    @property
+    def nnz(self):
+        """Number of stored cells."""
+        return len(self.data)
+
+    @property
+    def density(self):
+        rows, cols = self.shape
+        return self.nnz / (rows * cols) if rows and cols else 0.0
+
+    def equals(self, other):
+        """True if both matrices have the same labels and stored cells."""
+        return (self.index.equals(other.index) and self.columns == other.columns
+                and np.array_equal(self.indptr, other.indptr) and np.array_equal(self.indices, other.indices)
+                and np.array_equal(self.data, other.data))
+
+    def _row_of_cells(self):
+        return np.repeat(np.arange(len(self.index)), np.diff(self.indptr))
+
+    def dense_rows(self, positions):
+        """Returns the given rows as a dense 2D array (missing cells are 'fill_value')."""
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.indptr[positions]
+        lengths = self.indptr[positions + 1] - starts
+        # Position of every stored cell of the selected rows in 'data'
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        out = np.full((len(positions), len(self.columns)), self.fill_value, dtype=self.data.dtype)
+        out[np.repeat(np.arange(len(positions)), lengths), self.indices[offsets]] = self.data[offsets]
+        return out
+
+    def select_columns(self, positions, drop_empty_rows=True):
+        """
+        Returns a new matrix with only the given columns (in that order). Rows left without
+        any stored cell are dropped, as if the matrix had been built from those runs only.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        remap = np.full(len(self.columns), -1, dtype=np.int64)
+        remap[positions] = np.arange(len(positions))
+        cols = remap[self.indices]
+        keep = cols >= 0
+        rows = self._row_of_cells()[keep]
+        index = self.index
+        if drop_empty_rows:
+            used = np.unique(rows)
+            index = self.index[used]
+            rows = np.searchsorted(used, rows)
+        return SparseMatrix.from_coo(rows, cols[keep], self.data[keep], index,
+                                     [self.columns[i] for i in positions], self.fill_value)
+
+    def aggregate_rows(self, rows, targets, weights, index, drop_empty_rows=True):
+        """
+        Returns the matrix Wᵀ · self for a sparse weight matrix W given as (row, target, weight)
+        triplets: row t of the result is the weighted sum of the rows mapped to t, and 'index'
+        labels the targets. Only stored cells are combined (fill_value must be 0).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        # Position in 'data' of every stored cell of every (row, target) pair, as in dense_rows()
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        values = self.data[offsets].astype(np.float64) * np.repeat(np.asarray(weights, dtype=np.float64), lengths)
+        cells = np.repeat(np.asarray(targets, dtype=np.int64), lengths) * len(self.columns) + self.indices[offsets]
+
+        # Cells that land on the same (target, column) are added up
+        cells, inverse = np.unique(cells, return_inverse=True)
+        values = np.bincount(inverse, weights=values, minlength=len(cells)).astype(self.data.dtype)
+        out_rows, cols = np.divmod(cells, len(self.columns)) if len(self.columns) else (cells, cells)
+        if drop_empty_rows:
+            used = np.unique(out_rows)
+            index = index[used]
+            out_rows = np.searchsorted(used, out_rows)
+        return SparseMatrix.from_coo(out_rows, cols, values, index, self.columns, self.fill_value)
+
+    def count_rows(self, positions):
+        """Number of rows with at least one stored cell in the given columns."""
+        selected = np.zeros(len(self.columns), dtype=bool)
+        selected[np.asarray(positions, dtype=np.int64)] = True
+        return len(np.unique(self._row_of_cells()[selected[self.indices]]))
+
+    def to_dense(self):
+        out = np.full(self.shape, self.fill_value, dtype=self.data.dtype)
+        out[self._row_of_cells(), self.indices] = self.data
+        return out
+
+    def iter_row_blocks(self, block_rows=20000):
+        """Yields (row labels, dense block) pairs, so large matrices can be written or reduced in chunks."""
+        for start in range(0, len(self.index), block_rows):
+            stop = min(start + block_rows, len(self.index))
+            yield self.index[start:stop], self.dense_rows(np.arange(start, stop))
+
+    def to_frame(self, sparse=False):
+        """
+        Returns the matrix as a DataFrame. With sparse=True every run column is a
+        pandas SparseArray, so the frame keeps the memory footprint of the matrix.
+        """
+        if not sparse:
+            return pd.DataFrame(self.to_dense(), index=self.index, columns=self.columns)
+
+        # Cells grouped by column (CSC order); rows stay sorted inside each column
+        order = np.argsort(self.indices, kind='stable')
+        rows = self._row_of_cells()[order]
+        values = self.data[order]
+        bounds = np.searchsorted(self.indices[order], np.arange(len(self.columns) + 1))
+        dtype = pd.SparseDtype(self.data.dtype, self.fill_value)
+        columns = {}
+        for j, col in enumerate(self.columns):
+            dense = np.full(len(self.index), self.fill_value, dtype=self.data.dtype)
+            dense[rows[bounds[j]:bounds[j + 1]]] = values[bounds[j]:bounds[j + 1]]
+            columns[col] = pd.arrays.SparseArray(dense, dtype=dtype)
+        return pd.DataFrame(columns, index=self.index)
+
+    def column_sums(self):
+        sums = np.bincount(self.indices, weights=self.data.astype(np.float64), minlength=len(self.columns))
+        missing = len(self.index) - self.column_counts()
+        return pd.Series(sums + missing * self.fill_value, index=self.columns)
+
+    def column_counts(self):
+        """Number of stored (observed) cells of every column."""
+        return np.bincount(self.indices, minlength=len(self.columns))
+
+    def corr(self, block_rows=20000):
+        """
+        Pearson correlation between the columns, treating missing cells as 'fill_value'
+        (the same result as DataFrame.corr() on the filled dense matrix).
+        The cross products are accumulated over dense blocks of rows, so only one block
+        is materialized at a time.
+        """
+        n = len(self.index)
+        means = (self.column_sums() / n).to_numpy() if n else np.zeros(len(self.columns))
+        cross = np.zeros((len(self.columns), len(self.columns)), dtype=np.float64)
+        for _, block in self.iter_row_blocks(block_rows):
+            centered = block.astype(np.float64) - means
+            cross += centered.T @ centered
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(np.diag(cross))
+            corr = cross / np.outer(std, std)
+        corr = np.clip(corr, -1.0, 1.0)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+def frame_arrays(dataframe):
+    """Returns the index and the column arrays of a DataFrame, for repeated calls to take_rows()."""
+    return [dataframe.index.array] + [dataframe.iloc[:, i].array for i in range(dataframe.shape[1])]
+
+def take_rows(arrays, positions):
+    """
+    Returns the rows at the given positions of some frame_arrays() as tuples (index value first).
+    Sparse columns are read with a binary search on their stored positions instead of
+    a take on the whole column, which keeps it fast for wide sparse tables.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    columns = []
+    for values in arrays:
+        if not isinstance(values, pd.arrays.SparseArray):
+            columns.append(np.asarray(values[positions]))
+            continue
+        stored = values.sp_index.indices
+        column = np.full(len(positions), values.fill_value, dtype=values.sp_values.dtype)
+        if len(stored):
+            found = np.minimum(np.searchsorted(stored, positions), len(stored) - 1)
+            hit = stored[found] == positions
+            column[hit] = values.sp_values[found[hit]]
+        columns.append(column)
+    return list(zip(*columns))
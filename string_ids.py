@@ -0,0 +1,129 @@
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import run_cache
+
+# --- STRING DICTIONARIES ---
+# Peptide sequences and protein strings (the protein column as it appears in the files,
+# e.g. 'sp|Q9NSD9|SYFB_HUMAN;sp|P1|A') are handled as int32 IDs in the analysis: in the
+# group store, the long metric tables and the peptide matrices. They are turned back into
+# strings only for display and export.
+# The IDs come from one append-only dictionary per kind of string, shared by every group.
+# With a cache folder it is persisted in client_cache/strings/<kind>.txt (one string per
+# line, the ID is the line number), so the IDs written by the group store stay valid across
+# sessions. Several processes (e.g. the command line with --jobs) can add strings at the
+# same time: appends are serialized with a lock file, and every process first reads the
+# strings that the others added. Without a cache folder the dictionaries live in memory.
+
+KINDS = ['peptides', 'proteins']
+
+_TERMINATOR = b'\n'
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock between processes, held for the duration of the block."""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class StringDictionary:
+    """An append-only string -> int32 ID dictionary, optionally persisted to a file."""
+    def __init__(self, path=None):
+        self.path = path
+        self.labels = pd.Index([], dtype=object) # The string of every ID
+        self._size = 0                            # Bytes of the file already read
+        self._lock = threading.Lock()
+        if path is not None:
+            self._read_new()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _read_new(self):
+        """Appends the strings added to the file (by other processes) since it was last read."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._size)
+            data = f.read()
+        end = data.rfind(_TERMINATOR) + 1 # A line left half-written by a crash is ignored
+        if end:
+            self.labels = self.labels.append(pd.Index(data[:end].decode('utf-8').split('\n')[:-1], dtype=object))
+            self._size += end
+
+    def ensure(self, size):
+        """Makes sure the IDs below 'size' (e.g. stored by another process) are known."""
+        if size > len(self.labels) and self.path is not None:
+            with self._lock:
+                self._read_new()
+
+    def ids(self, labels):
+        """Returns the int32 ID of every string in 'labels', adding the new ones (missing values are -1)."""
+        labels = np.asarray(labels, dtype=object)
+        with self._lock:
+            ids = self.labels.get_indexer(labels)
+            new = pd.Index(labels[ids < 0], dtype=object).dropna().unique()
+            if len(new):
+                self._add(new)
+                ids = self.labels.get_indexer(labels)
+        return ids.astype(np.int32)
+
+    def _add(self, new):
+        if self.path is None:
+            self.labels = self.labels.append(new)
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with file_lock(self.path + '.lock'):
+            self._read_new()
+            new = new.difference(self.labels, sort=False)
+            if not len(new):
+                return
+            data = ''.join(label + '\n' for label in new.astype(str)).encode('utf-8')
+            with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+                f.truncate(self._size) # Drops a half-written line, if any
+                f.seek(self._size)
+                f.write(data)
+            self._size += len(data)
+            self.labels = self.labels.append(new)
+
+    def take(self, ids):
+        """The strings of some IDs (as an object array)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids):
+            self.ensure(int(ids.max()) + 1)
+        return self.labels.to_numpy(dtype=object)[ids] if len(ids) else np.zeros(0, dtype=object)
+
+def dictionary(kind):
+    """The dictionary of a kind of string ('peptides' or 'proteins') for the current cache folder."""
+    key = (run_cache.CACHE_DIR, kind)
+    with _dictionaries_lock:
+        if key not in _dictionaries:
+            path = os.path.join(run_cache.CACHE_DIR, "strings", f"{kind}.txt") if run_cache.CACHE_DIR else None
+            _dictionaries[key] = StringDictionary(path)
+        return _dictionaries[key]
+
+def ids(kind, labels):
+    """int32 IDs of the strings in 'labels' (see StringDictionary.ids)."""
+    return dictionary(kind).ids(labels)
+
+def labels(kind, ids):
+    """Strings of the IDs in 'ids'."""
+    return dictionary(kind).take(ids)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+import analysis as an
+import run_cache
+from conftest import column_names
+
+def is_text(metric):
+    return an.AGGREGATION_STRATEGIES[metric]['agg_func'] is an.aggregate_unique_strings
+
+def to_dense(frame):
+    return pd.DataFrame({col: frame[col].sparse.to_dense() if isinstance(frame[col].dtype, pd.SparseDtype) else frame[col]
+                         for col in frame.columns}, index=frame.index)
+
+@pytest.mark.parametrize("metric", list(an.AGGREGATION_STRATEGIES))
+def test_sparse_table_matches_dense_table(group_files, metric):
+    names = column_names(group_files)
+    dense = an.process_tsv_files(group_files, names, 'Peptide', metric, sparse=False)
+    sparse = an.process_tsv_files(group_files, names, 'Peptide', metric, sparse=True)
+    assert all(isinstance(sparse[name].dtype, pd.SparseDtype) for name in names)
+    pd.testing.assert_frame_equal(to_dense(sparse), dense)
+
+@pytest.mark.parametrize("metric", list(an.AGGREGATION_STRATEGIES))
+def test_table_matches_single_file_aggregation(group_files, metric):
+    names = column_names(group_files)
+    table = an.process_tsv_files(group_files, names, 'Peptide', metric)
+    for path, name in zip(group_files, names):
+        expected = an.process_single_tsv(path, 'Peptide', metric)[name]
+        actual = table.loc[expected.index.astype(str), name]
+        if is_text(metric):
+            assert actual.tolist() == expected.tolist()
+        else:
+            np.testing.assert_allclose(actual.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64), rtol=1e-5)
+        # The peptides missing from the run are empty cells
+        missing = table.index.difference(expected.index.astype(str))
+        assert (table.loc[missing, name] == ("" if is_text(metric) else 0)).all()
+
+@pytest.mark.parametrize("use_store", [False, True])
+def test_incremental_group_matches_full_group(group_files, tmp_path, monkeypatch, use_store):
+    if use_store:
+        monkeypatch.setattr(run_cache, 'CACHE_DIR', str(tmp_path))
+    names = column_names(group_files)
+    an.process_tsv_files(group_files[:4], names[:4], 'Peptide', 'Total Intensity')
+    # Two runs dropped and one added
+    for metric in an.AGGREGATION_STRATEGIES:
+        incremental = an.process_tsv_files(group_files[2:], names[2:], 'Peptide', metric)
+        an.clear_group_cache()
+        full = an.process_tsv_files(group_files[2:], names[2:], 'Peptide', metric)
+        pd.testing.assert_frame_equal(incremental, full, check_exact=True)
+        an.process_tsv_files(group_files[:4], names[:4], 'Peptide', 'Total Intensity')
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from correlation import CorrelationStats
+from sparse_matrix import SparseMatrix
+
+def random_matrix(rows=400, runs=7, density=0.4, seed=1):
+    """A SparseMatrix of lognormal intensities and the same values as a dense frame (0: missing)."""
+    rng = np.random.default_rng(seed)
+    observed = rng.random((rows, runs)) < density
+    values = np.where(observed, rng.lognormal(10, 2, size=(rows, runs)), 0).astype(np.float32)
+    cells = np.nonzero(values)
+    matrix = SparseMatrix.from_coo(cells[0], cells[1], values[cells], pd.RangeIndex(rows), [f"run{j}" for j in range(runs)])
+    return matrix, pd.DataFrame(values, columns=matrix.columns)
+
+def test_correlation_matches_pandas():
+    matrix, dense = random_matrix()
+    stats = CorrelationStats()
+    stats.update(matrix, matrix.columns)
+    positions = [0, 2, 3, 5]
+    selected = dense.iloc[:, positions]
+    selected = selected[(selected > 0).any(axis=1)]
+    pd.testing.assert_frame_equal(stats.corr(positions, matrix.count_rows(positions), columns=list(selected.columns)),
+                                  selected.corr(), rtol=1e-9)
+    logs = np.log2(dense.astype(np.float64).where(dense > 0)).iloc[:, positions]
+    pd.testing.assert_frame_equal(stats.log_corr(positions, min_overlap=3, columns=list(logs.columns)),
+                                  logs.corr(min_periods=3), rtol=1e-9)
+
+def test_incremental_correlation_matches_full():
+    matrix, _ = random_matrix()
+    keys = list(matrix.columns)
+    incremental = CorrelationStats()
+    # Runs added, dropped and added again
+    for positions in [[0, 1, 2, 6], [1, 3, 4, 5, 6], list(range(len(keys)))]:
+        incremental.update(matrix.select_columns(positions, drop_empty_rows=False), [keys[j] for j in positions])
+    full = CorrelationStats()
+    full.update(matrix, keys)
+    positions = range(len(keys))
+    pd.testing.assert_frame_equal(incremental.corr(positions, matrix.count_rows(positions)),
+                                  full.corr(positions, matrix.count_rows(positions)), rtol=1e-9)
+    pd.testing.assert_frame_equal(incremental.log_corr(positions), full.log_corr(positions), rtol=1e-9)
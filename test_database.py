@@ -0,0 +1,22 @@
+import os
+import database as db
+from conftest import write_group
+
+def test_runs_come_from_the_index_until_it_is_synced(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DATA_DIR', None)
+    db.set_data_dir(str(tmp_path))
+    db.initialize_database()
+    db.add_client("G")
+    files = write_group(os.path.join(db.DATA_DIR, "G"), runs=3, seed=2)
+    assert db.get_client_runs("G") == [] # Written outside the application, not indexed yet
+
+    db.sync_index()
+    runs = db.get_client_runs("G")
+    assert [run['path'] for run in runs] == sorted(files)
+    assert all(run['hash'] is None and run['columns'][0] == 'peptide' for run in runs) # Only the header is read
+    assert [run['acquisition_date'].isoformat() for run in runs] == ['2024-01-01', '2024-01-02', '2024-01-03']
+
+    os.remove(files[0])
+    assert len(db.get_client_runs("G")) == 3
+    db.sync_index("G")
+    assert [run['path'] for run in db.get_client_runs("G")] == sorted(files)[1:]
@@ -0,0 +1,64 @@
+import os
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import analysis as an
+import group_store
+import run_cache
+from conftest import column_names, write_group
+
+def test_store_group_matches_in_memory_group(group_files, tmp_path, monkeypatch):
+    names = column_names(group_files)
+    in_memory = {metric: an.process_tsv_files(group_files, names, 'Peptide', metric) for metric in an.AGGREGATION_STRATEGIES}
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', str(tmp_path))
+    for _ in range(2): # Parsing the files into the store, then reading it back
+        an.clear_group_cache()
+        for metric, expected in in_memory.items():
+            pd.testing.assert_frame_equal(an.process_tsv_files(group_files, names, 'Peptide', metric), expected, check_exact=True)
+
+def test_store_is_read_back_after_a_restart(group_files, tmp_path, monkeypatch):
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', str(tmp_path))
+    an.process_tsv_files(group_files, column_names(group_files), 'Peptide', 'Count')
+    path = group_store.store_path(str(tmp_path), os.path.dirname(group_files[0]), 'Peptide')
+    store = group_store.GroupStore(path) # A new process opening the same store
+    assert store.missing([run_cache.file_signature(f) for f in group_files]) == []
+
+def test_modified_and_deleted_files_are_dropped_from_the_store(tmp_path, monkeypatch):
+    for folder in ["group", "other"]:
+        (tmp_path / folder).mkdir()
+    files = write_group(str(tmp_path / "group"), runs=4, seed=5)
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', str(tmp_path / "cache"))
+    an.process_tsv_files(files, column_names(files), 'Peptide', 'Count')
+
+    # One file is replaced by another run and one is deleted
+    replacement = write_group(str(tmp_path / "other"), runs=1, peptides=50, seed=9)[0]
+    shutil.copy(replacement, files[1])
+    os.remove(files[3])
+    files = files[:3]
+    stored = {metric: an.process_tsv_files(files, column_names(files), 'Peptide', metric) for metric in an.AGGREGATION_STRATEGIES}
+
+    store = group_store.open_store(run_cache.CACHE_DIR, os.path.dirname(files[0]), 'Peptide')
+    assert sorted(store.runs) == sorted(run_cache.file_signature(f) for f in files)
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', None)
+    for metric, table in stored.items():
+        pd.testing.assert_frame_equal(table, an.process_tsv_files(files, column_names(files), 'Peptide', metric), check_exact=True)
+
+def _fill_store(cache_dir, files):
+    run_cache.CACHE_DIR = cache_dir
+    an.process_tsv_files(files, column_names(files), 'Peptide', 'Count')
+
+def test_processes_sharing_a_store_keep_every_run(tmp_path, monkeypatch):
+    (tmp_path / "group").mkdir()
+    files = write_group(str(tmp_path / "group"), runs=8, peptides=100, seed=4)
+    cache_dir = str(tmp_path / "cache")
+    subsets = [files[:5], files[3:], files[::2], files[1::2]]
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context('spawn')) as executor:
+        list(executor.map(_fill_store, [cache_dir] * len(subsets), subsets))
+
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', cache_dir)
+    store = group_store.GroupStore(group_store.store_path(cache_dir, os.path.dirname(files[0]), 'Peptide'))
+    assert store.missing([run_cache.file_signature(f) for f in files]) == []
+    stored = an.process_tsv_files(files, column_names(files), 'Peptide', 'Total Intensity')
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', None)
+    pd.testing.assert_frame_equal(stored, an.process_tsv_files(files, column_names(files), 'Peptide', 'Total Intensity'), check_exact=True)
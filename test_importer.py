@@ -0,0 +1,31 @@
+import os
+import json
+import database as db
+import importer
+from conftest import write_group
+
+def write_export(root, files, sample):
+    """Writes one run folder per file, all with the same sample folder name and date."""
+    for i, path in enumerate(files):
+        folder = root / f"batch{i}" / sample / "Results"
+        folder.mkdir(parents=True)
+        (folder / "lfq.tsv").write_bytes(open(path, 'rb').read())
+        (folder / "payload.json").write_text(json.dumps({
+            'instrument_info': str({'model': 'M'}), 'thermo_creation_datetime': '4/15/2025 10:20:04 PM'}))
+
+def test_runs_with_the_same_destination_name_are_renamed(tmp_path, monkeypatch):
+    (tmp_path / "runs").mkdir()
+    files = write_group(str(tmp_path / "runs"), runs=3, seed=7)
+    write_export(tmp_path / "export", files, "S0")
+    monkeypatch.setattr(db, 'DATA_DIR', None)
+    db.set_data_dir(str(tmp_path / "data"))
+    db.initialize_database()
+
+    for _ in range(2): # The second import finds every run in the manifest
+        importer.import_machine_data(str(tmp_path / "export"), max_workers=2)
+        group = os.path.join(db.DATA_DIR, 'M')
+        assert sorted(os.listdir(group)) == ['2025-04-15_S0.tsv', '2025-04-15_S0_2.tsv', '2025-04-15_S0_3.tsv']
+        copies = sorted(open(os.path.join(group, name), 'rb').read() for name in os.listdir(group))
+        assert copies == sorted(open(path, 'rb').read() for path in files)
+        destinations = [entry['destination'] for entry in importer.load_manifest().values()]
+        assert len(set(destinations)) == 3
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+import analysis as an
+import protein_rollup as pr
+import run_cache
+from conftest import column_names
+
+def reference_rollup(files, policy):
+    """Protein x run intensities computed with plain pandas, one peptide at a time."""
+    runs, lists = {}, {}
+    for path in files:
+        df = pd.read_csv(path, sep='\t')
+        df = df[df['proteins'].notna() & (df.iloc[:, -1] > 0)]
+        runs[column_names([path])[0]] = df.groupby('peptide')[df.columns[-1]].sum()
+        for peptide, proteins in df.groupby('peptide', sort=False)['proteins'].first().items():
+            lists.setdefault(peptide, proteins) # The first run where the peptide appears
+    peptides = pd.DataFrame(runs).fillna(0)
+
+    accessions = {peptide: list(dict.fromkeys(proteins.split(';'))) for peptide, proteins in lists.items()}
+    evidence = pd.Series([a for listed in accessions.values() for a in listed]).value_counts()
+    weights = []
+    for peptide, listed in accessions.items():
+        if policy == 'first':
+            weights.append((peptide, listed[0], 1.0))
+        elif policy == 'unique':
+            if len(listed) == 1:
+                weights.append((peptide, listed[0], 1.0))
+        elif policy == 'split':
+            weights.extend((peptide, accession, 1.0 / len(listed)) for accession in listed)
+        else: # razor: most peptides, ties to the first listed
+            best = max(listed, key=lambda accession: (evidence[accession], -listed.index(accession)))
+            weights.append((peptide, best, 1.0))
+    weights = pd.DataFrame(weights, columns=['peptide', 'protein', 'weight'])
+    contributions = peptides.loc[weights['peptide']].mul(weights['weight'].to_numpy(), axis=0)
+    result = contributions.groupby(weights['protein'].to_numpy()).sum().sort_index()
+    return result[(result > 0).any(axis=1)]
+
+@pytest.mark.parametrize("use_store", [False, True])
+@pytest.mark.parametrize("policy", pr.POLICIES)
+def test_rollup_matches_pandas_reference(group_files, tmp_path, monkeypatch, policy, use_store):
+    if use_store:
+        monkeypatch.setattr(run_cache, 'CACHE_DIR', str(tmp_path))
+    matrix = an.get_protein_intensity_matrix(group_files, policy=policy)
+    expected = reference_rollup(group_files, policy)
+    assert list(matrix.index) == list(expected.index)
+    assert list(matrix.columns) == list(expected.columns)
+    np.testing.assert_allclose(matrix.to_numpy(dtype=np.float64), expected.to_numpy(), rtol=1e-5)
+
+def test_rollup_rejects_unknown_policy(group_files):
+    with pytest.raises(ValueError):
+        an.get_protein_intensity_matrix(group_files, policy='best')
+
+def write_tsv(path, rows):
+    pd.DataFrame(rows, columns=['peptide', 'charge', 'proteins', 'score', 'intensity']).to_csv(path, sep='\t', index=False)
+    return str(path)
+
+@pytest.mark.parametrize("use_store", [False, True])
+def test_proteins_come_from_the_first_row_and_run(tmp_path, monkeypatch, use_store):
+    if use_store:
+        monkeypatch.setattr(run_cache, 'CACHE_DIR', str(tmp_path / "cache"))
+    files = [
+        write_tsv(tmp_path / "20240101_a.tsv", [('PEPA', 2, 'P1', 0.5, 10.0), ('PEPB', 2, 'P2;P3', 0.5, 5.0),
+                                                ('PEPA', 3, 'P2', 0.5, 20.0), ('PEPA', 4, 'P3', 0.5, 1.0)]),
+        write_tsv(tmp_path / "20240102_b.tsv", [('PEPB', 2, 'P3', 0.5, 7.0), ('PEPA', 2, 'P3', 0.5, 2.0),
+                                                ('PEPC', 2, 'P4', 0.5, 0.0), ('PEPC', 3, 'P5', 0.5, 3.0)]),
+    ]
+    matrix = an.get_protein_intensity_matrix(files, policy='first')
+    expected = pd.DataFrame({'20240101_a': [31.0, 5.0, 0.0], '20240102_b': [2.0, 7.0, 3.0]},
+                            index=['P1', 'P2', 'P5'])
+    pd.testing.assert_frame_equal(matrix, expected, check_dtype=False, check_index_type=False)
+
+def test_sum_by_peptide_keeps_positive_sums_and_first_protein_list():
+    peptides = np.array([2, 0, 2, -1, 1, 0, 3], dtype=np.int32)
+    intensities = np.array([1.0, 5.0, 2.0, 9.0, np.nan, 1.5, 4.0])
+    proteins = np.array([7, 4, 8, 1, 2, 5, -1], dtype=np.int32)
+    found, sums, lists = pr.sum_by_peptide(peptides, intensities, proteins, size=5)
+    assert found.tolist() == [0, 2] # Peptide 1 has no positive intensity, 3 no protein list
+    assert sums.dtype == np.float32 and sums.tolist() == [6.5, 3.0]
+    assert lists.tolist() == [4, 7]
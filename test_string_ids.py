@@ -0,0 +1,18 @@
+import string_ids
+import run_cache
+
+def test_ids_are_shared_and_persisted(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', str(tmp_path))
+    ids = string_ids.ids('peptides', ['PEPA', 'PEPB', None, 'PEPA'])
+    assert ids.tolist() == [0, 1, -1, 0]
+    assert string_ids.labels('peptides', ids[:2]).tolist() == ['PEPA', 'PEPB']
+    # Another process (a new dictionary on the same file) sees the same IDs and appends after them
+    other = string_ids.StringDictionary(str(tmp_path / "strings" / "peptides.txt"))
+    assert other.ids(['PEPB', 'PEPC']).tolist() == [1, 2]
+    assert string_ids.ids('peptides', ['PEPD', 'PEPC']).tolist() == [3, 2]
+
+def test_ids_live_in_memory_without_a_cache_folder(monkeypatch):
+    monkeypatch.setattr(run_cache, 'CACHE_DIR', None)
+    ids = string_ids.ids('proteins', ['sp|P1|A;sp|P2|B', 'sp|P1|A;sp|P2|B'])
+    assert ids[0] == ids[1]
+    assert string_ids.labels('proteins', ids[:1]).tolist() == ['sp|P1|A;sp|P2|B']
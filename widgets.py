@@ -0,0 +1,330 @@
+import os
+import customtkinter
+from tkinter import ttk
+import numpy as np
+import pandas as pd
+from sparse_matrix import frame_arrays, take_rows
+import instrumentation
+
+class ProgressPanel(customtkinter.CTkFrame):
+    """
+    Small panel with a label, a per-file progress bar and a Cancel button.
+    It stays hidden until start() is called and hides itself again on stop().
+    """
+    def __init__(self, master, layout, **kwargs):
+        """'layout' is a function that places the panel, e.g. lambda w: w.pack(fill="x")."""
+        super().__init__(master, **kwargs)
+        self._layout = layout
+        self._cancel_command = None
+        self.task = None # Background task whose progress is currently shown
+
+        self.label = customtkinter.CTkLabel(self, text="", anchor="w")
+        self.label.pack(side="left", padx=(10, 5))
+
+        self.cancel_button = customtkinter.CTkButton(self, text="Cancel", width=80, command=self._cancel)
+        self.cancel_button.pack(side="right", padx=(5, 10), pady=5)
+
+        self.progress_bar = customtkinter.CTkProgressBar(self)
+        self.progress_bar.pack(side="left", fill="x", expand=True, padx=5)
+        self.progress_bar.set(0)
+
+    def start(self, text, cancel_command=None):
+        """Shows the panel. cancel_command is called when the user presses Cancel."""
+        self._cancel_command = cancel_command
+        self.label.configure(text=text)
+        self.progress_bar.set(0)
+        self.cancel_button.configure(state="normal" if cancel_command else "disabled")
+        if not self.winfo_manager():
+            self._layout(self)
+
+    def update_progress(self, done, total, text=None):
+        """Updates the bar with the number of files processed so far."""
+        self.progress_bar.set(done / total if total else 0)
+        self.label.configure(text=text or f"Processing file {done} of {total}...")
+
+    def stop(self):
+        """Hides the panel."""
+        self._cancel_command = None
+        manager = self.winfo_manager()
+        if manager == 'pack':
+            self.pack_forget()
+        elif manager == 'grid':
+            self.grid_forget()
+
+    def _cancel(self):
+        if self._cancel_command:
+            self.label.configure(text="Cancelling...")
+            self.cancel_button.configure(state="disabled")
+            self._cancel_command()
+
+class PerformanceWindow(customtkinter.CTkToplevel):
+    """
+    Timings of the last operations (see instrumentation): every operation is broken down
+    by stage and by file. Files much slower than the median of their stage are flagged.
+    """
+    SLOWEST_FILES = 20     # Files listed per operation
+    OUTLIER_FACTOR = 3     # A file is an outlier if it takes this many times the median
+
+    def __init__(self, master, log_path=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.title("Performance")
+        self.geometry("900x500")
+
+        top_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        top_frame.pack(fill="x", padx=10, pady=(10, 5))
+        self.refresh_button = customtkinter.CTkButton(top_frame, text="Refresh", width=80, command=self.refresh)
+        self.refresh_button.pack(side="left")
+        log_text = f"Log: {log_path}" if log_path else "Log: disabled"
+        customtkinter.CTkLabel(top_frame, text=log_text, anchor="w").pack(side="left", padx=10)
+
+        table_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        table_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        columns = ('seconds', 'share', 'peak', 'details')
+        self.tree = ttk.Treeview(table_frame, columns=columns)
+        self.tree.heading('#0', text="Operation / stage / file")
+        self.tree.column('#0', width=320)
+        for column, text, width in zip(columns, ("Seconds", "%", "Peak MB", "Details"), (80, 60, 80, 340)):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=width, anchor='w' if column == 'details' else 'e')
+        self.tree.tag_configure('outlier', foreground='red')
+        self.tree.tag_configure('failed', foreground='red')
+        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        vsb.pack(side="right", fill="y")
+
+        self.refresh()
+
+    @staticmethod
+    def _format_fields(fields):
+        return ", ".join(f"{key}={value}" for key, value in fields.items() if value is not None)
+
+    @staticmethod
+    def _format_mb(value):
+        return f"{value:,.0f}" if value is not None else ""
+
+    def refresh(self):
+        """Shows the operations finished so far, newest first."""
+        self.tree.delete(*self.tree.get_children())
+        for i, op in enumerate(instrumentation.recent_operations()):
+            self._insert_operation(op, expand=(i == 0))
+
+    def _insert_operation(self, op, expand=False):
+        total = op.seconds or 0
+        details = self._format_fields(op.fields)
+        if op.status != 'ok':
+            details = f"[{op.status}] {details}"
+        node = self.tree.insert('', 'end', open=expand, tags=() if op.status == 'ok' else ('failed',),
+                                text=f"{op.started:%H:%M:%S}  {op.name}",
+                                values=(f"{total:.2f}", "100", self._format_mb(op.peak_rss), details))
+
+        # Stages in start order, nested under the enclosing stage
+        parents = {0: node}
+        for span in sorted(op.spans, key=lambda span: span['offset']):
+            parent = parents.get(span['depth'], node)
+            share = 100 * span['seconds'] / total if total else 0
+            parents[span['depth'] + 1] = self.tree.insert(
+                parent, 'end', open=True, text=span['name'],
+                values=(f"{span['seconds']:.3f}", f"{share:.0f}", self._format_mb(span['peak_rss']),
+                        self._format_fields(span['fields'])))
+
+        if not op.files:
+            return
+        seconds = np.array([f['seconds'] for f in op.files])
+        median = float(np.median(seconds))
+        outliers = int((seconds > self.OUTLIER_FACTOR * median).sum()) if median > 0 else 0
+        files_node = self.tree.insert(
+            node, 'end', text=f"Files ({len(op.files)})",
+            values=(f"{seconds.sum():.3f}", "", "", f"median {median:.3f} s, {outliers} outliers"))
+        for i in np.argsort(-seconds, kind='stable')[:self.SLOWEST_FILES]:
+            f = op.files[i]
+            is_outlier = median > 0 and f['seconds'] > self.OUTLIER_FACTOR * median
+            ratio = f"{f['seconds'] / median:.1f}x median" if median > 0 else ""
+            self.tree.insert(files_node, 'end', text=os.path.basename(f['file']),
+                             tags=('outlier',) if is_outlier else (),
+                             values=(f"{f['seconds']:.3f}", "", "", f"{f['stage'] or ''}  {ratio}".strip()))
+
+class DataFrameTable(customtkinter.CTkFrame):
+    """
+    Virtual table view of a DataFrame (index shown as the first column).
+
+    Only the rows that fit in the visible window are inserted in the ttk.Treeview;
+    scrolling fills the widget again from the DataFrame. Sorting and searching work
+    on the DataFrame, so their cost does not depend on the number of widget items.
+    Sparse columns (see SparseMatrix.to_frame) are supported.
+    """
+    HEADER_HEIGHT = 25 # Approximate height of the Treeview headings, in pixels
+
+    def __init__(self, master, dataframe, column_width=100, **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.dataframe = dataframe
+        self._arrays = frame_arrays(dataframe) # Index and columns, read on every render
+        self.columns = [str(dataframe.index.name or '')] + [str(col) for col in dataframe.columns]
+
+        self._order = np.arange(len(dataframe)) # Row positions of the DataFrame in display order
+        self._offset = 0                        # First displayed position
+        self._visible_rows = 1
+        self._selected = None                   # Selected display position
+        self._sort_column = None
+        self._sort_ascending = True
+        self._index_text = None                 # Lower-case index, built on the first search
+
+        # --- Search bar ---
+        search_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        search_frame.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 5))
+        self.search_entry = customtkinter.CTkEntry(search_frame, placeholder_text=f"Find {self.columns[0] or 'row'}...", width=250)
+        self.search_entry.pack(side="left")
+        self.search_entry.bind("<Return>", lambda event: self.find_next())
+        self.find_button = customtkinter.CTkButton(search_frame, text="Find", width=60, command=self.find_next)
+        self.find_button.pack(side="left", padx=5)
+        self.status_label = customtkinter.CTkLabel(search_frame, text=f"{len(dataframe)} rows")
+        self.status_label.pack(side="right", padx=5)
+
+        # --- Table ---
+        column_ids = [f"c{i}" for i in range(len(self.columns))]
+        self.tree = ttk.Treeview(self, columns=column_ids, show='headings', selectmode='browse')
+        for i, (column_id, col) in enumerate(zip(column_ids, self.columns)):
+            self.tree.heading(column_id, text=col, command=lambda i=i: self.sort_by(i))
+            self.tree.column(column_id, width=column_width) # Initial width
+
+        # The vertical scrollbar moves over the DataFrame rows, not over the widget items
+        self.vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        hsb = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=hsb.set)
+
+        self.tree.grid(row=1, column=0, sticky='nsew')
+        self.vsb.grid(row=1, column=1, sticky='ns')
+        hsb.grid(row=2, column=0, sticky='ew')
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_to(self._offset - (3 if event.delta > 0 else -3)))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self._offset - 3)) # Linux
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self._offset + 3))
+        self.tree.bind("<Up>", lambda event: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda event: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda event: self._move_selection(-self._visible_rows))
+        self.tree.bind("<Next>", lambda event: self._move_selection(self._visible_rows))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+        self._render()
+
+    def _row_height(self):
+        try:
+            return int(ttk.Style().lookup("Treeview", "rowheight")) or 20
+        except (ValueError, TypeError):
+            return 20
+
+    def _on_resize(self, event):
+        visible_rows = max(1, (event.height - self.HEADER_HEIGHT) // self._row_height())
+        if visible_rows != self._visible_rows:
+            self._visible_rows = visible_rows
+            self.scroll_to(self._offset)
+
+    def _on_scrollbar(self, *args):
+        total = len(self._order)
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * total))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            self.scroll_to(self._offset + (step * self._visible_rows if args[2] == 'pages' else step))
+
+    def scroll_to(self, offset):
+        """Shows the rows starting at the given display position."""
+        max_offset = max(0, len(self._order) - self._visible_rows)
+        self._offset = min(max(0, offset), max_offset)
+        self._render()
+        return "break"
+
+    def _render(self):
+        """Fills the widget with the visible window of rows."""
+        self.tree.delete(*self.tree.get_children())
+        start = self._offset
+        positions = self._order[start:start + self._visible_rows]
+        for display_pos, row in enumerate(take_rows(self._arrays, positions), start=start):
+            self.tree.insert("", "end", iid=str(display_pos), values=list(row))
+
+        if self._selected is not None and start <= self._selected < start + len(positions):
+            self.tree.selection_set(str(self._selected))
+
+        total = len(self._order)
+        if total:
+            self.vsb.set(start / total, min(1.0, (start + self._visible_rows) / total))
+        else:
+            self.vsb.set(0, 1)
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self._selected = int(selection[0])
+
+    def _move_selection(self, delta):
+        if not len(self._order):
+            return "break"
+        current = self._selected if self._selected is not None else self._offset
+        self.select_position(min(max(0, current + delta), len(self._order) - 1), center=False)
+        return "break"
+
+    def select_position(self, display_pos, center=True):
+        """Selects a display position, scrolling so that it is visible."""
+        self._selected = display_pos
+        if center:
+            self.scroll_to(display_pos - self._visible_rows // 2)
+        elif display_pos < self._offset:
+            self.scroll_to(display_pos)
+        elif display_pos >= self._offset + self._visible_rows:
+            self.scroll_to(display_pos - self._visible_rows + 1)
+        else:
+            self._render()
+        self.tree.focus(str(display_pos))
+
+    def sort_by(self, column_index):
+        """Sorts the rows by a column (0 is the index). Clicking the same column again reverses the order."""
+        if self._sort_column == column_index:
+            self._sort_ascending = not self._sort_ascending
+        else:
+            self._sort_column = column_index
+            self._sort_ascending = True
+
+        if column_index == 0:
+            values = pd.Series(self.dataframe.index)
+        else:
+            values = self.dataframe.iloc[:, column_index - 1].reset_index(drop=True)
+        selected_row = self._order[self._selected] if self._selected is not None else None
+        self._order = values.sort_values(ascending=self._sort_ascending, kind='stable').index.to_numpy()
+
+        # Show the sort direction in the headings
+        arrow = " ▲" if self._sort_ascending else " ▼"
+        for i, col in enumerate(self.columns):
+            self.tree.heading(f"c{i}", text=col + (arrow if i == column_index else ""))
+
+        if selected_row is not None:
+            self.select_position(int(np.flatnonzero(self._order == selected_row)[0]))
+        else:
+            self.scroll_to(0)
+
+    def find_next(self):
+        """Jumps to the next row whose index contains the search text (case-insensitive)."""
+        text = self.search_entry.get().strip().lower()
+        if not text:
+            return
+        if self._index_text is None:
+            self._index_text = pd.Series(self.dataframe.index.astype(str)).str.lower()
+
+        matches = np.flatnonzero(self._index_text.str.contains(text, regex=False).to_numpy())
+        if not len(matches):
+            self.status_label.configure(text=f"'{text}' not found")
+            return
+
+        # Display positions of the matching rows, in display order
+        display_positions = np.empty(len(self._order), dtype=np.int64)
+        display_positions[self._order] = np.arange(len(self._order))
+        match_positions = np.sort(display_positions[matches])
+
+        current = self._selected if self._selected is not None else -1
+        following = match_positions[match_positions > current]
+        target = int(following[0]) if len(following) else int(match_positions[0]) # Wrap around
+        match_number = int(np.searchsorted(match_positions, target)) + 1
+        self.status_label.configure(text=f"Match {match_number} of {len(match_positions)}")
+        self.select_position(target)